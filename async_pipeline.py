@@ -0,0 +1,521 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Tue Oct 20 11:15:38 2026
+
+Asyncio batch pipeline which overlaps reading, measuring and writing:
+    0) optionally the landmarks of all scans are checked first (see
+       landmark_checks), hips which fail are rejected before any image is
+       decoded.
+    1) read stage: points files are read and images decoded in a thread pool
+       and placed in shared memory. A bounded prefetch queue limits the
+       number of decoded images waiting for a worker, each reader can hold
+       one more decoded image while the queue is full.
+    2) compute stage: the hips are measured in a process pool, the workers
+       receive a shared memory handle instead of the pixel array. Optionally
+       each hip gets a time and memory limit (see hip_watchdog).
+    3) write stage: records are written to the results store and plots are
+       moved from a local scratch folder to the output folder. Optionally the
+       cohort statistics and QC flags are updated (see cohort_stats).
+
+@author: Fleur Boel, f.boel@erasmusmc.nl
+"""
+
+import os
+import shutil
+import asyncio
+import importlib
+import multiprocessing
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+import instrumentation
+from load_files import load_image, load_full_body_points
+from lazy_imports import headless_backend
+from shared_images import share_image, release_image, detach_all
+from measure_hip import scan_hrlp, measure_hip_record
+from results_store import ResultsStore
+from incremental import hip_fingerprint, pts_paths
+from cohort_stats import CohortStats, store_stats
+from landmark_checks import prefilter_cohort
+from scan_scheduler import estimate_footprint, interleave_by_size, MemoryBudget
+from hip_watchdog import WatchdogExecutor, HipTimeoutError, HipMemoryError
+
+
+def read_scan(name, folder_img, folder_pts, load_images=True, model=None, options=None):
+    """
+    This function reads the points files of both hips and decodes the image.
+    The image is placed in shared memory. If the landmark model is given, the
+    fingerprints of the points files are determined (see incremental).
+
+    Parameters
+    ----------
+    name : str
+        Name of the image.
+    folder_img : WindowsPath
+        Folder containing the images.
+    folder_pts : WindowsPath
+        Folder containing the points files.
+    load_images : boolean, optional
+        Indicates whether the image is loaded. The default is True.
+    model : LandmarkModel, optional
+        The landmark model of the points. The default is None.
+    options : dict, optional
+        The measurement options passed to measure_hip, which are part of the
+        fingerprints. The default is None.
+
+    Returns
+    -------
+    job : dict
+        Dictionary with the image name, the points of both hips, the handle
+        of the shared image (None if no image is loaded) and the fingerprints
+        of the points files per hip side (empty if no model is given). If a
+        points file is missing, the points are empty lists.
+
+    """
+    pts_data_L, pts_data_R = load_full_body_points(name, Path(folder_pts))
+    job = {'name': name, 'pts_data_L': pts_data_L, 'pts_data_R': pts_data_R,
+           'img': None, 'fingerprints': {}}
+    if model is not None and len(pts_data_L) > 0 and len(pts_data_R) > 0:
+        pts = {'R': pts_data_L, 'L': pts_data_R}
+        job['fingerprints'] = {side: hip_fingerprint(path, pts[side], model, options)
+                               for side, path in pts_paths(name, folder_pts).items()}
+    if load_images is True and len(pts_data_L) > 0 and len(pts_data_R) > 0:
+        img, spacing = load_image(str(Path(folder_img) / name))
+        job['img'] = share_image(img, spacing)
+    return job
+
+
+def compute_hip(pts, hip_side_right, img, name, model, angle_HRLP,
+                outputfolder=None, options=None):
+    """
+    This function runs the measurements of a single hip in a worker process.
+
+    Parameters
+    ----------
+    pts : array of float
+        The x- and y-coordinates of all the landmark points of the hip, 2D array.
+    hip_side_right : boolean
+        Indicates the hip side, True for the right hip.
+    img : dict
+        Handle of the shared image, None if no image is loaded.
+    name : str
+        Name of the image.
+    model : LandmarkModel
+        The landmark model of the points.
+    angle_HRLP : float
+        The angle of the horizontal reference line of the pelvis in degrees.
+    outputfolder : WindowsPath, optional
+        Folder where the plots are saved. The default is None.
+    options : dict, optional
+        Further keyword arguments passed to measure_hip. The default is None.
+
+    Returns
+    -------
+    record : dict
+        Result record of the hip.
+    stats : dict
+        Instrumentation statistics of this task, empty if the
+        instrumentation is switched off.
+
+    """
+    if options is None:
+        options = {}
+    instrumentation.reset_stats()
+    try:
+        record = measure_hip_record(pts, model, hip_side_right, img, name, angle_HRLP,
+                                    outputfolder=outputfolder, **options)
+    finally:
+        detach_all()
+    return record, instrumentation.get_stats()
+
+
+def make_executor(n_workers=None, hip_timeout=None, hip_memory_limit=None):
+    """
+    This function creates the process pool in which the hips are measured.
+
+    Parameters
+    ----------
+    n_workers : int, optional
+        Number of worker processes. The default is None (number of CPUs).
+    hip_timeout : float, optional
+        Wall-clock limit per hip in seconds, see WatchdogExecutor. The default
+        is None (no limit).
+    hip_memory_limit : int, optional
+        Limit of the resident memory of a worker in bytes, see
+        WatchdogExecutor. The default is None (no limit).
+
+    Returns
+    -------
+    executor : Executor
+        A WatchdogExecutor if a limit is set, otherwise a ProcessPoolExecutor.
+
+    """
+    if hip_timeout is not None or hip_memory_limit is not None:
+        return WatchdogExecutor(n_workers, hip_timeout, hip_memory_limit)
+    # Worker processes are spawned, forking while the reader threads import
+    # or decode can deadlock the workers
+    return ProcessPoolExecutor(max_workers=n_workers,
+                               mp_context=multiprocessing.get_context('spawn'))
+
+
+# Heavy modules imported by warm_worker
+WARM_MODULES = ['scipy.interpolate', 'scipy.linalg', 'pydicom', 'skimage.filters',
+                'skimage.morphology', 'matplotlib.pyplot']
+
+
+def warm_worker():
+    """
+    This function imports the heavy dependencies in a worker process, so the
+    first scan sent to the worker does not pay their import time.
+
+    Returns
+    -------
+    pid : int
+        Process id of the worker.
+
+    """
+    headless_backend()
+    for name in WARM_MODULES:
+        importlib.import_module(name)
+    return os.getpid()
+
+
+def warm_executor(executor, n_workers):
+    """
+    This function starts the worker processes of an executor and runs
+    warm_worker in them.
+
+    Parameters
+    ----------
+    executor : Executor
+        Process pool, e.g. a ProcessPoolExecutor or a WatchdogExecutor.
+    n_workers : int
+        Number of worker processes of the executor.
+
+    Returns
+    -------
+    pids : set
+        Process ids of the warmed workers.
+
+    """
+    futures = [executor.submit(warm_worker) for i in range(n_workers)]
+    return set(future.result() for future in futures)
+
+
+def _missing_records(name, reason):
+    return [{'image': name, 'side': side, 'status': 'missing', 'error': reason,
+             'measures': {}} for side in ('R', 'L')]
+
+
+def _write_records(store, records, scratch_folder, outputfolder, cohort_stats=None):
+    # Move the plots from the scratch folder to the output folder, store the
+    # records and update the cohort statistics
+    if scratch_folder is not None and outputfolder is not None:
+        for record in records:
+            figures = record['measures'].get('figures', [])
+            moved = []
+            for figure in figures:
+                target = os.path.join(outputfolder, os.path.basename(figure))
+                shutil.move(figure, target)
+                moved.append(target)
+            if figures:
+                record['measures']['figures'] = moved
+    store.put_many(records)
+    if cohort_stats is not None:
+        cohort_stats.add_records(records)
+
+
+async def run_pipeline(img_names, folder_img, folder_pts, model, store,
+                       outputfolder=None, scratch_folder=None, n_workers=None,
+                       n_readers=4, prefetch=4, write_queue=64,
+                       load_images=True, executor=None, memory_budget=None,
+                       footprint_overhead=2.0, default_footprint=None, hip_timeout=None,
+                       hip_memory_limit=None, prefilter=False, cohort_stats=None, **options):
+    """
+    This function runs the asyncio pipeline over all images.
+
+    Parameters
+    ----------
+    img_names : list
+        Names of the images. Duplicates (e.g. from read_imglist, which lists
+        every image for both points files) are measured once.
+    folder_img : WindowsPath
+        Folder containing the images.
+    folder_pts : WindowsPath
+        Folder containing the points files.
+    model : LandmarkModel
+        The landmark model of the points.
+    store : ResultsStore
+        Store to which the result records are written.
+    outputfolder : WindowsPath, optional
+        Folder where the plots are saved. The default is None, in which case
+        no plots are made.
+    scratch_folder : WindowsPath, optional
+        Local folder where the workers save the plots before the write stage
+        moves them to the outputfolder. Useful if the outputfolder is on slow
+        storage. The default is None.
+    n_workers : int, optional
+        Number of worker processes. The default is None (number of CPUs).
+    n_readers : int, optional
+        Number of concurrent reads. The default is 4.
+    prefetch : int, optional
+        Maximum number of read scans waiting for a worker. Each of the
+        n_readers readers can hold one more decoded scan while it waits for
+        a place in the queue, so at most prefetch + n_workers + n_readers
+        decoded images are in memory. The default is 4.
+    write_queue : int, optional
+        Maximum number of scans waiting to be written. The default is 64.
+    load_images : boolean, optional
+        Indicates whether the images are loaded, False for landmark-only
+        runs. The default is True.
+    executor : concurrent.futures.Executor, optional
+        Executor for the compute stage. The default is None, in which case a
+        process pool with n_workers processes is created.
+    memory_budget : int, optional
+        Memory budget in bytes for the decoded images in flight. The decoded
+        size of each scan is estimated from its header and scans are only
+        read while the budget allows it, large and small scans are
+        interleaved. The default is None, in which case only prefetch and
+        n_workers bound the number of images in memory.
+    footprint_overhead : float, optional
+        Factor applied to the estimated size of each scan, see MemoryBudget.
+        The default is 2.
+    default_footprint : int, optional
+        Decoded size in bytes assumed for scans of which the header cannot be
+        read. The default is None, in which case the largest estimated size
+        of the other scans is used, or the whole memory budget if no size
+        could be estimated.
+    hip_timeout : float, optional
+        Wall-clock limit per hip in seconds. A hip exceeding the limit is
+        recorded with the status 'timeout' and its worker is replaced. The
+        default is None (no limit).
+    hip_memory_limit : int, optional
+        Limit of the resident memory of a worker in bytes. A hip exceeding the
+        limit is recorded with the status 'memory' and its worker is
+        replaced. The default is None (no limit).
+    prefilter : boolean, optional
+        Indicates whether the landmarks of all scans are checked before the
+        images are read (see landmark_checks). Rejected hips are stored with
+        the status 'rejected', scans of which both hips are rejected are not
+        read. The default is False.
+    cohort_stats : CohortStats, optional
+        Statistics which are updated with the records as they are written,
+        see cohort_stats. The default is None.
+    **options
+        Further keyword arguments passed to measure_hip.
+
+    Returns
+    -------
+    n_scans : int
+        Number of processed scans.
+
+    """
+    loop = asyncio.get_running_loop()
+    if n_workers is None:
+        n_workers = os.cpu_count() or 1
+    plot_folder = scratch_folder if scratch_folder is not None else outputfolder
+    if plot_folder is not None:
+        os.makedirs(plot_folder, exist_ok=True)
+    if outputfolder is not None:
+        os.makedirs(outputfolder, exist_ok=True)
+
+    names = list(dict.fromkeys(img_names))
+    read_q = asyncio.Queue(maxsize=prefetch)
+    write_q = asyncio.Queue(maxsize=write_queue)
+    io_pool = ThreadPoolExecutor(max_workers=n_readers)
+    write_pool = ThreadPoolExecutor(max_workers=1)
+    own_executor = executor is None
+    if own_executor is True:
+        executor = make_executor(n_workers, hip_timeout, hip_memory_limit)
+    n_scans = 0
+
+    # Reject hips with implausible landmarks before any image is read
+    rejected = {}
+    if prefilter is True:
+        with instrumentation.stage('landmark_checks'):
+            records = await loop.run_in_executor(io_pool, prefilter_cohort, names, folder_img,
+                                                 folder_pts, model)
+        rejected = {(record['image'], record['side']): record for record in records}
+        both = set(name for name in names if (name, 'R') in rejected and (name, 'L') in rejected)
+        if records:
+            await loop.run_in_executor(write_pool, store.put_many, records)
+        # Scans with one rejected hip are counted when they are written
+        if cohort_stats is not None:
+            cohort_stats.add_records([record for record in records if record['image'] in both])
+        names = [name for name in names if name not in both]
+
+    async def footprint(name):
+        try:
+            return await loop.run_in_executor(io_pool, estimate_footprint,
+                                              Path(folder_img) / name)
+        except Exception as e:
+            print('Size of {} could not be estimated: {!r}'.format(name, e))
+            return None
+
+    # Scans are admitted in order, or within the memory budget if one is set.
+    # Scans without estimate get a conservative size, so they cannot bypass
+    # the budget.
+    budget = None
+    if memory_budget is not None and load_images is True:
+        footprints = await asyncio.gather(*[footprint(name) for name in names])
+        fallback = default_footprint
+        if fallback is None:
+            known = [nbytes for nbytes in footprints if nbytes is not None]
+            fallback = max(known) if known else memory_budget / footprint_overhead
+        footprints = [fallback if nbytes is None else nbytes for nbytes in footprints]
+        budget = MemoryBudget(memory_budget, interleave_by_size(names, footprints),
+                              footprint_overhead)
+    names_iter = iter(names)
+
+    async def next_scan():
+        if budget is None:
+            return next(names_iter, None), 0
+        return await budget.acquire()
+
+    async def reader():
+        while True:
+            name, nbytes = await next_scan()
+            if name is None:
+                break
+            try:
+                job = await loop.run_in_executor(io_pool, read_scan, name, folder_img,
+                                                 folder_pts, load_images, model, options)
+            except Exception as e:
+                print('Reading failed for {}: {!r}'.format(name, e))
+                if budget is not None:
+                    await budget.release(nbytes)
+                await write_q.put(_missing_records(name, repr(e)))
+                continue
+            job['nbytes'] = nbytes
+            await read_q.put(job)
+
+    async def run_hip(job, hip_side_right, angle_HRLP):
+        side = 'R' if hip_side_right is True else 'L'
+        if (job['name'], side) in rejected:
+            return rejected[(job['name'], side)]
+        pts = job['pts_data_L'] if hip_side_right is True else job['pts_data_R']
+        try:
+            record, stats = await loop.run_in_executor(
+                executor, compute_hip, pts, hip_side_right, job['img'], job['name'],
+                model, angle_HRLP, plot_folder, options)
+            if stats:
+                instrumentation.merge_stats([stats], into_current=True)
+        except Exception as e:
+            if isinstance(e, HipTimeoutError):
+                status = 'timeout'
+            elif isinstance(e, HipMemoryError):
+                status = 'memory'
+            else: status = 'failed'
+            print('Measurements failed for {} ({}): {!r}'.format(job['name'], side, e))
+            record = {'image': job['name'], 'side': side, 'status': status,
+                      'error': repr(e), 'measures': {}}
+        return record
+
+    async def worker():
+        nonlocal n_scans
+        while True:
+            job = await read_q.get()
+            if job is None:
+                break
+            try:
+                if len(job['pts_data_L']) == 0 or len(job['pts_data_R']) == 0:
+                    records = _missing_records(job['name'], 'points file missing or incorrect')
+                else:
+                    # The HRLP needs both hips, the hips are measured separately
+                    angle_HRLP = scan_hrlp(job['pts_data_L'], job['pts_data_R'], model,
+                                           job['name'])
+                    records = list(await asyncio.gather(run_hip(job, True, angle_HRLP),
+                                                        run_hip(job, False, angle_HRLP)))
+                    # The fingerprints are stored with the records, so a
+                    # later incremental run can find the changed hips
+                    for record in records:
+                        record['fingerprint'] = job['fingerprints'].get(record['side'])
+            finally:
+                if job['img'] is not None:
+                    release_image(job['img'])
+                if budget is not None:
+                    await budget.release(job['nbytes'])
+            n_scans += 1
+            await write_q.put(records)
+
+    async def writer():
+        while True:
+            records = await write_q.get()
+            if records is None:
+                break
+            # Write everything that is waiting in one transaction
+            while not write_q.empty():
+                more = write_q.get_nowait()
+                if more is None:
+                    write_q.put_nowait(None)
+                    break
+                records = records + more
+            with instrumentation.stage('write_results'):
+                await loop.run_in_executor(write_pool, _write_records, store, records,
+                                           scratch_folder, outputfolder, cohort_stats)
+
+    try:
+        write_task = asyncio.create_task(writer())
+        workers = [asyncio.create_task(worker()) for i in range(n_workers)]
+        await asyncio.gather(*[reader() for i in range(n_readers)])
+        for i in range(n_workers):
+            await read_q.put(None)
+        await asyncio.gather(*workers)
+        await write_q.put(None)
+        await write_task
+    finally:
+        io_pool.shutdown()
+        write_pool.shutdown()
+        if own_executor is True:
+            executor.shutdown()
+
+    return n_scans
+
+
+def run_cohort(img_names, folder_img, folder_pts, model, results_path,
+               outputfolder=None, stats_path=None, **kwargs):
+    """
+    This function runs the asyncio pipeline over all images and writes the
+    results to an SQLite results store, see run_pipeline for the options.
+
+    Parameters
+    ----------
+    img_names : list
+        Names of the images.
+    folder_img : WindowsPath
+        Folder containing the images.
+    folder_pts : WindowsPath
+        Folder containing the points files.
+    model : LandmarkModel
+        The landmark model of the points.
+    results_path : WindowsPath
+        File path of the results store.
+    outputfolder : WindowsPath, optional
+        Folder where the plots are saved. The default is None.
+    stats_path : WindowsPath, optional
+        File path of a JSON file to which the cohort statistics and QC flags
+        are written at the end of the run (see cohort_stats), with the
+        CohortStats passed as cohort_stats or with the default settings. If
+        the results store already contained records, the statistics are
+        determined again from all records of the store at the end (see
+        store_stats), so a rerun does not write the statistics of only the
+        rerun hips. The default is None.
+    **kwargs
+        Further keyword arguments passed to run_pipeline.
+
+    Returns
+    -------
+    n_scans : int
+        Number of processed scans.
+
+    """
+    if stats_path is not None and kwargs.get('cohort_stats') is None:
+        kwargs['cohort_stats'] = CohortStats()
+    with ResultsStore(results_path) as store:
+        rerun = len(store) > 0
+        n_scans = asyncio.run(run_pipeline(img_names, folder_img, folder_pts, model,
+                                           store, outputfolder, **kwargs))
+        if stats_path is not None and rerun is True:
+            store_stats(store, kwargs['cohort_stats'])
+    if stats_path is not None:
+        kwargs['cohort_stats'].write_json(stats_path)
+    return n_scans
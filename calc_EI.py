@@ -5,6 +5,8 @@ Created on Mon Feb 27 09:58:58 2023
 @author: Fleur Boel, f.boel@erasmusmc.nl
 """
 
+import numpy as np
+
 def calc_EI(lfh, mfh, p_AE, pts, hip_side_right=True):
     """
     This function calculates the extrusion index (EI) based on the most
@@ -41,13 +43,8 @@ def calc_EI(lfh, mfh, p_AE, pts, hip_side_right=True):
 
     """
     
-    x_lfh = []
-    for index in lfh:
-        x_lfh.append(pts[index,0])
-    
-    x_mfh = []
-    for index in mfh:
-        x_mfh.append(pts[index,0])
+    x_lfh = pts[np.asarray(lfh), 0]
+    x_mfh = pts[np.asarray(mfh), 0]
     
     if hip_side_right is True:
         EI_x0 = min(x_lfh)
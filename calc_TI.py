@@ -7,9 +7,9 @@ Created on Tue Apr  4 09:06:06 2023
 
 import numpy as np
 from dist_measures import perp_dist_line, dist_2_points
-from spline_int import spline_int
+from head_neck_profile import HeadNeckProfile
 
-def calc_TI(fhn_pts, c_fn, c_vals, slope_neck_axis):
+def calc_TI(fhn_pts, c_fn, c_vals, slope_neck_axis, profile=None):
     """
     This function determines the triangular index based on the femoral head  
     neck points, the femoral neck axis and the best-fitting circle
@@ -27,6 +27,9 @@ def calc_TI(fhn_pts, c_fn, c_vals, slope_neck_axis):
         best-fitting circle.
     slope_neck_axis : float
         The slope of the femoral neck axis.
+    profile : HeadNeckProfile, optional
+        The femoral head-neck profile of fhn_pts, which can be shared with 
+        calc_alpha_angle. The default is None, in which case it is created.
 
     Returns
     -------
@@ -43,7 +46,9 @@ def calc_TI(fhn_pts, c_fn, c_vals, slope_neck_axis):
 
     """
     # Select fhn_points up to and including most superior point femoral head
-    fhn_pts_ti = fhn_pts[0:np.argmin(fhn_pts[:,1])+1, :]
+    if profile is None:
+        profile = HeadNeckProfile(fhn_pts)
+    fhn_pts_ti = profile.points
     
     # Define point H, at distance 0.5*r from femoral head center along the neck axis
     # Vector v is vector from femoral head center to femoral neck center
@@ -72,29 +77,14 @@ def calc_TI(fhn_pts, c_fn, c_vals, slope_neck_axis):
     # Find shortest two distances
     indices = np.argsort(dist)[:2]
     
-    # Find intersection point on interpolated curve
-    # Interpolate between landmark points using b-splines
-    [spl_y, xint, yint] = spline_int(fhn_pts_ti)
-        
-    # Find point S
+    # Find point S, the intersection of the interpolating spline between
+    # these points and the line through point H
     if fhn_pts_ti[indices[0],1] < fhn_pts_ti[indices[1],1]:
-        yspl = np.arange(fhn_pts_ti[indices[0],1], fhn_pts_ti[indices[1],1], 0.01)
-    else: yspl = np.arange(fhn_pts_ti[indices[1],1], fhn_pts_ti[indices[0],1], 0.01)
-    
-    xspl = spl_y(yspl)
-    
-    # Create 2d array containing point coordinates
-    p_spl = np.column_stack((xspl, yspl))
-    
-    # Get distance from spline points to line and select point with smallest distance
-    dist_spl = []
-    for point in p_spl:
-        dist_spl.append(perp_dist_line(point, slope_line_h, intercept_line_h))
-        
-    # Get smallest distance, this point is point S
-    index = np.argmin(dist_spl)
+        y0, y1 = fhn_pts_ti[indices[0],1], fhn_pts_ti[indices[1],1]
+    else: y0, y1 = fhn_pts_ti[indices[1],1], fhn_pts_ti[indices[0],1]
     
-    S = p_spl[index, :]
+    # The spline point with the smallest distance to the line is point S
+    S = profile.closest_to_line(y0, y1, slope_line_h, intercept_line_h)
     
     # Calculate distance point S and the center of the femoral head
     TI = dist_2_points(S, c_fh)
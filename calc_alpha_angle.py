@@ -7,10 +7,126 @@ Created on Tue Apr  4 09:06:06 2023
 
 import numpy as np
 from angle_3_points import angle_3_points
-from spline_int import spline_int
+from head_neck_profile import HeadNeckProfile
+from jit_kernels import outside_end
+
+def alpha_point_index(dist, limit):
+    """
+    This function finds the index of the femoral head neck point around
+    which the femoral head leaves the best-fitting circle.
+
+    Parameters
+    ----------
+    dist : array of float
+        Distance of each femoral head neck point (up to and including the
+        most superior point of the femoral head) to the center of the 
+        best-fitting circle.
+    limit : float
+        Distance from which a point is outside of the best-fitting circle.
+
+    Returns
+    -------
+    index : int
+        Index of the point, None if none of the points are outside of the 
+        best-fitting circle.
+
+    """
+    # Find all point indices which are outside of the best-fitting circle
+    # and check to see if indices are consecutive, meaning the femoral head
+    # leaves the best-fitting circle and does not return inside the circle.
+    # If the indices are consecutive: the alpha point is around the last 
+    # index in the row. If the indices are NOT consecutive, at what point do
+    # the points definitivaly leave the best-fitting circle --> we assume
+    # that with a cam deformity, the femoral head stays outside the 
+    # best-fitting circle (see jit_kernels.outside_end).
+    index = outside_end(np.asarray(dist) >= limit)
+    if index == -1:
+        return None
+    
+    return index
+
+
+def spline_segment(fhn_pts_aa, index):
+    """
+    This function returns the y-range of the part of the interpolating 
+    spline around the point at index, the point before and after the index 
+    point are taken into account.
+
+    Parameters
+    ----------
+    fhn_pts_aa : array of float
+        The x- and y-coordinates of the femoral head neck points up to and 
+        including the most superior point of the femoral head, 2D array.
+    index : int
+        Index of the point, see alpha_point_index.
+
+    Returns
+    -------
+    y0 : float
+        The start of the y-range.
+    y1 : float
+        The end of the y-range (excluded).
+
+    """
+    if index == 0:
+        if fhn_pts_aa[index+2,1] < fhn_pts_aa[index,1]:
+            y0, y1 = fhn_pts_aa[index+2,1], fhn_pts_aa[index,1]
+        else: y0, y1 = fhn_pts_aa[index+1,1], fhn_pts_aa[index,1]
+    elif index == len(fhn_pts_aa)-1:
+        if fhn_pts_aa[index,1] < fhn_pts_aa[index-2,1]:
+            y0, y1 = fhn_pts_aa[index,1], fhn_pts_aa[index-2,1]
+        else: y0, y1 = fhn_pts_aa[index,1], fhn_pts_aa[index-1,1]
+    else: 
+        if fhn_pts_aa[index+1,1] < fhn_pts_aa[index-1,1]:
+            y0, y1 = fhn_pts_aa[index+1,1], fhn_pts_aa[index-1,1]
+        else: y0, y1 = fhn_pts_aa[index+1,1], fhn_pts_aa[index,1]
+    
+    return y0, y1
+
+
+def spline_alpha_point(xspl, yspl, dist_spl, limit_spl, index_pt):
+    """
+    This function defines the alpha point as the first point of the spline
+    segment that leaves the best-fitting circle. If no point of the spline 
+    segment is outside of the circle, the index point is used.
+
+    Parameters
+    ----------
+    xspl, yspl : array of float
+        The x- and y-values of the spline segment.
+    dist_spl : array of float
+        Distance of the spline points to the center of the best-fitting circle.
+    limit_spl : float
+        Distance from which a spline point is outside of the circle.
+    index_pt : array of float
+        The x- and y-coordinates of the index point, 1D array.
+
+    Returns
+    -------
+    ap : array of float
+        The coordinates of the alpha point, 1D array.
+
+    """
+    dist_spl = np.asarray(dist_spl)
+    # Check if any of the points are outside of the best-fitting circle
+    if sum(dist_spl >= limit_spl) > 0:
+        # Check at which point the distance is greater than the radius
+        indices_spl = np.flatnonzero(dist_spl >= limit_spl)
+        # Find incidence at which the points are outside the circle
+        index_spl = indices_spl[0]
+        # Define the alpha point as the first point that leaves the
+        # best-fitting circle
+        ap = np.array([xspl[index_spl], yspl[index_spl]])
+    else:
+        # If no points on the spline are outside the best-fitting circle,
+        # the original index point is used
+        ap = index_pt
+    
+    return ap
+
 
 def calc_alpha_angle(fhn_pts, c_vals, c_n, error_margin_points=1.04, 
-                     error_margin_spline=1, degree=True):
+                     error_margin_spline=1, degree=True, profile=None):
     """
     This function calculates the alpha angle based on the femoral head neck 
     points and the best-fitting circle around the femoral head. If non of the 
@@ -38,6 +154,9 @@ def calc_alpha_angle(fhn_pts, c_vals, c_n, error_margin_points=1.04,
     degree: boolean, optional
         Indicates if the resulting angle will be calculated in degrees (True)
         or radians (False). The default is 'True'.
+    profile : HeadNeckProfile, optional
+        The femoral head-neck profile of fhn_pts, which can be shared with 
+        calc_TI. The default is None, in which case it is created.
 
     Returns
     -------
@@ -50,7 +169,9 @@ def calc_alpha_angle(fhn_pts, c_vals, c_n, error_margin_points=1.04,
     
     # Select superiolateral femoral head points and neck points
     # Select fhn_points up to and including most superior point femoral head
-    fhn_pts_aa = fhn_pts[0:np.argmin(fhn_pts[:,1])+1, :]
+    if profile is None:
+        profile = HeadNeckProfile(fhn_pts)
+    fhn_pts_aa = profile.points
     
     # Calculate distance between femoral head neck pts and center femoral head
     dist = []
@@ -61,76 +182,19 @@ def calc_alpha_angle(fhn_pts, c_vals, c_n, error_margin_points=1.04,
     # Set the limit at a margin based on the radius of the best-fitting circle
     limit = c_vals[2]*error_margin_points
     # Check if any of the points are outside of the best-fitting circle
-    if sum(dist >= limit) > 0:
-        # Find all point indices which are outside of the best-fitting circle
-        indices = np.flatnonzero(dist >= limit)
-        
-        # Check to see if indices are consecutive, meaning the femoral head
-        # leaves the best-fitting circle and does not return inside the circle.
-        for i, indx in enumerate(indices):
-            conseq = True
-            if indx != i:
-                conseq = False
-                break
-        
-        # If the indices are consecutive: the alpha point is around the last 
-        # index in the row
-        if conseq is True:
-            index = indices[-1]   
-        # If the indices are NOT consecutive, at what point do the points
-        # definitivaly leave the best-fitting circle --> we assume that with 
-        # a cam deformity, the femoral head stays outside the best-fitting
-        # circle.
-        else:
-            for i, indx in enumerate(indices):
-                if indx != i:
-                    index = indices[i-1]
-                    break
-        
-        # Find alpha point on interpolated curve
-        # Interpolate between landmark points using b-splines
-        [spl_y, xint, yint] = spline_int(fhn_pts_aa)
-        
-        
-        # Point before and after index point are taken into account
-        if index == 0:
-            if fhn_pts_aa[index+2,1] < fhn_pts_aa[index,1]:
-                yspl = np.arange(fhn_pts_aa[index+2,1], fhn_pts_aa[index,1], 0.01)
-            else: yspl = np.arange(fhn_pts_aa[index+1,1], fhn_pts_aa[index,1], 0.01)
-        elif index == len(fhn_pts_aa)-1:
-            if fhn_pts_aa[index,1] < fhn_pts_aa[index-2,1]:
-                yspl = np.arange(fhn_pts_aa[index,1], fhn_pts_aa[index-2,1], 0.01)
-            else: yspl = np.arange(fhn_pts_aa[index,1], fhn_pts_aa[index-1,1], 0.01)
-        else: 
-            if fhn_pts_aa[index+1,1] < fhn_pts_aa[index-1,1]:
-                yspl = np.arange(fhn_pts_aa[index+1,1], fhn_pts_aa[index-1,1], 0.01)
-            else: yspl = np.arange(fhn_pts_aa[index+1,1], fhn_pts_aa[index,1], 0.01)
-        
-        xspl = spl_y(yspl)
+    index = alpha_point_index(dist, limit)
+    if index is not None:
+        # Find alpha point on the interpolating spline of the profile, the 
+        # point before and after index point are taken into account
+        y0, y1 = spline_segment(fhn_pts_aa, index)
         
         # Calculate distance between the interpolated points and the center 
         # of the femoral head
-        dist_spl = []
-        count_dis = 0
-        for x in xspl:
-            dist_spl.append(np.sqrt((x-c_vals[0])**2 + (yspl[count_dis]-c_vals[1])**2))
-            count_dis+=1
+        xspl, yspl, dist_spl = profile.circle_distance(y0, y1, c_vals)
                 
         # Set the limit at a margin based on the radius of the best-fitting circle
         limit_spl = c_vals[2]*error_margin_spline
-        # Check if any of the points are outside of the best-fitting circle
-        if sum(dist_spl >= limit_spl) > 0:
-            # Check at which point the distance is greater than the radius
-            indices_spl = np.flatnonzero(dist_spl >= limit_spl)
-            # Find incidence at which the points are outside the circle
-            index_spl = indices_spl[0]
-            # Define the alpha point as the first point that leaves the
-            # best-fitting circle
-            ap = np.array([xspl[index_spl], yspl[index_spl]])
-        else:
-            # If no points on the spline are outside the best-fitting circle,
-            # the original index point is used
-            ap = fhn_pts_aa[index]
+        ap = spline_alpha_point(xspl, yspl, dist_spl, limit_spl, fhn_pts_aa[index])
             
         # Calculate the alpha angle
         c_h = np.array([c_vals[0], c_vals[1]])
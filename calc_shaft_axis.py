@@ -6,44 +6,161 @@ Created on Mon Nov 14 08:32:21 2022
 """
 
 import numpy as np
-import math
-import matplotlib.pyplot as plt
-from skimage.filters import threshold_multiotsu
-from skimage.morphology import closing, square
+import instrumentation
+import shaft_cache
+from shared_images import as_image
+from multi_otsu import crop_thresholds, DEFAULT_BINS
+from line_fit import fit_shaft_line
+from jit_kernels import nearest_indices, row_edges
+from lazy_imports import lazy_import, headless_backend
 
+plt = lazy_import('matplotlib.pyplot', setup=headless_backend)
+morphology = lazy_import('skimage.morphology')
 
-def closest_point(p1, pts):
+
+@instrumentation.timed()
+def closest_points(pts_1, pts, chunk=128):
     """
-    This functions identifies the closest point to point p1 from a list of 
-    points (pts).
+    This function identifies for each point in pts_1 the closest point from
+    pts, the first one if several points are equally close (see
+    jit_kernels.nearest_indices). The distances are computed in chunks of
+    points, so the memory use stays limited.
 
     Parameters
     ----------
-    p1 : array of float
-        The x- and y-coordinates of point p1, 1D array.
+    pts_1 : array of float
+        The x- and y-coordinates of the points, 2D array.
     pts : array of float
         The x- and y-coordinates of all potential points, 2D array.
+    chunk : int, optional
+        Number of points of pts_1 per chunk. The default is 128.
+
+    Returns
+    -------
+    pts_closest : array of float
+        The x- and y-coordinates of the closest point of each point in 
+        pts_1, 2D array.
+
+    """
+    indx = nearest_indices(pts_1, pts, chunk=chunk)
+    
+    return pts[indx]
+
+
+def shaft_edges(masked_img):
+    """
+    This function determines the first and last non-zero pixel in each row
+    of the segmentation mask, i.e. the lateral and medial edges of the 
+    cortical bone.
+
+    Parameters
+    ----------
+    masked_img : array of bool
+        The cleaned segmentation mask of the cropped image.
+
+    Returns
+    -------
+    indices_first : array of int
+        Column of the first non-zero pixel of each row.
+    indices_last : array of int
+        Column after the last non-zero pixel of each row.
+
+    """
+    # Get first and last non-zero argument in each image row
+    indices_first, indices_last = row_edges(masked_img)
+    
+    return indices_first, indices_last
+
+
+@instrumentation.timed()
+def edge_midpoints(indices_first, indices_last, tm_cut, col_cut=0, remove_outliers=True):
+    """
+    This function determines the midpoints between the lateral edge points 
+    and the closest medial edge points. Outliers are removed from the 
+    midpoints, unless remove_outliers is False.
+
+    Parameters
+    ----------
+    indices_first : list of int
+        Column of the lateral edge in each row of the cropped image.
+    indices_last : list of int
+        Column of the medial edge in each row of the cropped image.
+    tm_cut : int
+        Row of the image at which the crop starts.
+    col_cut : int, optional
+        Column of the image at which the crop starts. The default is 0.
+    remove_outliers : boolean, optional
+        Indicates whether the midpoints which differ more than 10% from the
+        mean x-coordinate are removed. The default is True.
 
     Returns
     -------
-    pt : array of float
-        The x- and y-coordinates of the closest point to point p1 
-        from all potential points (pts).
+    pts_l : array of float
+        The x- and y-coordinates of the lateral points in the cropped image.
+    pts_m : array of float
+        The x- and y-coordinates of the medial points in the cropped image.
+    adj_midpoints : array of float
+        The x- and y-coordinates of the midpoints in the full image.
 
     """
-    # Calculate the distance between each potential point and the point p1
-    dists = []
-    for p2 in pts:
-        dists.append(math.sqrt((p2[0] - p1[0])**2 + (p2[1] - p1[1])**2))
+    # Create medial points from x- and y-coordinatse
+    pts_m = np.column_stack((indices_last, np.arange(len(indices_last))))
+    
+    # Create lateral points from x- and y-coordinates
+    pts_l = np.column_stack((indices_first, np.arange(len(indices_first))))
     
-    # Find the closest point
-    indx = np.argmin(dists)
-    pt = pts[indx]
+    # Find closest point on medial side for each point on lateral side 
+    # and termine the midpoint
+    p_m = closest_points(pts_l, pts_m)
+    midpoints = np.column_stack(((pts_l[:,0]+p_m[:,0])/2+col_cut, (pts_l[:,1]+p_m[:,1])/2+tm_cut))
     
-    return pt
+    # Remove possible outliers from the midpoints.
+    if remove_outliers is False:
+        return pts_l, pts_m, midpoints
+    mean_x = np.mean(midpoints[:,0])
+    adj_midpoints = midpoints[np.abs(midpoints[:,0]-mean_x) < 0.1*mean_x]
+    
+    return pts_l, pts_m, adj_midpoints
+
+
+@instrumentation.timed()
+def shaft_midpoints(masked_img, tm_cut, col_cut=0, remove_outliers=True):
+    """
+    This function determines the lateral and medial edge points of the 
+    segmented cortical bone in each image row and the midpoints between the
+    lateral points and the closest medial points, see shaft_edges and 
+    edge_midpoints.
+
+    Parameters
+    ----------
+    masked_img : array of bool
+        The cleaned segmentation mask of the cropped image.
+    tm_cut : int
+        Row of the image at which the crop starts.
+    col_cut : int, optional
+        Column of the image at which the crop starts. The default is 0.
+    remove_outliers : boolean, optional
+        See edge_midpoints. The default is True.
 
+    Returns
+    -------
+    pts_l : array of float
+        The x- and y-coordinates of the lateral points in the cropped image.
+    pts_m : array of float
+        The x- and y-coordinates of the medial points in the cropped image.
+    adj_midpoints : array of float
+        The x- and y-coordinates of the midpoints in the full image.
 
-def calc_shaft_axis(img, p_TMI, radius, name, otsu_levels=3, otsu_thres=1, plot=False):
+    """
+    indices_first, indices_last = shaft_edges(masked_img)
+    
+    return edge_midpoints(indices_first, indices_last, tm_cut, col_cut, remove_outliers)
+
+
+@instrumentation.timed()
+@shaft_cache.cached()
+def calc_shaft_axis(img, p_TMI, radius, name, otsu_levels=3, otsu_thres=1, plot=False,
+                    otsu_bins=DEFAULT_BINS, window=None, fit_method='polyfit'):
     """
     This function calculates the shaft axis based on the input image. The 
     cortical bone of the femoral midshaft is segmented using multi-otsu
@@ -57,8 +174,9 @@ def calc_shaft_axis(img, p_TMI, radius, name, otsu_levels=3, otsu_thres=1, plot=
 
     Parameters
     ----------
-    img : array of float
-        Matrix containing the image pixel array.
+    img : array of float or dict
+        Matrix containing the image pixel array, or the handle of a shared 
+        image (see shared_images).
     p_TMI : array of float
         The x- and y-coordinates of the inferior point of the minor 
         trochanter, 1D array.
@@ -79,6 +197,20 @@ def calc_shaft_axis(img, p_TMI, radius, name, otsu_levels=3, otsu_thres=1, plot=
         of the shaft axis calculation. If True an overlay image will be 
         created visualizing the lateral and medial shaft points and the 
         resulting shaft axis. The default is False.
+    otsu_bins : int, optional
+        Maximum number of histogram bins of the multi-otsu thresholding (see
+        multi_otsu). The default is None, which gives the thresholds of
+        skimage.filters.threshold_multiotsu.
+    window : tuple of int, optional
+        The first column and the column after the last column of the image
+        which contain the shaft, see shaft_window. The default is None, in
+        which case the full image width is used.
+    fit_method : str, optional
+        'polyfit' to remove the midpoints which differ more than 10% from the
+        mean x-coordinate and fit y as a function of x with np.polyfit, or
+        'theil-sen' or 'ransac' to fit x as a function of y through all
+        midpoints with a robust estimator (see line_fit). The default is
+        'polyfit'.
 
     Returns
     -------
@@ -87,6 +219,8 @@ def calc_shaft_axis(img, p_TMI, radius, name, otsu_levels=3, otsu_thres=1, plot=
     sa_intercept : float
         The intercept of the femoral neck axis.
     """
+    img = as_image(img)
+    
     # Shaft axis
     # Check if enough shaft is depicted to determine the shaft axis
     # Preferably a length of at least the radius of the femoral head below 
@@ -102,66 +236,34 @@ def calc_shaft_axis(img, p_TMI, radius, name, otsu_levels=3, otsu_thres=1, plot=
             print("Please note that the shaft angle for {} is determined on only a small part of the shaft".format(name))
         
         # Crop the to image below minor trochantor
-        img_c = img[tm_cut:np.size(img, axis=0),:]    
+        if window is None:
+            window = (0, np.size(img, axis=1))
+        cols = slice(window[0], window[1])
+        img_c = img[tm_cut:np.size(img, axis=0), cols]
         
         # Segment image using multi-otsu segmentation to detect the cortical 
         # bone of the femoral midshaft
-        thres = threshold_multiotsu(img_c, otsu_levels)
+        with instrumentation.stage('threshold_multiotsu'):
+            thres = crop_thresholds(img, otsu_levels, slice(tm_cut, None), cols, otsu_bins)
         mask_otsu = np.asarray(img_c) > thres[otsu_thres]
 
         # Use morphological operation closing to clean up the segmentation results
-        masked_img = closing(mask_otsu, square(5))
-        
-        indices_first = []
-        indices_last = []
-        # Get first and last non-zero argument in each image row
-        for row in masked_img:
-            indices_first.append((row!=0).argmax(axis=0))
-            row_r = np.flip(row)
-            indx = (row_r!=0).argmax(axis=0)
-            indices_last.append(len(masked_img[0])-indx)
-        
-        # Create medial points from x- and y-coordinatse
-        pts_m = []
-        for i, x_pt in enumerate(indices_last):
-            pts_m.append(np.array([x_pt, i]))
-        pts_m = np.array(pts_m)
-        
-        # Create lateral points from x- and y-coordinates
-        pts_l = []
-        for i, x_pt in enumerate(indices_first):
-            pts_l.append(np.array([x_pt, i]))
-        pts_l = np.array(pts_l)
-        
-        # Find closest point on medial side for each point on lateral side 
-        # and termine the midpoint
-        midpoints = []
-        for p_l in pts_l:
-            # Find closest point on the medial side of the shaft
-            p_m = closest_point(p_l, pts_m)
-            # Determine midpoint between points
-            midpoint = np.array([(p_l[0]+p_m[0])/2, (p_l[1]+p_m[1])/2+tm_cut])
-            midpoints.append(midpoint)
-            
-        midpoints = np.array(midpoints)
-        
+        with instrumentation.stage('closing'):
+            masked_img = morphology.closing(mask_otsu, morphology.square(5))
         
-        # Remove possible outliers from the midpoints.
-        adj_midpoints = []
-        for pt in midpoints:
-            if abs(pt[0]-np.mean(midpoints[:,0])) < 0.1*np.mean(midpoints[:,0]):
-                adj_midpoints.append(pt)       
-        adj_midpoints = np.array(adj_midpoints)
+        # Midpoints between the lateral and medial cortical bone
+        pts_l, pts_m, adj_midpoints = shaft_midpoints(masked_img, tm_cut, window[0],
+                                                      fit_method == 'polyfit')
         
         # Generate linear regression line through midpoints, this is the shaft axis
-        [sa_slope, sa_intercept] = np.polyfit(adj_midpoints[:,0], adj_midpoints[:,1], 1)
+        sa_slope, sa_intercept = fit_shaft_line(adj_midpoints, fit_method)
             
-        if plot is True:
+        if plot is True and sa_slope != 'NaN':
             # Visualize shaft-axis
             plt.figure(dpi=300)
             plt.imshow(img, cmap = 'gray')
-            plt.scatter(pts_l[:,0], pts_l[:,1]+tm_cut, s=0.5, color='cornflowerblue')
-            plt.scatter(pts_m[:,0], pts_m[:,1]+tm_cut, s=0.5, color='cornflowerblue')
+            plt.scatter(pts_l[:,0]+window[0], pts_l[:,1]+tm_cut, s=0.5, color='cornflowerblue')
+            plt.scatter(pts_m[:,0]+window[0], pts_m[:,1]+tm_cut, s=0.5, color='cornflowerblue')
             plt.scatter(adj_midpoints[:,0], adj_midpoints[:,1], s=0.5, color='red')
             axes = plt.gca()
             y_val = np.array(axes.get_ylim())
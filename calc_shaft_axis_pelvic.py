@@ -6,45 +6,23 @@ Created on Mon Nov 14 08:32:21 2022
 """
 
 import numpy as np
-import math
-import matplotlib.pyplot as plt
-from skimage.filters import threshold_multiotsu
-from skimage.morphology import closing, square
+import instrumentation
+import shaft_cache
+from calc_shaft_axis import shaft_midpoints
+from shared_images import as_image
+from multi_otsu import crop_thresholds, DEFAULT_BINS
+from line_fit import fit_shaft_line
+from lazy_imports import lazy_import, headless_backend
 
-
-def closest_point(p1, pts):
-    """
-    This functions identifies the closest point to point p1 from a list of 
-    points (pts).
-
-    Parameters
-    ----------
-    p1 : array of float
-        The x- and y-coordinates of point p1, 1D array.
-    pts : array of float
-        The x- and y-coordinates of all potential points, 2D array.
-
-    Returns
-    -------
-    pt : array of float
-        The x- and y-coordinates of the closest point to point p1 
-        from all potential points (pts).
-
-    """
-    # Calculate the distance between each potential point and the point p1
-    dists = []
-    for p2 in pts:
-        dists.append(math.sqrt((p2[0] - p1[0])**2 + (p2[1] - p1[1])**2))
-    
-    # Find the closest point
-    indx = np.argmin(dists)
-    pt = pts[indx]
-    
-    return pt
+plt = lazy_import('matplotlib.pyplot', setup=headless_backend)
+morphology = lazy_import('skimage.morphology')
 
 
+@instrumentation.timed()
+@shaft_cache.cached()
 def calc_shaft_axis_pelvic(img, p_TMI, p_IC, otsu_levels=3, otsu_thres=1,
-                    hip_side_right=True, plot=False):
+                    hip_side_right=True, plot=False, otsu_bins=DEFAULT_BINS,
+                    window=None, fit_method='polyfit'):
     """
     This function calculates the shaft axis based on the input image. The 
     cortical bone of the femoral midshaft is segmented using multi-otsu
@@ -55,8 +33,9 @@ def calc_shaft_axis_pelvic(img, p_TMI, p_IC, otsu_levels=3, otsu_thres=1,
 
     Parameters
     ----------
-    img : array of float
-        Matrix containing the image pixel array.
+    img : array of float or dict
+        Matrix containing the image pixel array, or the handle of a shared 
+        image (see shared_images).
     p_TMI : array of float
         The x- and y-coordinates of the inferior point of the minor 
         trochanter, 1D array.
@@ -76,6 +55,20 @@ def calc_shaft_axis_pelvic(img, p_TMI, p_IC, otsu_levels=3, otsu_thres=1,
         of the shaft axis calculation. If True an overlay image will be 
         created visualizing the lateral and medial shaft points and the 
         resulting shaft axis. The default is False.
+    otsu_bins : int, optional
+        Maximum number of histogram bins of the multi-otsu thresholding (see
+        multi_otsu). The default is None, which gives the thresholds of
+        skimage.filters.threshold_multiotsu.
+    window : tuple of int, optional
+        The first column and the column after the last column of the image
+        which contain the shaft, see shaft_window. The crop is limited to
+        the window. The default is None, in which case the crop reaches to
+        the image border, and the x-coordinates of the midpoints (and the
+        intercept) of the left hip are relative to the crop at the ischium,
+        as before the window was added.
+    fit_method : str, optional
+        'polyfit', 'theil-sen' or 'ransac', see calc_shaft_axis. The default
+        is 'polyfit'.
         
 
     Returns
@@ -85,74 +78,47 @@ def calc_shaft_axis_pelvic(img, p_TMI, p_IC, otsu_levels=3, otsu_thres=1,
     sa_intercept : float
         The intercept of the femoral neck axis.
     """
+    img = as_image(img)
+    
     # Shaft axis
     # Crop the image below minor trochantor
     tm_cut = round(p_TMI[1])
     ic_cut = round(p_IC[0])
     
     if hip_side_right is True:
-        img_c = img[tm_cut:np.size(img, axis=0), 0:ic_cut]
+        cols = slice(0, ic_cut)
     else:
-        img_c = img[tm_cut:np.size(img, axis=0), ic_cut:np.size(img, axis=1)]
+        cols = slice(ic_cut, np.size(img, axis=1))
+    if window is not None:
+        cols = slice(max(cols.start, window[0]), min(cols.stop, window[1]))
+    img_c = img[tm_cut:np.size(img, axis=0), cols]
+    # Without a window the midpoints stay relative to the crop, the outlier
+    # removal depends on the x-coordinates, so this keeps the default NSA
+    col_cut = cols.start if window is not None else 0
     
     # Segment image using multi-otsu segmentation to detect the cortical 
     # bone of the femoral midshaft
-    thres = threshold_multiotsu(img_c, otsu_levels)
+    with instrumentation.stage('threshold_multiotsu'):
+        thres = crop_thresholds(img, otsu_levels, slice(tm_cut, None), cols, otsu_bins)
     mask_otsu = np.asarray(img_c) > thres[otsu_thres]
 
     # Using morphological operations to clean up the segmentation results
-    masked_img = closing(mask_otsu, square(5))
-    
-    indices_first = []
-    indices_last = []
-    # Get first and last non-zero argument in each image row
-    for row in masked_img:
-        indices_first.append((row!=0).argmax(axis=0))
-        row_r = np.flip(row)
-        indx = (row_r!=0).argmax(axis=0)
-        indices_last.append(len(masked_img[0])-indx)
-    
-    # Create medial points from x and y variables
-    pts_m = []
-    for i, x_pt in enumerate(indices_last):
-        pts_m.append(np.array([x_pt, i]))
-    pts_m = np.array(pts_m)
-    
-    # Create lateral points from x and y variables
-    pts_l = []
-    for i, x_pt in enumerate(indices_first):
-        pts_l.append(np.array([x_pt, i]))
-    pts_l = np.array(pts_l)
-    
-    # Find closest point on medial side for each point on lateral side 
-    # and termine the midpoint
-    midpoints = []
-    for p_l in pts_l:
-        # Find closest point on the medial side of the shaft
-        p_m = closest_point(p_l, pts_m)
-        # Determine midpoint between points
-        midpoint = np.array([(p_l[0]+p_m[0])/2, (p_l[1]+p_m[1])/2+tm_cut])
-        midpoints.append(midpoint)
-        
-    midpoints = np.array(midpoints)
-    
+    with instrumentation.stage('closing'):
+        masked_img = morphology.closing(mask_otsu, morphology.square(5))
     
-    # Cut-off midpoints to remove outliers
-    adj_midpoints = []
-    for pt in midpoints:
-        if abs(pt[0]-np.mean(midpoints[:,0])) < 0.1*np.mean(midpoints[:,0]):
-            adj_midpoints.append(pt)       
-    adj_midpoints = np.array(adj_midpoints)
+    # Midpoints between the lateral and medial cortical bone
+    pts_l, pts_m, adj_midpoints = shaft_midpoints(masked_img, tm_cut, col_cut,
+                                                  fit_method == 'polyfit')
     
     # Generate linear regression line through midpoints, this is the shaft axis
-    [sa_slope, sa_intercept] = np.polyfit(adj_midpoints[:,0], adj_midpoints[:,1], 1)
+    sa_slope, sa_intercept = fit_shaft_line(adj_midpoints, fit_method)
         
-    if plot is True:
+    if plot is True and sa_slope != 'NaN':
         # Visualize shaft-axis
         plt.figure(dpi=300)
         plt.imshow(img, cmap = 'gray')
-        plt.scatter(pts_l[:,0], pts_l[:,1]+tm_cut, s=0.5, color='cornflowerblue')
-        plt.scatter(pts_m[:,0], pts_m[:,1]+tm_cut, s=0.5, color='cornflowerblue')
+        plt.scatter(pts_l[:,0]+col_cut, pts_l[:,1]+tm_cut, s=0.5, color='cornflowerblue')
+        plt.scatter(pts_m[:,0]+col_cut, pts_m[:,1]+tm_cut, s=0.5, color='cornflowerblue')
         plt.scatter(adj_midpoints[:,0], adj_midpoints[:,1], s=0.5, color='red')
         axes = plt.gca()
         y_val = np.array(axes.get_ylim())
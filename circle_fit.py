@@ -9,7 +9,9 @@ Hyper circle fit
 
 import numpy as np
 import math
-import scipy.linalg
+from lazy_imports import lazy_import
+
+linalg = lazy_import('scipy.linalg')
 
 def circle_fit(points, epsilon = 10**-12):
     """
@@ -71,7 +73,7 @@ def circle_fit(points, epsilon = 10**-12):
         R = np.array([np.mean(Z[:,0]), np.mean(Z[:,1]), np.mean(Z[:,2])])
         H = np.array([[8*R[0], 4*R[1], 4*R[2], 2], [4*R[1], 1, 0, 0], 
                       [4*R[2], 0, 1, 0], [2, 0, 0, 0]])
-        [evals, evecs] = scipy.linalg.eigh(W @ np.linalg.inv(H) @ W)
+        [evals, evecs] = linalg.eigh(W @ np.linalg.inv(H) @ W)
     
         # Select eigenpair (eta, A_star) with smallest positive eigenvalue
         A_star = evecs[:,1]
@@ -92,4 +94,70 @@ def circle_fit(points, epsilon = 10**-12):
     # Calculate RMSE
     error = np.sqrt(np.square(dist).mean())
     
-    return c_x, c_y, r, error
\ No newline at end of file
+    return c_x, c_y, r, error
+
+
+def circle_fit_batch(points, epsilon = 10**-12):
+    """
+    Algebraic circle fit (Hyper fit, see circle_fit) of many point sets at
+    once. All point sets should have the same number of points.
+    
+    Parameters
+    ----------
+    points : array of float
+        The x- and y-coordinates of the point sets, array of shape 
+        (..., n, 2) with n > 3.
+    epsilon : float, optional
+        Tolerance. The default epsilon is 10^-12.
+
+    Returns
+    -------
+    c_x : array of float
+        The x-coordinates of the circle centers, shape (...).
+    c_y : array of float
+        The y-coordinates of the circle centers, shape (...).
+    r : array of float
+        Radii of the circles, shape (...).
+    error : array of float
+        Root mean square error (RSME) of the circle fits, shape (...).
+    """
+    
+    points = np.asarray(points, dtype=float)
+    ctrd = points.mean(axis=-2)
+    X = points[...,0]-ctrd[...,None,0]
+    Y = points[...,1]-ctrd[...,None,1]
+    
+    # Datamatrices Z, shape (..., n, 4)
+    z = X*X + Y*Y
+    Z = np.stack([z, X, Y, np.ones_like(z)], axis=-1)
+    
+    [U, Sdiag, Vt] = np.linalg.svd(Z, full_matrices=False)
+    V = np.swapaxes(Vt, -1, -2)
+    
+    # W = V*Sigma*V.T
+    W = (V * Sdiag[...,None,:]) @ Vt
+    R = Z[...,:3].mean(axis=-2)
+    H = np.zeros(R.shape[:-1] + (4, 4))
+    H[...,0,0] = 8*R[...,0]
+    H[...,0,1] = H[...,1,0] = 4*R[...,1]
+    H[...,0,2] = H[...,2,0] = 4*R[...,2]
+    H[...,0,3] = H[...,3,0] = 2
+    H[...,1,1] = H[...,2,2] = 1
+    
+    # Eigenpair with the smallest positive eigenvalue, A = inv(W)*A_star. 
+    # If Z is singular, the last right singular vector is used instead.
+    singular = Sdiag.min(axis=-1) < epsilon
+    W_safe = np.where(singular[...,None,None], np.eye(4), W)
+    [evals, evecs] = np.linalg.eigh(W_safe @ np.linalg.inv(H) @ W_safe)
+    A = np.linalg.solve(W_safe, evecs[...,:,1:2])[...,0]
+    A = np.where(singular[...,None], V[...,:,3], A)
+    
+    c_x = -1*A[...,1] / (2*A[...,0]) + ctrd[...,0]
+    c_y = -1*A[...,2] / (2*A[...,0]) + ctrd[...,1]
+    r = np.sqrt(A[...,1]*A[...,1]+A[...,2]*A[...,2]-4*A[...,0]*A[...,3])/(2*abs(A[...,0]))
+    
+    dist = np.abs(np.hypot(points[...,0]-c_x[...,None], points[...,1]-c_y[...,None]) - 
+                  r[...,None])
+    error = np.sqrt(np.square(dist).mean(axis=-1))
+    
+    return c_x, c_y, r, error
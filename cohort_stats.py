@@ -0,0 +1,471 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Mon Oct 26 09:37:15 2026
+
+Online statistics of the measures of a cohort, updated while the result
+records of a batch run are written (see run_pipeline), so no results have
+to be loaded afterwards. Per measure and hip side are kept:
+    - the count, mean, standard deviation, minimum and maximum, with the
+      Welford algorithm (RunningMoments)
+    - a quantile sketch with a relative accuracy of 1% (QuantileSketch),
+      which stores counts of logarithmically spaced bins
+Both can be merged, e.g. the statistics of the shards of a cohort (see
+sharding) or of several workers. Hips are flagged for QC as they are
+added, when a measure lies more than z_threshold standard deviations from
+the mean, or outside the quantile_range, of the hips added before. The
+first min_count values of a measure are checked once min_count values have
+been added. After a rerun or an incremental update of an existing results
+store, the statistics are determined again from all records of the store
+(store_stats), in the order of the store instead of the order of writing.
+
+@author: Fleur Boel, f.boel@erasmusmc.nl
+"""
+
+import os
+import json
+import math
+from measure_hip import MEASURES
+
+SIDES = ('R', 'L')
+
+# Percentiles reported in the summary
+SUMMARY_PERCENTILES = (5, 25, 50, 75, 95)
+
+
+class RunningMoments:
+    """
+    Count, mean, variance, minimum and maximum of a stream of values, with
+    the Welford algorithm.
+    """
+
+    def __init__(self):
+        self.n = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def add(self, x):
+        """
+        This function adds a value.
+
+        """
+        self.n += 1
+        delta = x - self.mean
+        self.mean += delta / self.n
+        self.m2 += delta * (x - self.mean)
+        self.min = min(self.min, x)
+        self.max = max(self.max, x)
+
+    def merge(self, other):
+        """
+        This function adds the values of other RunningMoments (Chan et al.).
+
+        """
+        if other.n == 0:
+            return
+        n = self.n + other.n
+        delta = other.mean - self.mean
+        self.mean += delta * other.n / n
+        self.m2 += other.m2 + delta**2 * self.n * other.n / n
+        self.n = n
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    @property
+    def std(self):
+        """
+        The sample standard deviation, NaN for less than two values.
+
+        """
+        if self.n < 2:
+            return math.nan
+        return math.sqrt(self.m2 / (self.n - 1))
+
+    def to_dict(self):
+        return {'n': self.n, 'mean': self.mean, 'm2': self.m2,
+                'min': self.min if self.n > 0 else None, 'max': self.max if self.n > 0 else None}
+
+    @classmethod
+    def from_dict(cls, d):
+        moments = cls()
+        moments.n = d['n']
+        moments.mean = d['mean']
+        moments.m2 = d['m2']
+        if moments.n > 0:
+            moments.min = d['min']
+            moments.max = d['max']
+        return moments
+
+
+class QuantileSketch:
+    """
+    Mergeable quantile sketch with logarithmically spaced bins. A quantile
+    is returned with a relative error of at most relative_accuracy. Positive
+    and negative values are binned separately, values closer to zero than
+    min_value are counted as zero.
+
+    Parameters
+    ----------
+    relative_accuracy : float, optional
+        The relative accuracy of the quantiles. The default is 0.01.
+    min_value : float, optional
+        Smallest absolute value which is not counted as zero. The default
+        is 1e-9.
+    """
+
+    def __init__(self, relative_accuracy=0.01, min_value=1e-9):
+        self.relative_accuracy = relative_accuracy
+        self.min_value = min_value
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self.positive = {}
+        self.negative = {}
+        self.zero = 0
+        self.n = 0
+
+    def _key(self, x):
+        return int(math.ceil(math.log(x) / self._log_gamma))
+
+    def _value(self, key):
+        # Value of a bin with a relative error of at most relative_accuracy
+        return 2 * self.gamma**key / (self.gamma + 1)
+
+    def add(self, x):
+        """
+        This function adds a value.
+
+        """
+        self.n += 1
+        if x > self.min_value:
+            key = self._key(x)
+            self.positive[key] = self.positive.get(key, 0) + 1
+        elif x < -self.min_value:
+            key = self._key(-x)
+            self.negative[key] = self.negative.get(key, 0) + 1
+        else: self.zero += 1
+
+    def merge(self, other):
+        """
+        This function adds the values of another sketch with the same
+        relative accuracy.
+
+        """
+        if other.relative_accuracy != self.relative_accuracy:
+            raise ValueError('Sketches with a different relative accuracy cannot be merged')
+        for key, count in other.positive.items():
+            self.positive[key] = self.positive.get(key, 0) + count
+        for key, count in other.negative.items():
+            self.negative[key] = self.negative.get(key, 0) + count
+        self.zero += other.zero
+        self.n += other.n
+
+    def quantile(self, q):
+        """
+        This function returns the q-quantile (0 <= q <= 1) of the values, NaN
+        if no values are added.
+
+        """
+        if self.n == 0:
+            return math.nan
+        rank = q * (self.n - 1)
+        seen = 0
+        for key in sorted(self.negative, reverse=True):
+            seen += self.negative[key]
+            if seen > rank:
+                return -self._value(key)
+        seen += self.zero
+        if seen > rank:
+            return 0.0
+        for key in sorted(self.positive):
+            seen += self.positive[key]
+            if seen > rank:
+                return self._value(key)
+        return self._value(max(self.positive))
+
+    def to_dict(self):
+        return {'relative_accuracy': self.relative_accuracy, 'min_value': self.min_value,
+                'positive': sorted(self.positive.items()), 'negative': sorted(self.negative.items()),
+                'zero': self.zero, 'n': self.n}
+
+    @classmethod
+    def from_dict(cls, d):
+        sketch = cls(d['relative_accuracy'], d['min_value'])
+        sketch.positive = {int(key): count for key, count in d['positive']}
+        sketch.negative = {int(key): count for key, count in d['negative']}
+        sketch.zero = d['zero']
+        sketch.n = d['n']
+        return sketch
+
+
+def _as_value(value):
+    # The value of a measure as float, None if it was not determined
+    if value is None or isinstance(value, (str, bool)):
+        return None
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return None
+    return value if math.isfinite(value) else None
+
+
+class CohortStats:
+    """
+    Online statistics and QC flags of the measures of a cohort, see the
+    module docstring.
+
+    Parameters
+    ----------
+    measures : list, optional
+        The measures which are aggregated. The default is None, in which case
+        MEASURES of measure_hip are used.
+    z_threshold : float, optional
+        Hips with a measure more than z_threshold standard deviations from
+        the mean are flagged. The default is 4.0, None to switch off.
+    quantile_range : tuple of float, optional
+        Hips with a measure below the first or above the second quantile,
+        e.g. (0.01, 0.99), are flagged, once enough values are added to
+        expect at least one value beyond these quantiles. The default is None
+        (switched off).
+    min_count : int, optional
+        Number of values of a measure before hips are flagged. The default
+        is 30.
+    relative_accuracy : float, optional
+        The relative accuracy of the quantile sketches. The default is 0.01.
+    """
+
+    def __init__(self, measures=None, z_threshold=4.0, quantile_range=None, min_count=30,
+                 relative_accuracy=0.01):
+        self.measures = list(MEASURES if measures is None else measures)
+        self.z_threshold = z_threshold
+        self.quantile_range = None if quantile_range is None else tuple(quantile_range)
+        # Fraction of the values expected beyond the closest quantile limit
+        self._tail = 1.0 if quantile_range is None else min(quantile_range[0],
+                                                              1 - quantile_range[1])
+        self.min_count = min_count
+        self.relative_accuracy = relative_accuracy
+        self.reset()
+
+    def reset(self):
+        """
+        This function removes the added records and the QC flags, the
+        settings are kept.
+
+        """
+        self.moments = {}
+        self.sketches = {}
+        self.missing = {}
+        self.pending = {}
+        for key in self._keys():
+            self.moments[key] = RunningMoments()
+            self.sketches[key] = QuantileSketch(self.relative_accuracy)
+            self.missing[key] = 0
+            self.pending[key] = []
+        self.status = {}
+        self.flags = []
+
+    def _keys(self):
+        return [(measure, side) for measure in self.measures for side in SIDES]
+
+    def _check(self, key, image, value):
+        # Flag a value against the statistics of the values added before
+        moments = self.moments[key]
+        reasons = []
+        z = math.nan
+        if moments.n >= 2 and moments.std > 0:
+            z = (value - moments.mean) / moments.std
+        if self.z_threshold is not None and abs(z) > self.z_threshold:
+            reasons.append('z-score')
+        if self.quantile_range is not None and moments.n*self._tail >= 1:
+            sketch = self.sketches[key]
+            if (value < sketch.quantile(self.quantile_range[0]) or
+                    value > sketch.quantile(self.quantile_range[1])):
+                reasons.append('quantile')
+        if reasons:
+            self.flags.append({'image': image, 'side': key[1], 'measure': key[0], 'value': value,
+                               'z': None if math.isnan(z) else z, 'reason': ', '.join(reasons)})
+
+    def _add_value(self, key, image, value):
+        if self.moments[key].n >= self.min_count:
+            self._check(key, image, value)
+        self.moments[key].add(value)
+        self.sketches[key].add(value)
+        if self.moments[key].n < self.min_count:
+            self.pending[key].append((image, value))
+        elif self.moments[key].n == self.min_count:
+            self.pending[key].append((image, value))
+            self._flush(key)
+
+    def _flush(self, key):
+        # Check the values added before min_count values were seen
+        for image, value in self.pending[key]:
+            self._check(key, image, value)
+        self.pending[key] = []
+
+    def add_record(self, record):
+        """
+        This function adds the result record of a hip.
+
+        """
+        status = record.get('status', 'ok')
+        self.status[status] = self.status.get(status, 0) + 1
+        if status != 'ok':
+            return
+        side = record['side']
+        for measure in self.measures:
+            if measure not in record['measures']:
+                continue
+            key = (measure, side)
+            value = _as_value(record['measures'][measure])
+            if value is None:
+                self.missing[key] += 1
+            else: self._add_value(key, record['image'], value)
+
+    def add_records(self, records):
+        """
+        This function adds the result records of multiple hips.
+
+        """
+        for record in records:
+            self.add_record(record)
+
+    def merge(self, other):
+        """
+        This function adds the statistics and flags of other CohortStats
+        with the same measures, e.g. of another shard. Flags are not
+        re-evaluated against the merged statistics.
+
+        """
+        if other.measures != self.measures:
+            raise ValueError('CohortStats with different measures cannot be merged')
+        for key in self._keys():
+            self.moments[key].merge(other.moments[key])
+            self.sketches[key].merge(other.sketches[key])
+            self.missing[key] += other.missing[key]
+            self.pending[key].extend(other.pending[key])
+            if self.moments[key].n >= self.min_count:
+                self._flush(key)
+        for status, count in other.status.items():
+            self.status[status] = self.status.get(status, 0) + count
+        self.flags.extend(other.flags)
+
+    def summary(self):
+        """
+        This function returns the statistics of each measure and hip side.
+
+        Returns
+        -------
+        summary : dict
+            Dictionary with the measure as key, and per hip side a dictionary
+            with n, n_missing, mean, sd, min, max and the percentiles in
+            SUMMARY_PERCENTILES (e.g. 'p50'), and the number of hips per
+            status ('status').
+
+        """
+        summary = {}
+        for measure, side in self._keys():
+            moments = self.moments[(measure, side)]
+            sketch = self.sketches[(measure, side)]
+            stats = {'n': moments.n, 'n_missing': self.missing[(measure, side)],
+                     'mean': moments.mean if moments.n > 0 else None,
+                     'sd': None if math.isnan(moments.std) else moments.std,
+                     'min': moments.min if moments.n > 0 else None,
+                     'max': moments.max if moments.n > 0 else None}
+            for p in SUMMARY_PERCENTILES:
+                stats['p{}'.format(p)] = sketch.quantile(p/100) if sketch.n > 0 else None
+            summary.setdefault(measure, {})[side] = stats
+        summary['status'] = dict(self.status)
+        return summary
+
+    def to_dict(self):
+        return {'measures': self.measures, 'z_threshold': self.z_threshold,
+                'quantile_range': self.quantile_range, 'min_count': self.min_count,
+                'relative_accuracy': self.relative_accuracy, 'status': self.status,
+                'groups': [{'measure': measure, 'side': side,
+                            'moments': self.moments[(measure, side)].to_dict(),
+                            'sketch': self.sketches[(measure, side)].to_dict(),
+                            'missing': self.missing[(measure, side)],
+                            'pending': self.pending[(measure, side)]}
+                           for measure, side in self._keys()],
+                'flags': self.flags, 'summary': self.summary()}
+
+    @classmethod
+    def from_dict(cls, d):
+        stats = cls(d['measures'], d['z_threshold'], d['quantile_range'], d['min_count'],
+                    d['relative_accuracy'])
+        stats.status = dict(d['status'])
+        for group in d['groups']:
+            key = (group['measure'], group['side'])
+            stats.moments[key] = RunningMoments.from_dict(group['moments'])
+            stats.sketches[key] = QuantileSketch.from_dict(group['sketch'])
+            stats.missing[key] = group['missing']
+            stats.pending[key] = [tuple(item) for item in group['pending']]
+        stats.flags = list(d['flags'])
+        return stats
+
+    def write_json(self, filepath):
+        """
+        This function writes the statistics, the summary and the QC flags to
+        a JSON file, from which they can be read and merged with read_stats.
+
+        """
+        tmp = '{}.{}.tmp'.format(filepath, os.getpid())
+        with open(tmp, 'w') as fw:
+            json.dump(self.to_dict(), fw, indent=1)
+        os.replace(tmp, filepath)
+
+
+def read_stats(filepath):
+    """
+    This function reads CohortStats written with CohortStats.write_json.
+
+    """
+    with open(filepath, 'r') as fr:
+        return CohortStats.from_dict(json.load(fr))
+
+
+def merge_stats_files(filepaths):
+    """
+    This function reads and merges the CohortStats of several files, e.g.
+    of the shards of a cohort.
+
+    Returns
+    -------
+    stats : CohortStats
+        The merged statistics, None if no files are given.
+
+    """
+    stats = None
+    for filepath in filepaths:
+        other = read_stats(filepath)
+        if stats is None:
+            stats = other
+        else: stats.merge(other)
+    return stats
+
+
+def store_stats(store, cohort_stats=None):
+    """
+    This function determines the statistics of all records of a results
+    store, e.g. after a rerun which only wrote part of the records.
+
+    Parameters
+    ----------
+    store : ResultsStore
+        The results store.
+    cohort_stats : CohortStats, optional
+        The statistics which are reset and filled, with their settings. The
+        default is None, in which case CohortStats with the default settings
+        are used.
+
+    Returns
+    -------
+    cohort_stats : CohortStats
+        The statistics of all records of the store.
+
+    """
+    if cohort_stats is None:
+        cohort_stats = CohortStats()
+    cohort_stats.reset()
+    cohort_stats.add_records(store.records())
+    return cohort_stats
@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Mon Oct 19 11:05:29 2026
+
+Measure the cold-start import time of the landmark-only core modules in a
+fresh Python process and check it against a time budget. The core modules
+should not import matplotlib, pydicom, scikit-image or scipy at load time.
+
+Usage: python cold_start.py [budget in seconds]
+
+@author: Fleur Boel, f.boel@erasmusmc.nl
+"""
+
+import os
+import sys
+import json
+import subprocess
+
+# Modules needed for the landmark-only measurements
+CORE_MODULES = ['angle_3_points', 'dist_measures', 'circle_fit', 'opt_circle_fit',
+                'spline_int', 'calc_ADR', 'calc_AI', 'calc_CEA', 'calc_EI',
+                'calc_HRLP', 'calc_NSA', 'calc_neck_axis', 'calc_alpha_angle',
+                'calc_TI', 'load_files', 'instrumentation']
+
+# Heavy dependencies which should only be imported on first use
+HEAVY_MODULES = ['matplotlib', 'pydicom', 'skimage', 'scipy']
+
+# Default cold-start budget in seconds
+BUDGET = 0.2
+
+_MEASURE = """
+import sys, time, json
+t = time.perf_counter()
+for name in {modules!r}:
+    __import__(name)
+elapsed = time.perf_counter() - t
+heavy = [name for name in {heavy!r} if name in sys.modules]
+print(json.dumps({{'elapsed_s': elapsed, 'heavy_loaded': heavy}}))
+"""
+
+
+def measure_cold_start(modules=CORE_MODULES, repeats=3):
+    """
+    This function measures the time needed to import the given modules in a
+    fresh Python process. numpy is imported before the timer is started,
+    since it is needed for every job.
+
+    Parameters
+    ----------
+    modules : list, optional
+        Names of the modules to import. The default is CORE_MODULES.
+    repeats : int, optional
+        Number of fresh processes, the fastest is reported. The default is 3.
+
+    Returns
+    -------
+    elapsed : float
+        Import time in seconds.
+    heavy_loaded : list
+        Heavy dependencies which were imported as a side effect.
+
+    """
+    code = 'import numpy\n' + _MEASURE.format(modules=list(modules),
+                                              heavy=HEAVY_MODULES)
+    folder = os.path.dirname(os.path.abspath(__file__))
+    results = []
+    for i in range(repeats):
+        output = subprocess.run([sys.executable, '-c', code], cwd=folder,
+                                capture_output=True, text=True, check=True)
+        results.append(json.loads(output.stdout.splitlines()[-1]))
+    best = min(results, key=lambda r: r['elapsed_s'])
+
+    return best['elapsed_s'], best['heavy_loaded']
+
+
+if __name__ == '__main__':
+    budget = float(sys.argv[1]) if len(sys.argv) > 1 else BUDGET
+    elapsed, heavy_loaded = measure_cold_start()
+    print('Cold-start import time core modules: {:.3f} s (budget {:.3f} s)'.format(elapsed, budget))
+    if len(heavy_loaded) > 0:
+        print('Heavy dependencies imported at load time:', ', '.join(heavy_loaded))
+    if elapsed > budget or len(heavy_loaded) > 0:
+        sys.exit(1)
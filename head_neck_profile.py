@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Fri Oct 23 09:11:38 2026
+
+Femoral head-neck profile of a hip: the lateral femoral head and neck
+points up to and including the most superior point of the femoral head,
+and the interpolating spline through these points (see spline_int). The
+spline is built once and shared by calc_alpha_angle and calc_TI. Its
+per-segment polynomial coefficients are precomputed, so sampling the
+spline and the intersection queries of both measures are plain numpy
+operations.
+
+@author: Fleur Boel, f.boel@erasmusmc.nl
+"""
+
+import numpy as np
+from lazy_imports import lazy_import
+from spline_int import spline_int
+from dist_measures import perp_dist_line
+
+interpolate = lazy_import('scipy.interpolate')
+
+
+class HeadNeckProfile:
+    """
+    Femoral head-neck profile with a lazily built interpolating spline.
+
+    Parameters
+    ----------
+    fhn_pts : array of float
+        The x- and y-coordinates of all lateral femoral head and neck points,
+        2D array.
+    df : int, optional
+        The degrees of freedom of the spline, see spline_int. The default is 1.
+    step : float, optional
+        Step of the y-values at which the spline is sampled. The default is 0.01.
+    """
+
+    def __init__(self, fhn_pts, df=1, step=0.01):
+        fhn_pts = np.asarray(fhn_pts, dtype=float)
+        # Select fhn_points up to and including most superior point femoral head
+        self.points = fhn_pts[0:np.argmin(fhn_pts[:,1])+1, :]
+        self.df = df
+        self.step = step
+        self._spline = None
+        self._breaks = None
+        self._coefs = None
+        self._segments = {}
+
+    @property
+    def spline(self):
+        """
+        The interpolating spline x(y), a scipy BSpline object.
+
+        """
+        if self._spline is None:
+            self._spline, x_int, y_int = spline_int(self.points, self.df)
+            # Polynomial coefficients of each segment between two knots,
+            # zero-length segments at repeated knots are removed
+            pp = interpolate.PPoly.from_spline(self._spline)
+            keep = np.diff(pp.x) > 0
+            self._breaks = pp.x[:-1][keep]
+            self._coefs = pp.c[:, keep]
+        return self._spline
+
+    def evaluate(self, y):
+        """
+        This function evaluates the spline at the y-values y, using the
+        precomputed segment coefficients. Outside the points the first and
+        last segment are extrapolated.
+
+        Parameters
+        ----------
+        y : array of float
+            The y-values.
+
+        Returns
+        -------
+        x : array of float
+            The x-values of the spline.
+
+        """
+        self.spline
+        y = np.asarray(y, dtype=float)
+        i = np.clip(np.searchsorted(self._breaks, y, side='right')-1, 0, len(self._breaks)-1)
+        dy = y - self._breaks[i]
+        x = np.zeros_like(dy)
+        for c in self._coefs:
+            x = x*dy + c[i]
+        return x
+
+    def segment(self, y0, y1):
+        """
+        This function samples the spline between y0 and y1 (excluding y1)
+        with the step of the profile. Samples are cached, so the alpha angle
+        and the triangular index share the sampled segments.
+
+        Returns
+        -------
+        xspl : array of float
+            The x-values of the samples.
+        yspl : array of float
+            The y-values of the samples.
+
+        """
+        key = (float(y0), float(y1))
+        if key not in self._segments:
+            yspl = np.arange(y0, y1, self.step)
+            self._segments[key] = (self.evaluate(yspl), yspl)
+        return self._segments[key]
+
+    def circle_distance(self, y0, y1, center):
+        """
+        This function returns the samples of the spline between y0 and y1
+        and their distance to a point, e.g. the center of the best-fitting
+        circle.
+
+        Returns
+        -------
+        xspl : array of float
+            The x-values of the samples.
+        yspl : array of float
+            The y-values of the samples.
+        dist_spl : array of float
+            The distance of the samples to the center.
+
+        """
+        xspl, yspl = self.segment(y0, y1)
+        dist_spl = np.sqrt((xspl-center[0])**2 + (yspl-center[1])**2)
+        return xspl, yspl, dist_spl
+
+    def closest_to_line(self, y0, y1, slope, intercept):
+        """
+        This function finds the sample of the spline between y0 and y1 which
+        is closest to a line, i.e. the intersection of the spline and the
+        line at the sampling step.
+
+        Parameters
+        ----------
+        y0, y1 : float
+            The y-range of the spline which is searched.
+        slope : float
+            Slope of the line.
+        intercept : float
+            Intercept of the line.
+
+        Returns
+        -------
+        p : array of float
+            The x- and y-coordinates of the sample, 1D array.
+
+        """
+        xspl, yspl = self.segment(y0, y1)
+        dist_spl = perp_dist_line((xspl, yspl), slope, intercept)
+        index = np.argmin(dist_spl)
+        return np.array([xspl[index], yspl[index]])
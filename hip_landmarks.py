@@ -0,0 +1,268 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Mon Oct 19 13:02:51 2026
+
+Compact container for the landmark points of a cohort. The coordinates of
+all hips are stored in one contiguous (n_hips x n_points x 2) array, with the
+image name and hip side per hip. Landmark groups are returned as views where
+possible, and the coordinates can be shared with worker processes through
+shared memory without pickling the array.
+
+@author: Fleur Boel, f.boel@erasmusmc.nl
+"""
+
+import numpy as np
+from multiprocessing import shared_memory
+from load_files import load_full_body_points
+from landmark_models import get_model, POINT_GROUPS
+
+# Due to the naming convention of BoneFinder, the _L points belong to the
+# RIGHT hip and the _R points belong to the LEFT hip.
+BONEFINDER_SIDES = {'_L': True, '_R': False}
+
+
+def hip_side_right_from_pts_name(pts_name):
+    """
+    This function determines the hip side from the name of a BoneFinder
+    points file, e.g. 'Image1.dcm_L.pts' belongs to the right hip.
+
+    Parameters
+    ----------
+    pts_name : str
+        Name of the points file.
+
+    Returns
+    -------
+    hip_side_right : boolean
+        True for the right hip, False for the left hip.
+
+    """
+    stem = str(pts_name)
+    if stem.endswith('.pts'):
+        stem = stem[:-4]
+    for suffix, hip_side_right in BONEFINDER_SIDES.items():
+        if stem.endswith(suffix):
+            return hip_side_right
+    raise ValueError('Hip side cannot be determined for {}'.format(pts_name))
+
+
+class HipLandmarks:
+    """
+    Landmark points of a cohort in one contiguous array.
+
+    Parameters
+    ----------
+    coords : array of float
+        The x- and y-coordinates of the landmark points of all hips, array of
+        shape (n_hips, n_points, 2).
+    names : list
+        Image name of each hip.
+    hip_side_right : array of bool
+        Hip side of each hip, True for the right hip.
+    model : LandmarkModel or str, optional
+        The landmark model of the points. The default is None.
+    dtype : numpy dtype, optional
+        Data type of the coordinates, float64 or float32. The default is
+        np.float64.
+    """
+
+    def __init__(self, coords, names, hip_side_right, model=None, dtype=np.float64):
+        self.coords = np.ascontiguousarray(coords, dtype=dtype)
+        self.names = list(names)
+        self.hip_side_right = np.asarray(hip_side_right, dtype=bool)
+        self.model = None if model is None else get_model(model)
+        self._shm = None
+        self._owner = False
+
+        if self.coords.ndim != 3 or self.coords.shape[2] != 2:
+            raise ValueError('coords should have shape (n_hips, n_points, 2)')
+        if len(self.names) != len(self.coords) or len(self.hip_side_right) != len(self.coords):
+            raise ValueError('names and hip_side_right should contain one value per hip')
+        if self.model is not None and self.coords.shape[1] != self.model.n_points:
+            raise ValueError('Expected {} landmark points for model {}, got {}'.format(
+                self.model.n_points, self.model.name, self.coords.shape[1]))
+
+    def __len__(self):
+        return len(self.coords)
+
+    def __repr__(self):
+        return 'HipLandmarks({} hips, {} points, {})'.format(
+            len(self), self.coords.shape[1], self.coords.dtype)
+
+    @classmethod
+    def from_points_files(cls, img_names, folder_pts, model=None, dtype=np.float64):
+        """
+        This function loads the _L and _R points files of all images. Images
+        for which one of the points files is missing or incorrect are skipped.
+
+        Parameters
+        ----------
+        img_names : list
+            Names of the images.
+        folder_pts : WindowsPath
+            WindowsPath object containing the filepath to the folder containing
+            the pointfiles.
+        model : LandmarkModel or str, optional
+            The landmark model of the points. The default is None.
+        dtype : numpy dtype, optional
+            Data type of the coordinates. The default is np.float64.
+
+        Returns
+        -------
+        landmarks : HipLandmarks
+            The landmark points of both hips of all images.
+
+        """
+        coords = []
+        names = []
+        sides = []
+        for img in dict.fromkeys(img_names):
+            pts_data_L, pts_data_R = load_full_body_points(img, folder_pts)
+            if len(pts_data_L) == 0 or len(pts_data_R) == 0:
+                continue
+            # _L points belong to the right hip, _R points to the left hip
+            coords.extend([pts_data_L, pts_data_R])
+            names.extend([img, img])
+            sides.extend([BONEFINDER_SIDES['_L'], BONEFINDER_SIDES['_R']])
+
+        if len(coords) == 0:
+            n_points = 0 if model is None else get_model(model).n_points
+            coords = np.zeros((0, n_points, 2))
+        else: coords = np.stack(coords)
+
+        return cls(coords, names, sides, model, dtype)
+
+    def side(self, i):
+        """
+        This function returns the hip side of hip i as 'R' or 'L'.
+
+        """
+        return 'R' if self.hip_side_right[i] else 'L'
+
+    def hip(self, i):
+        """
+        This function returns the landmark points of hip i, a view of shape
+        (n_points, 2).
+
+        """
+        return self.coords[i]
+
+    def group(self, i, group):
+        """
+        This function returns the coordinates of a landmark group of hip i.
+        If the landmark indices of the group are equally spaced the result is
+        a view on the buffer, otherwise a copy. Groups in POINT_GROUPS are
+        returned as a 1D array.
+
+        Parameters
+        ----------
+        i : int or slice
+            Index of the hip, a slice selects multiple hips.
+        group : str
+            Name of the landmark group.
+
+        Returns
+        -------
+        coords : array of float
+            The x- and y-coordinates of the points of the group.
+
+        """
+        if self.model is None:
+            raise ValueError('No landmark model is set for these landmarks')
+        if group in POINT_GROUPS:
+            return self.coords[i, self.model.index(group)]
+        sl = self.model.group_slices[group]
+        if sl is not None:
+            return self.coords[i, sl]
+        return self.coords[i, self.model.groups[group]]
+
+    def gather(self):
+        """
+        This function gathers the coordinates of all landmark groups of all
+        hips in one fancy-indexing pass, see LandmarkModel.gather.
+
+        Returns
+        -------
+        coords : dict
+            Dictionary with the group name as key and the coordinates of the
+            group as value, array of shape (n_hips, n_group, 2).
+
+        """
+        return self.model.gather(self.coords)
+
+    def to_shared_memory(self):
+        """
+        This function copies the coordinates into a new shared memory block.
+        The returned handle is small and can be passed to worker processes,
+        which attach to the block with HipLandmarks.from_shared_memory.
+        The block remains in use until release() is called.
+
+        Returns
+        -------
+        handle : dict
+            Name of the shared memory block, shape and dtype of the
+            coordinates, names, hip sides and landmark model name.
+
+        """
+        shm = shared_memory.SharedMemory(create=True, size=max(self.coords.nbytes, 1))
+        buffer = np.ndarray(self.coords.shape, dtype=self.coords.dtype, buffer=shm.buf)
+        buffer[...] = self.coords
+        # Use the shared buffer from now on, so both sides see the same data
+        self.coords = buffer
+        self._shm = shm
+        self._owner = True
+
+        handle = {'shm_name': shm.name, 'shape': self.coords.shape,
+                  'dtype': self.coords.dtype.str, 'names': self.names,
+                  'hip_side_right': self.hip_side_right.tolist(),
+                  'model': None if self.model is None else self.model.name}
+        return handle
+
+    @classmethod
+    def from_shared_memory(cls, handle):
+        """
+        This function attaches to the shared memory block of a handle created
+        by to_shared_memory. The coordinates are not copied. Call release()
+        when the landmarks are no longer needed. The landmark model should be
+        registered in the worker process as well.
+
+        Parameters
+        ----------
+        handle : dict
+            Handle returned by to_shared_memory.
+
+        Returns
+        -------
+        landmarks : HipLandmarks
+            The landmark points backed by the shared memory block.
+
+        """
+        shm = shared_memory.SharedMemory(name=handle['shm_name'])
+        coords = np.ndarray(handle['shape'], dtype=np.dtype(handle['dtype']), buffer=shm.buf)
+        landmarks = cls.__new__(cls)
+        landmarks.coords = coords
+        landmarks.names = list(handle['names'])
+        landmarks.hip_side_right = np.asarray(handle['hip_side_right'], dtype=bool)
+        landmarks.model = None if handle['model'] is None else get_model(handle['model'])
+        landmarks._shm = shm
+        landmarks._owner = False
+
+        return landmarks
+
+    def release(self):
+        """
+        This function detaches from the shared memory block. The process which
+        created the block also removes it and keeps the coordinates as a
+        private copy, in worker processes the coordinates are no longer
+        available afterwards.
+
+        """
+        if self._shm is None:
+            return
+        if self._owner is True:
+            self.coords = np.array(self.coords)
+        else: self.coords = None
+        self._shm.close()
+        if self._owner is True:
+            self._shm.unlink()
+        self._shm = None
@@ -0,0 +1,260 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Wed Oct 21 09:04:52 2026
+
+Executor which enforces a wall-clock and memory limit per task, e.g. per hip.
+Each task runs in a worker process which is watched by the parent process.
+If a task exceeds the time limit or the resident memory of its worker
+exceeds the memory limit, the worker is killed, the task fails with
+HipTimeoutError or HipMemoryError and a new worker is started. The executor
+can be used with loop.run_in_executor like a ProcessPoolExecutor.
+
+@author: Fleur Boel, f.boel@erasmusmc.nl
+"""
+
+import os
+import sys
+import time
+import queue
+import collections
+import threading
+import multiprocessing
+from multiprocessing.connection import wait
+from concurrent.futures import Executor, Future
+
+
+class HipTimeoutError(Exception):
+    """The task exceeded the wall-clock limit and its worker was killed."""
+
+
+class HipMemoryError(Exception):
+    """The worker of the task exceeded the memory limit and was killed."""
+
+
+class WorkerCrashedError(Exception):
+    """The worker process of the task stopped unexpectedly."""
+
+
+def _worker_main(conn):
+    # Run tasks received from the parent until None is received
+    while True:
+        try:
+            task = conn.recv()
+        except EOFError:
+            break
+        if task is None:
+            break
+        fn, args, kwargs = task
+        try:
+            result = ('ok', fn(*args, **kwargs))
+        except BaseException as e:
+            result = ('error', e)
+        try:
+            conn.send(result)
+        except Exception as e:
+            # The result or exception could not be pickled
+            conn.send(('error', RuntimeError(repr(result[1]) if result[0] == 'error' else repr(e))))
+
+
+def rss_bytes(pid):
+    """
+    This function returns the resident memory of a process on Linux.
+
+    Parameters
+    ----------
+    pid : int
+        Process id.
+
+    Returns
+    -------
+    rss : int
+        Resident memory in bytes, None if it cannot be determined.
+
+    """
+    try:
+        with open('/proc/{}/statm'.format(pid), 'r') as fr:
+            return int(fr.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+class _Slot:
+    # A worker process with the task it is running
+    def __init__(self, ctx):
+        self.ctx = ctx
+        self.start()
+
+    def start(self):
+        self.conn, child_conn = self.ctx.Pipe()
+        self.process = self.ctx.Process(target=_worker_main, args=(child_conn,), daemon=True)
+        self.process.start()
+        child_conn.close()
+        self.future = None
+        self.started = None
+
+    def kill(self):
+        self.process.kill()
+        self.process.join()
+        self.conn.close()
+
+
+class WatchdogExecutor(Executor):
+    """
+    Executor which runs each task in a worker process and enforces a time
+    and memory limit per task.
+
+    Parameters
+    ----------
+    max_workers : int, optional
+        Number of worker processes. The default is None (number of CPUs).
+    timeout : float, optional
+        Wall-clock limit per task in seconds. The default is None (no limit).
+    memory_limit : int, optional
+        Limit of the resident memory of a worker in bytes. The memory is only
+        checked on systems with /proc (Linux). The default is None (no limit).
+    poll_interval : float, optional
+        Interval in seconds at which the workers are checked. The default is 0.1.
+    mp_context : multiprocessing context, optional
+        The default is None, in which case the 'spawn' context is used.
+    """
+
+    def __init__(self, max_workers=None, timeout=None, memory_limit=None,
+                 poll_interval=0.1, mp_context=None):
+        if mp_context is None:
+            mp_context = multiprocessing.get_context('spawn')
+        if memory_limit is not None and not sys.platform.startswith('linux'):
+            print('The memory limit per hip is only enforced on Linux')
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.timeout = timeout
+        self.memory_limit = memory_limit
+        self.poll_interval = poll_interval
+        self.n_recycled = 0
+        self._ctx = mp_context
+        self._tasks = queue.Queue()
+        self._slots = None
+        self._shutdown = False
+        self._cancel = False
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._manage, daemon=True)
+        self._thread.start()
+
+    def submit(self, fn, *args, **kwargs):
+        """
+        This function schedules fn(*args, **kwargs) and returns a Future.
+
+        """
+        with self._lock:
+            if self._shutdown is True:
+                raise RuntimeError('cannot schedule new tasks after shutdown')
+            future = Future()
+            self._tasks.put((future, fn, args, kwargs))
+        return future
+
+    def shutdown(self, wait=True, *, cancel_futures=False):
+        """
+        This function stops the workers once all scheduled tasks are done.
+
+        """
+        with self._lock:
+            self._shutdown = True
+            self._cancel = cancel_futures
+        self._tasks.put(None)
+        if wait is True:
+            self._thread.join()
+
+    def _recycle(self, slot, error):
+        # Kill the worker, fail its task and start a new worker
+        slot.kill()
+        if slot.future is not None and not slot.future.done():
+            slot.future.set_exception(error)
+        self.n_recycled += 1
+        slot.start()
+
+    def _manage(self):
+        # Assign tasks to idle workers and watch the busy workers
+        self._slots = [_Slot(self._ctx) for i in range(self.max_workers)]
+        pending = collections.deque()
+        stopping = False
+        while True:
+            # Move newly submitted tasks to the pending tasks, block if there
+            # is nothing else to do
+            busy = [slot for slot in self._slots if slot.future is not None]
+            block = len(busy) == 0 and len(pending) == 0 and stopping is False
+            while True:
+                try:
+                    task = self._tasks.get(block=block)
+                except queue.Empty:
+                    break
+                block = False
+                if task is None:
+                    stopping = True
+                else: pending.append(task)
+            if self._cancel is True:
+                while len(pending) > 0:
+                    pending.popleft()[0].cancel()
+
+            # Assign pending tasks to idle workers
+            for slot in self._slots:
+                if slot.future is not None:
+                    continue
+                while len(pending) > 0 and slot.future is None:
+                    future, fn, args, kwargs = pending.popleft()
+                    if future.set_running_or_notify_cancel() is False:
+                        continue
+                    slot.future = future
+                    slot.started = time.monotonic()
+                    try:
+                        slot.conn.send((fn, args, kwargs))
+                    except Exception as e:
+                        slot.future = None
+                        future.set_exception(e)
+
+            busy = [slot for slot in self._slots if slot.future is not None]
+            if len(busy) == 0:
+                if stopping is True and len(pending) == 0:
+                    break
+                continue
+
+            # Collect results
+            ready = wait([slot.conn for slot in busy], timeout=self.poll_interval)
+            for slot in busy:
+                if slot.conn in ready:
+                    try:
+                        status, value = slot.conn.recv()
+                    except (EOFError, OSError):
+                        self._recycle(slot, WorkerCrashedError(
+                            'worker exited with code {}'.format(slot.process.exitcode)))
+                        continue
+                    future = slot.future
+                    slot.future = None
+                    if status == 'ok':
+                        future.set_result(value)
+                    else:
+                        future.set_exception(value)
+                        # The state of the worker is unreliable after a
+                        # MemoryError, start a new worker
+                        if isinstance(value, MemoryError):
+                            self._recycle(slot, value)
+                    continue
+
+                # Check the limits of the running task
+                elapsed = time.monotonic() - slot.started
+                if self.timeout is not None and elapsed > self.timeout:
+                    self._recycle(slot, HipTimeoutError(
+                        'task exceeded {:g} s'.format(self.timeout)))
+                elif self.memory_limit is not None:
+                    rss = rss_bytes(slot.process.pid)
+                    if rss is not None and rss > self.memory_limit:
+                        self._recycle(slot, HipMemoryError(
+                            'worker used {:.0f} MB'.format(rss/1024**2)))
+
+        # Stop the workers
+        for slot in self._slots:
+            try:
+                slot.conn.send(None)
+            except OSError:
+                pass
+            slot.process.join(timeout=5)
+            if slot.process.is_alive():
+                slot.process.kill()
+            slot.conn.close()
@@ -0,0 +1,335 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 25 14:52:08 2026
+
+Incremental re-measurement of a cohort after points files are corrected.
+For each hip the fingerprint of its points file is stored in the results
+store: a hash of the file, a hash of the coordinates of each landmark group
+and a hash of the measurement options. An incremental run compares the
+current points files with the stored fingerprints:
+    - unchanged points files are skipped without parsing them
+    - if landmark groups changed, only the measures which depend on these
+      groups are recalculated (see measure_hip.MEASURE_GROUPS), e.g. a
+      moved teardrop point only changes the ADR. The image is only decoded
+      if the NSA is recalculated. If the image cannot be read, the NSA is
+      set to 'NaN' and the hip is stored as 'failed', so the next run
+      measures it again.
+    - a hip without stored fingerprint or result, a hip which failed before
+      and a run with other options are measured completely
+The records are updated in place in the results store. Full runs with
+run_cohort store the fingerprints, so an incremental run can follow them.
+
+@author: Fleur Boel, f.boel@erasmusmc.nl
+"""
+
+import os
+import json
+import hashlib
+import inspect
+from pathlib import Path
+import numpy as np
+from load_files import load_full_body_points, load_image
+from landmark_models import get_model
+from measure_hip import MEASURES, MEASURE_GROUPS, measure_hip, measure_hip_record, scan_hrlp
+from results_store import ResultsStore
+from cohort_stats import CohortStats, read_stats, store_stats
+
+# Arguments of measure_hip which are not measurement options
+_NOT_OPTIONS = ('pts', 'model', 'hip_side_right', 'img', 'name', 'angle_HRLP', 'outputfolder',
+                'c_vals', 'only')
+
+
+def pts_paths(name, folder_pts):
+    """
+    This function returns the file paths of the points files of both hips of
+    an image, with the hip side ('R' or 'L') as key. Please note that due to
+    the naming convention of BoneFinder, the _L points belong to the RIGHT hip.
+
+    """
+    return {'R': Path(folder_pts) / (name + '_L.pts'), 'L': Path(folder_pts) / (name + '_R.pts')}
+
+
+def file_fingerprint(filepath):
+    """
+    This function returns the SHA-1 hash of the contents of a file.
+
+    """
+    with open(filepath, 'rb') as fr:
+        return hashlib.sha1(fr.read()).hexdigest()
+
+
+def group_fingerprints(pts, model):
+    """
+    This function returns a hash of the coordinates of each landmark group of
+    a hip.
+
+    Parameters
+    ----------
+    pts : array of float
+        The x- and y-coordinates of all the landmark points of the hip, 2D array.
+    model : LandmarkModel or str
+        The landmark model of the points.
+
+    Returns
+    -------
+    groups : dict
+        Dictionary with the group name as key and the SHA-1 hash of its
+        coordinates as value, empty if the points do not fit the model.
+
+    """
+    model = get_model(model)
+    try:
+        coords = model.gather(np.asarray(pts, dtype=np.float64))
+    except (ValueError, IndexError):
+        return {}
+    return {group: hashlib.sha1(np.ascontiguousarray(value).tobytes()).hexdigest()
+            for group, value in coords.items()}
+
+
+def options_fingerprint(model, options=None):
+    """
+    This function returns a hash of the landmark model and the measurement
+    options passed to measure_hip. Options which are not given are hashed
+    with their default value, so passing a default explicitly gives the same
+    hash.
+
+    """
+    model = get_model(model)
+    merged = {key: param.default for key, param in inspect.signature(measure_hip).parameters.items()
+              if key not in _NOT_OPTIONS}
+    merged.update(options or {})
+    text = json.dumps({'model': model.name, 'options': merged}, sort_keys=True, default=str)
+    return hashlib.sha1(text.encode()).hexdigest()
+
+
+def hip_fingerprint(filepath, pts, model, options=None):
+    """
+    This function determines the fingerprint of the points file of a hip.
+
+    Parameters
+    ----------
+    filepath : WindowsPath
+        File path of the points file.
+    pts : array of float
+        The landmark points read from the points file, 2D array.
+    model : LandmarkModel or str
+        The landmark model of the points.
+    options : dict, optional
+        The measurement options passed to measure_hip. The default is None.
+
+    Returns
+    -------
+    fingerprint : dict
+        Dictionary with the hash of the file ('file'), of each landmark group
+        ('groups') and of the options ('options').
+
+    """
+    return {'file': file_fingerprint(filepath), 'groups': group_fingerprints(pts, model),
+            'options': options_fingerprint(model, options)}
+
+
+def changed_groups(previous, fingerprint):
+    """
+    This function returns the names of the landmark groups whose coordinates
+    differ between two fingerprints.
+
+    """
+    old = previous['groups']
+    new = fingerprint['groups']
+    return sorted(group for group in set(old) | set(new) if old.get(group) != new.get(group))
+
+
+def plan_hip(previous, fingerprint, record):
+    """
+    This function determines which measures of a hip are recalculated.
+
+    Parameters
+    ----------
+    previous : dict
+        The stored fingerprint of the hip, None if it is not stored.
+    fingerprint : dict
+        The fingerprint of the current points file.
+    record : dict
+        The stored record of the hip, None if it is not stored.
+
+    Returns
+    -------
+    measures : list
+        The measures which are recalculated, an empty list if none of the
+        landmark groups changed. None if the hip is measured completely.
+
+    """
+    if previous is None or record is None or record['status'] != 'ok':
+        return None
+    if previous['options'] != fingerprint['options'] or not fingerprint['groups']:
+        return None
+    if previous['file'] == fingerprint['file']:
+        return []
+    groups = set(changed_groups(previous, fingerprint))
+    return [measure for measure in MEASURES if groups.intersection(MEASURE_GROUPS[measure])]
+
+
+def remeasure_scan(name, folder_img, folder_pts, model, store, outputfolder=None, **options):
+    """
+    This function updates the results of both hips of a scan after their
+    points files changed, see the module docstring.
+
+    Parameters
+    ----------
+    name : str
+        Name of the image.
+    folder_img : WindowsPath
+        Folder containing the images.
+    folder_pts : WindowsPath
+        Folder containing the points files.
+    model : LandmarkModel or str
+        The landmark model of the points.
+    store : ResultsStore
+        The results store of the previous run, which is updated.
+    outputfolder : WindowsPath, optional
+        Folder where the plots of the recalculated measures are saved. The
+        default is None, in which case no plots are made.
+    **options
+        Further keyword arguments passed to measure_hip.
+
+    Returns
+    -------
+    plans : dict
+        For each hip side the recalculated measures, see plan_hip. None if
+        the hip was measured completely.
+
+    """
+    model = get_model(model)
+    paths = pts_paths(name, folder_pts)
+    previous = {side: store.get_fingerprint(name, side) for side in paths}
+    records = {side: store.get(name, side) for side in paths}
+    options_fp = options_fingerprint(model, options)
+
+    # Unchanged points files are not parsed
+    if all(path.exists() for path in paths.values()):
+        files = {side: file_fingerprint(path) for side, path in paths.items()}
+        if all(previous[side] is not None and records[side] is not None and
+               records[side]['status'] == 'ok' and previous[side]['file'] == files[side] and
+               previous[side]['options'] == options_fp for side in paths):
+            return {'R': [], 'L': []}
+
+    pts_data_L, pts_data_R = load_full_body_points(name, Path(folder_pts))
+    if len(pts_data_L) == 0 or len(pts_data_R) == 0:
+        store.put_many([{'image': name, 'side': side, 'status': 'missing',
+                         'error': 'points file missing or incorrect', 'measures': {}}
+                        for side in ('R', 'L')])
+        return {'R': None, 'L': None}
+    pts = {'R': pts_data_L, 'L': pts_data_R}
+    fingerprints = {side: hip_fingerprint(paths[side], pts[side], model, options)
+                    for side in paths}
+    plans = {side: plan_hip(previous[side], fingerprints[side], records[side])
+             for side in paths}
+
+    # The HRLP needs both hips and is cheap, it is determined again
+    angle_HRLP = scan_hrlp(pts_data_L, pts_data_R, model, name)
+
+    # The image is only decoded if the NSA is recalculated
+    img = None
+    img_error = None
+    if any(plan is None or 'NSA' in plan for plan in plans.values()):
+        try:
+            img, spacing = load_image(str(Path(folder_img) / name))
+        except Exception as e:
+            img_error = 'image could not be read: {!r}'.format(e)
+            print('Image could not be read for {}, the NSA is not updated: {!r}'.format(name, e))
+
+    for side, plan in plans.items():
+        hip_side_right = side == 'R'
+        # Without the image the NSA of the new points is unknown, the hip is
+        # stored as failed, so the next run measures it again
+        no_nsa = (img_error is not None and model.has('TMI', 'ln', 'mn') and
+                  (plan is None or 'NSA' in plan))
+        if plan is None:
+            record = measure_hip_record(pts[side], model, hip_side_right, img, name, angle_HRLP,
+                                        outputfolder=outputfolder, **options)
+            record['fingerprint'] = fingerprints[side]
+            if no_nsa is True and record['status'] == 'ok':
+                record['measures']['NSA'] = 'NaN'
+                record['status'] = 'failed'
+                record['error'] = img_error
+            store.put_many([record])
+            continue
+        only = [measure for measure in plan if no_nsa is False or measure != 'NSA']
+        measures = {'HRLP': angle_HRLP}
+        if len(only) > 0:
+            record = measure_hip_record(pts[side], model, hip_side_right, img, name, angle_HRLP,
+                                        outputfolder=outputfolder, only=only, **options)
+            if record['status'] != 'ok':
+                store.put_many([record])
+                continue
+            measures = record['measures']
+        if no_nsa is True:
+            measures = dict(measures, NSA='NaN')
+        store.update_measures(name, side, measures, fingerprints[side])
+        if no_nsa is True:
+            store.put_many([dict(store.get(name, side), status='failed', error=img_error)])
+
+    return plans
+
+
+def run_incremental(img_names, folder_img, folder_pts, model, results_path,
+                    outputfolder=None, stats_path=None, **options):
+    """
+    This function updates the results store of a previous run (e.g. of
+    run_cohort) for the points files which changed since, see the module
+    docstring. Scans are processed one after the other, as usually only a
+    few points files are corrected.
+
+    Parameters
+    ----------
+    img_names : list
+        Names of the images.
+    folder_img : WindowsPath
+        Folder containing the images.
+    folder_pts : WindowsPath
+        Folder containing the points files.
+    model : LandmarkModel or str
+        The landmark model of the points.
+    results_path : WindowsPath
+        File path of the results store, which is updated in place.
+    outputfolder : WindowsPath, optional
+        Folder where the plots of the recalculated measures are saved. The
+        default is None.
+    stats_path : WindowsPath, optional
+        File path of the JSON file with the cohort statistics of the results
+        store (see cohort_stats), which are determined again from all records
+        of the updated store, with the settings of the existing file. The
+        default is None, in which case no statistics are written.
+    **options
+        Further keyword arguments passed to measure_hip, which should be the
+        same as in the previous run to update hips partially.
+
+    Returns
+    -------
+    summary : dict
+        Number of hips without recalculated measures ('unchanged', only
+        their HRLP may be updated), partially updated hips ('updated') and
+        completely measured hips ('measured'), and the number of hips per
+        recalculated measure ('measures').
+
+    """
+    model = get_model(model)
+    summary = {'unchanged': 0, 'updated': 0, 'measured': 0,
+               'measures': {measure: 0 for measure in MEASURES}}
+    with ResultsStore(results_path) as store:
+        for name in dict.fromkeys(img_names):
+            plans = remeasure_scan(name, folder_img, folder_pts, model, store, outputfolder,
+                                   **options)
+            for plan in plans.values():
+                if plan is None:
+                    summary['measured'] += 1
+                elif len(plan) == 0:
+                    summary['unchanged'] += 1
+                else:
+                    summary['updated'] += 1
+                    for measure in plan:
+                        summary['measures'][measure] += 1
+        if stats_path is not None:
+            cohort_stats = read_stats(stats_path) if os.path.exists(stats_path) else CohortStats()
+            store_stats(store, cohort_stats).write_json(stats_path)
+    return summary
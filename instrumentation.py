@@ -0,0 +1,343 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Mon Oct 19 09:12:40 2026
+
+Low-overhead per-stage instrumentation: wall and CPU timers, call counts,
+bytes read and peak memory. Instrumentation is switched off by default and
+can be switched on with the instrument() context manager or by setting the
+environment variable HIP_INSTRUMENT=1.
+
+@author: Fleur Boel, f.boel@erasmusmc.nl
+"""
+
+import os
+import sys
+import json
+import time
+import threading
+import functools
+from contextlib import contextmanager
+
+# The resource module is not available on Windows, in which case the peak
+# memory is not recorded.
+try:
+    import resource
+except ImportError:
+    resource = None
+
+ENV_VAR = 'HIP_INSTRUMENT'
+
+_enabled = os.environ.get(ENV_VAR, '').lower() not in ('', '0', 'false', 'no')
+_stats = {}
+_lock = threading.Lock()
+
+
+def is_enabled():
+    """
+    This function indicates whether the instrumentation is switched on.
+
+    Returns
+    -------
+    enabled : boolean
+        True if the instrumentation is switched on.
+
+    """
+    return _enabled
+
+
+def peak_rss():
+    """
+    This function returns the peak resident memory of the current process.
+
+    Returns
+    -------
+    peak : int
+        Peak resident memory in bytes, 0 if it cannot be determined.
+
+    """
+    if resource is None:
+        return 0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports the peak memory in kilobytes, macOS in bytes
+    if sys.platform != 'darwin':
+        peak = peak*1024
+    return peak
+
+
+def _record(name, calls=0, wall=0.0, cpu=0.0, nbytes=0, peak=0):
+    # Add the measurements of a stage to the collected statistics
+    with _lock:
+        st = _stats.get(name)
+        if st is None:
+            st = {'calls': 0, 'wall_s': 0.0, 'cpu_s': 0.0, 'bytes': 0,
+                  'peak_rss_bytes': 0}
+            _stats[name] = st
+        st['calls'] += calls
+        st['wall_s'] += wall
+        st['cpu_s'] += cpu
+        st['bytes'] += nbytes
+        if peak > st['peak_rss_bytes']:
+            st['peak_rss_bytes'] = peak
+
+
+@contextmanager
+def instrument(reset=True):
+    """
+    Context manager which switches the instrumentation on. The environment
+    variable is set as well, so worker processes started within the context
+    are instrumented too.
+
+    Parameters
+    ----------
+    reset : boolean, optional
+        Indicates whether the previously collected statistics are removed.
+        The default is True.
+
+    Yields
+    ------
+    stats : dict
+        Dictionary containing the statistics per stage, which is filled
+        while the context is active.
+
+    """
+    global _enabled
+    prev_enabled = _enabled
+    prev_env = os.environ.get(ENV_VAR)
+    if reset is True:
+        reset_stats()
+    _enabled = True
+    os.environ[ENV_VAR] = '1'
+    try:
+        yield _stats
+    finally:
+        _enabled = prev_enabled
+        if prev_env is None:
+            os.environ.pop(ENV_VAR, None)
+        else: os.environ[ENV_VAR] = prev_env
+
+
+@contextmanager
+def stage(name, nbytes=0):
+    """
+    Context manager which records the wall time, CPU time and peak memory
+    of a stage. Nothing is recorded if the instrumentation is switched off.
+
+    Parameters
+    ----------
+    name : str
+        Name of the stage, e.g. 'load_image'.
+    nbytes : int, optional
+        Number of bytes read in this stage. The default is 0.
+
+    """
+    if _enabled is False:
+        yield
+        return
+    t_wall = time.perf_counter()
+    t_cpu = time.thread_time()
+    try:
+        yield
+    finally:
+        _record(name, calls=1, wall=time.perf_counter()-t_wall,
+                cpu=time.thread_time()-t_cpu, nbytes=nbytes, peak=peak_rss())
+
+
+def timed(name=None):
+    """
+    Decorator which records each call of the decorated function as a stage.
+
+    Parameters
+    ----------
+    name : str, optional
+        Name of the stage. The default is None, in which case the name of
+        the function is used.
+
+    Returns
+    -------
+    decorator : function
+        The decorator.
+
+    """
+    def decorator(func):
+        stage_name = func.__name__ if name is None else name
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if _enabled is False:
+                return func(*args, **kwargs)
+            with stage(stage_name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def add_bytes(name, nbytes):
+    """
+    This function adds the number of bytes read to a stage without
+    changing its call count.
+
+    Parameters
+    ----------
+    name : str
+        Name of the stage.
+    nbytes : int
+        Number of bytes read.
+
+    """
+    if _enabled is True:
+        _record(name, nbytes=nbytes)
+
+
+def count(name, n=1):
+    """
+    This function increases the call count of a stage without timing it.
+
+    Parameters
+    ----------
+    name : str
+        Name of the stage or counter.
+    n : int, optional
+        Number to add to the count. The default is 1.
+
+    """
+    if _enabled is True:
+        _record(name, calls=n)
+
+
+def get_stats():
+    """
+    This function returns a copy of the statistics collected in this
+    process. Worker processes return this copy to the parent process,
+    where the copies are combined using merge_stats.
+
+    Returns
+    -------
+    stats : dict
+        Dictionary containing the statistics per stage.
+
+    """
+    with _lock:
+        return {name: dict(st) for name, st in _stats.items()}
+
+
+def reset_stats():
+    """
+    This function removes all collected statistics.
+
+    """
+    with _lock:
+        _stats.clear()
+
+
+def merge_stats(stats_list, into_current=False):
+    """
+    This function combines the statistics of multiple processes. Times, call
+    counts and bytes are summed, for the peak memory the maximum is used.
+
+    Parameters
+    ----------
+    stats_list : list
+        List of statistics dictionaries as returned by get_stats.
+    into_current : boolean, optional
+        Indicates whether the merged statistics are added to the statistics
+        of the current process. The default is False.
+
+    Returns
+    -------
+    merged : dict
+        Dictionary containing the combined statistics per stage.
+
+    """
+    merged = {}
+    for stats in stats_list:
+        for name, st in stats.items():
+            m = merged.setdefault(name, {'calls': 0, 'wall_s': 0.0,
+                                         'cpu_s': 0.0, 'bytes': 0,
+                                         'peak_rss_bytes': 0})
+            m['calls'] += st['calls']
+            m['wall_s'] += st['wall_s']
+            m['cpu_s'] += st['cpu_s']
+            m['bytes'] += st['bytes']
+            m['peak_rss_bytes'] = max(m['peak_rss_bytes'], st['peak_rss_bytes'])
+
+    if into_current is True:
+        for name, st in merged.items():
+            _record(name, calls=st['calls'], wall=st['wall_s'], cpu=st['cpu_s'],
+                    nbytes=st['bytes'], peak=st['peak_rss_bytes'])
+
+    return merged
+
+
+def _write_atomic(filepath, text):
+    # Write to a temporary file first, so readers (e.g. the node exporter)
+    # never see a partially written file
+    tmp = str(filepath) + '.tmp'
+    with open(tmp, 'w') as fw:
+        fw.write(text)
+    os.replace(tmp, filepath)
+
+
+def write_json(filepath, stats=None):
+    """
+    This function writes the statistics to a JSON summary file. No total
+    wall time is written: stages are nested (e.g. closing within
+    calc_shaft_axis) and run in parallel workers, so their sum is not the
+    wall time of the run.
+
+    Parameters
+    ----------
+    filepath : WindowsPath
+        File path of the JSON file.
+    stats : dict, optional
+        The statistics to write. The default is None, in which case the
+        statistics of the current process are used.
+
+    """
+    if stats is None:
+        stats = get_stats()
+    summary = {'stages': stats,
+               'peak_rss_bytes': max([st['peak_rss_bytes'] for st in stats.values()],
+                                     default=0)}
+    _write_atomic(filepath, json.dumps(summary, indent=2, sort_keys=True))
+
+
+def write_prometheus(filepath, stats=None, prefix='hip_morphology'):
+    """
+    This function writes the statistics in the Prometheus text format, to be
+    picked up by the textfile collector of the node exporter. The file name
+    should end with '.prom'.
+
+    Parameters
+    ----------
+    filepath : WindowsPath
+        File path of the Prometheus textfile.
+    stats : dict, optional
+        The statistics to write. The default is None, in which case the
+        statistics of the current process are used.
+    prefix : str, optional
+        Prefix of the metric names. The default is 'hip_morphology'.
+
+    """
+    if stats is None:
+        stats = get_stats()
+
+    metrics = [('stage_calls_total', 'calls', 'counter',
+                'Number of calls per stage.'),
+               ('stage_wall_seconds_total', 'wall_s', 'counter',
+                'Wall-clock time spent per stage.'),
+               ('stage_cpu_seconds_total', 'cpu_s', 'counter',
+                'CPU time spent per stage.'),
+               ('stage_read_bytes_total', 'bytes', 'counter',
+                'Bytes read per stage.'),
+               ('stage_peak_rss_bytes', 'peak_rss_bytes', 'gauge',
+                'Peak resident memory observed at the end of a stage.')]
+
+    lines = []
+    for metric, key, kind, help_text in metrics:
+        lines.append('# HELP {}_{} {}'.format(prefix, metric, help_text))
+        lines.append('# TYPE {}_{} {}'.format(prefix, metric, kind))
+        for name in sorted(stats):
+            lines.append('{}_{}{{stage="{}"}} {}'.format(prefix, metric, name,
+                                                          stats[name][key]))
+
+    _write_atomic(filepath, '\n'.join(lines)+'\n')
@@ -0,0 +1,300 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sat Oct 24 15:21:09 2026
+
+Optional JIT-compiled kernels for the loops which are sequential per hip:
+    - outside_end: the consecutive-index scan of alpha_point_index
+    - row_edges: the first and last non-zero pixel of each row of the shaft
+      mask (shaft_edges)
+    - nearest_indices: the closest medial point of each lateral point
+      (closest_points)
+Each kernel has a NumPy implementation and a loop implementation which is
+compiled with numba when the numba package is installed. The compiled loops
+stop as soon as the answer is known (e.g. at the first bone pixel of a
+row, or once the remaining points are further away in y than the closest
+point found), and do not allocate the distance matrices. Both implementations give
+identical results. numba is imported and the kernels are compiled on first
+use; the compiled kernels are cached on disk by numba. Set the environment
+variable HIP_NO_NUMBA=1 to use the NumPy implementations.
+
+Usage: python jit_kernels.py (benchmark of both implementations)
+
+@author: Fleur Boel, f.boel@erasmusmc.nl
+"""
+
+import os
+import time
+import numpy as np
+
+ENV_DISABLE = 'HIP_NO_NUMBA'
+
+# Compiled kernels: name -> function, None if numba is not used
+_compiled = None
+
+
+def _outside_end_loop(outside):
+    # Loop version of outside_end
+    n_found = 0
+    last = -1
+    prev = -1
+    for i in range(len(outside)):
+        if outside[i]:
+            if n_found != i:
+                # First index which is not consecutive: the index before it,
+                # the last index if the first point is not outside
+                if n_found == 0:
+                    for j in range(len(outside)-1, -1, -1):
+                        if outside[j]:
+                            return j
+                return prev
+            prev = i
+            last = i
+            n_found += 1
+    return last
+
+
+def _row_edges_loop(mask):
+    # Loop version of row_edges
+    n_rows, n_cols = mask.shape
+    first = np.zeros(n_rows, dtype=np.int64)
+    last = np.full(n_rows, n_cols, dtype=np.int64)
+    for r in range(n_rows):
+        for c in range(n_cols):
+            if mask[r, c]:
+                first[r] = c
+                break
+        for c in range(n_cols-1, -1, -1):
+            if mask[r, c]:
+                last[r] = c+1
+                break
+    return first, last
+
+
+def _nearest_loop(pts_1, pts):
+    # Loop version of nearest_indices. The points are searched outwards in
+    # the order of their y-coordinate, from the y-coordinate of the point,
+    # until the difference in y exceeds the smallest distance found.
+    order = np.argsort(pts[:, 1], kind='mergesort')
+    ys = pts[order, 1]
+    indx = np.empty(pts_1.shape[0], dtype=np.int64)
+    for i in range(pts_1.shape[0]):
+        best = np.inf
+        best_j = -1
+        start = np.searchsorted(ys, pts_1[i, 1])
+        for k in range(start, len(order)):
+            dy = pts[order[k], 1] - pts_1[i, 1]
+            if abs(dy) > best:
+                break
+            dx = pts[order[k], 0] - pts_1[i, 0]
+            d = np.sqrt(dx**2 + dy**2)
+            if d < best or (d == best and order[k] < best_j):
+                best = d
+                best_j = order[k]
+        for k in range(start-1, -1, -1):
+            dy = pts[order[k], 1] - pts_1[i, 1]
+            if abs(dy) > best:
+                break
+            dx = pts[order[k], 0] - pts_1[i, 0]
+            d = np.sqrt(dx**2 + dy**2)
+            if d < best or (d == best and order[k] < best_j):
+                best = d
+                best_j = order[k]
+        indx[i] = best_j
+    return indx
+
+
+def _kernels():
+    # Compile the loop kernels with numba on first use
+    global _compiled
+    if _compiled is None:
+        _compiled = {}
+        if os.environ.get(ENV_DISABLE, '') not in ('', '0'):
+            return _compiled
+        try:
+            import numba
+        except ImportError:
+            return _compiled
+        for name, func in (('outside_end', _outside_end_loop), ('row_edges', _row_edges_loop),
+                           ('nearest_indices', _nearest_loop)):
+            _compiled[name] = numba.njit(cache=True, nogil=True)(func)
+    return _compiled
+
+
+def use_numba():
+    """
+    This function returns whether the kernels are compiled with numba.
+
+    """
+    return len(_kernels()) > 0
+
+
+def outside_end(outside, compiled=None):
+    """
+    This function returns the index of the femoral head neck point around
+    which the femoral head leaves the best-fitting circle, see
+    alpha_point_index: the last outside index if the outside indices are
+    consecutive from the first point, otherwise the index before the first
+    gap.
+
+    Parameters
+    ----------
+    outside : array of bool
+        Indicates for each point whether it lies outside of the best-fitting
+        circle.
+    compiled : boolean, optional
+        True to use the compiled kernel, False to use NumPy. The default is
+        None, in which case the compiled kernel is used if available.
+
+    Returns
+    -------
+    index : int
+        Index of the point, -1 if none of the points are outside.
+
+    """
+    outside = np.asarray(outside, dtype=bool)
+    kernel = _kernels().get('outside_end') if compiled is not False else None
+    if kernel is not None:
+        return int(kernel(outside))
+    indices = np.flatnonzero(outside)
+    if len(indices) == 0:
+        return -1
+    gaps = np.flatnonzero(indices != np.arange(len(indices)))
+    if len(gaps) == 0:
+        return int(indices[-1])
+    return int(indices[gaps[0]-1])
+
+
+def row_edges(mask, compiled=None):
+    """
+    This function returns the column of the first non-zero pixel and the
+    column after the last non-zero pixel of each row of a mask, 0 and the
+    number of columns for rows without non-zero pixels.
+
+    Parameters
+    ----------
+    mask : array of bool
+        2D mask.
+    compiled : boolean, optional
+        See outside_end.
+
+    Returns
+    -------
+    first : array of int
+        The first column of each row.
+    last : array of int
+        The column after the last column of each row.
+
+    """
+    mask = np.asarray(mask)
+    kernel = _kernels().get('row_edges') if compiled is not False else None
+    if kernel is not None:
+        return kernel(mask)
+    nonzero = mask != 0
+    first = np.argmax(nonzero, axis=1).astype(np.int64)
+    last = mask.shape[1] - np.argmax(nonzero[:, ::-1], axis=1).astype(np.int64)
+    return first, last
+
+
+def nearest_indices(pts_1, pts, compiled=None, chunk=128):
+    """
+    This function returns for each point in pts_1 the index of the closest
+    point in pts, the first one if several points are equally close.
+
+    Parameters
+    ----------
+    pts_1 : array of float
+        The x- and y-coordinates of the points, 2D array.
+    pts : array of float
+        The x- and y-coordinates of all potential points, 2D array.
+    compiled : boolean, optional
+        See outside_end.
+    chunk : int, optional
+        Number of points of pts_1 per chunk of the NumPy implementation. The
+        default is 128.
+
+    Returns
+    -------
+    indx : array of int
+        Index in pts of the closest point of each point in pts_1.
+
+    """
+    kernel = _kernels().get('nearest_indices') if compiled is not False else None
+    if kernel is not None:
+        return kernel(np.asarray(pts_1), np.asarray(pts))
+    indx = np.empty(len(pts_1), dtype=np.int64)
+    for start in range(0, len(pts_1), chunk):
+        p1 = pts_1[start:start+chunk]
+        dists = np.sqrt((pts[None,:,0] - p1[:,None,0])**2 + (pts[None,:,1] - p1[:,None,1])**2)
+        indx[start:start+chunk] = np.argmin(dists, axis=1)
+    return indx
+
+
+def _best_time(func, repeat):
+    # Best time of repeat calls in seconds
+    times = []
+    for i in range(repeat):
+        t = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - t)
+    return min(times)
+
+
+def benchmark(repeat=5, seed=0):
+    """
+    This function times the NumPy and the compiled implementation of each
+    kernel on inputs of typical size, and checks that the results are
+    identical.
+
+    Parameters
+    ----------
+    repeat : int, optional
+        Number of timed calls, the best time is reported. The default is 5.
+    seed : int, optional
+        Seed of the random inputs. The default is 0.
+
+    Returns
+    -------
+    results : dict
+        For each kernel the time of both implementations in seconds (None
+        if numba is not available) and whether the results are identical.
+
+    """
+    rng = np.random.default_rng(seed)
+    # Shaft mask of 2000 x 600 pixels with a tilted cortex and some noise
+    rows = np.arange(2000)[:, None]
+    center = 300 + 0.05*rows
+    mask = (np.abs(np.arange(600)[None, :] - center) < 90) | (rng.random((2000, 600)) < 0.001)
+    first, last = row_edges(mask, compiled=False)
+    pts_l = np.column_stack((first, np.arange(len(first))))
+    pts_m = np.column_stack((last, np.arange(len(last))))
+    outside = np.r_[np.ones(6, dtype=bool), np.zeros(2, dtype=bool), np.ones(3, dtype=bool)]
+
+    cases = {'outside_end': (outside_end, (outside,)),
+             'row_edges': (row_edges, (mask,)),
+             'nearest_indices': (nearest_indices, (pts_l, pts_m))}
+    results = {}
+    for name, (func, args) in cases.items():
+        result = {'numpy_s': _best_time(lambda: func(*args, compiled=False), repeat),
+                  'numba_s': None, 'identical': None}
+        if use_numba():
+            # Compile before timing
+            func(*args, compiled=True)
+            result['numba_s'] = _best_time(lambda: func(*args, compiled=True), repeat)
+            a = func(*args, compiled=False)
+            b = func(*args, compiled=True)
+            if isinstance(a, tuple):
+                result['identical'] = all(np.array_equal(x, y) for x, y in zip(a, b))
+            else: result['identical'] = bool(np.array_equal(a, b))
+        results[name] = result
+    return results
+
+
+if __name__ == '__main__':
+    print('numba: {}'.format(use_numba()))
+    for name, result in benchmark().items():
+        if result['numba_s'] is None:
+            print('{:16s} numpy {:9.3f} ms'.format(name, result['numpy_s']*1000))
+        else:
+            print('{:16s} numpy {:9.3f} ms  numba {:9.3f} ms  x{:6.1f}  identical: {}'.format(
+                name, result['numpy_s']*1000, result['numba_s']*1000,
+                result['numpy_s']/result['numba_s'], result['identical']))
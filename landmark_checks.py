@@ -0,0 +1,193 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 25 17:26:44 2026
+
+Pre-flight checks of the landmark points of a cohort, before any image is
+decoded. Bad BoneFinder fits (e.g. flipped sides, collapsed femoral head
+points or points outside of the image) are otherwise only noticed after
+the image is loaded and the shaft axis is segmented. All checks are done on
+the (n_hips x n_points x 2) landmark tensor at once (see HipLandmarks):
+    - finite: all coordinates are finite
+    - circle_rmse: the RMSE of the circle fit through all femoral head
+      points, relative to the radius, is at most max_circle_rmse
+    - circle_radius: the radius of this circle is at least min_radius
+    - ordering: the femoral head points go around the head in one direction,
+      the head center lies above the minor trochanter (TMI) and the
+      acetabular edge (AE) lies above the teardrop (TD)
+    - bounds: all points lie within the image, of which the size is read
+      from the header
+    - side: the lateral neck (or head) points lie lateral of the medial ones
+      for the hip side of the points file
+    - pair: the head of the right hip lies left of the head of the left hip
+      of the same image
+Checks of which the landmark model does not declare the landmark groups are
+skipped. Hips which fail a check are rejected with a result record with the
+status 'rejected' and the failed checks as error.
+
+@author: Fleur Boel, f.boel@erasmusmc.nl
+"""
+
+from pathlib import Path
+import numpy as np
+import instrumentation
+from circle_fit import circle_fit_batch
+from hip_landmarks import HipLandmarks
+from scan_scheduler import image_shape
+
+CHECKS = ('finite', 'circle_rmse', 'circle_radius', 'ordering', 'bounds', 'side', 'pair')
+
+
+@instrumentation.timed()
+def check_landmarks(landmarks, image_shapes=None, max_circle_rmse=0.1, min_radius=5.0):
+    """
+    This function checks the landmark points of all hips, see the module
+    docstring.
+
+    Parameters
+    ----------
+    landmarks : HipLandmarks
+        The landmark points of the hips, with a landmark model.
+    image_shapes : array of float, optional
+        The number of rows and columns of the image of each hip, array of
+        shape (n_hips, 2), NaN if unknown. The default is None, in which case
+        the bounds are not checked.
+    max_circle_rmse : float, optional
+        Largest RMSE of the circle fit relative to its radius. The default
+        is 0.1.
+    min_radius : float, optional
+        Smallest radius of the femoral head in pixels. The default is 5.0.
+
+    Returns
+    -------
+    failures : dict
+        Dictionary with the check as key and an array of bool as value, True
+        for the hips which fail the check.
+
+    """
+    model = landmarks.model
+    if model is None:
+        raise ValueError('No landmark model is set for these landmarks')
+    right = landmarks.hip_side_right
+    n_hips = len(landmarks)
+    failures = {check: np.zeros(n_hips, dtype=bool) for check in CHECKS}
+
+    failures['finite'] = ~np.all(np.isfinite(landmarks.coords), axis=(1, 2))
+    pts = np.where(failures['finite'][:, None, None], 0, landmarks.coords)
+    coords = model.gather(pts)
+
+    with np.errstate(all='ignore'):
+        if model.has('circle'):
+            c_x, c_y, r, error = circle_fit_batch(coords['circle'])
+            failures['circle_rmse'] = ~(error <= max_circle_rmse*r)
+            failures['circle_radius'] = ~(r >= min_radius)
+
+            # The femoral head points go around the center in one direction
+            angles = np.arctan2(coords['circle'][..., 1] - c_y[:, None],
+                                coords['circle'][..., 0] - c_x[:, None])
+            steps = np.angle(np.exp(1j*np.diff(angles, axis=1)))
+            one_way = np.all(steps > 0, axis=1) | np.all(steps < 0, axis=1)
+            failures['ordering'] |= ~one_way
+            if model.has('TMI'):
+                failures['ordering'] |= ~(coords['TMI'][:, 1] > c_y)
+
+            # The right hip lies in the left half of the image, see pair
+            names, inverse = np.unique(np.asarray(landmarks.names, dtype=str), return_inverse=True)
+            x_right = np.full(len(names), np.nan)
+            x_left = np.full(len(names), np.nan)
+            x_right[inverse[right]] = c_x[right]
+            x_left[inverse[~right]] = c_x[~right]
+            failures['pair'] = (x_right >= x_left)[inverse]
+        if model.has('AE', 'TD'):
+            failures['ordering'] |= ~(coords['AE'][:, 1] < coords['TD'][:, 1])
+
+        # The lateral points lie on the left of the image for the right hip
+        for lateral, medial in (('ln', 'mn'), ('lfh', 'mfh')):
+            if model.has(lateral, medial):
+                x_lateral = coords[lateral][..., 0].mean(axis=1)
+                x_medial = coords[medial][..., 0].mean(axis=1)
+                failures['side'] = np.where(right, x_lateral >= x_medial, x_lateral <= x_medial)
+                break
+
+        if image_shapes is not None:
+            shapes = np.asarray(image_shapes, dtype=float)
+            x = landmarks.coords[..., 0]
+            y = landmarks.coords[..., 1]
+            outside = (x < 0) | (y < 0) | (x >= shapes[:, 1, None]) | (y >= shapes[:, 0, None])
+            failures['bounds'] = np.any(outside, axis=1)
+
+    for check in CHECKS[1:]:
+        failures[check] &= ~failures['finite']
+    return failures
+
+
+def reject_records(landmarks, failures):
+    """
+    This function creates the result records of the hips which fail one of
+    the checks.
+
+    Parameters
+    ----------
+    landmarks : HipLandmarks
+        The landmark points of the hips.
+    failures : dict
+        The failed checks of each hip, see check_landmarks.
+
+    Returns
+    -------
+    records : list
+        Result records with the status 'rejected' and the failed checks as
+        error.
+
+    """
+    failed = np.stack([failures[check] for check in CHECKS], axis=1)
+    records = []
+    for i in np.flatnonzero(failed.any(axis=1)):
+        checks = [check for check, fail in zip(CHECKS, failed[i]) if fail]
+        print('Landmarks of {} ({}) rejected, failed checks: {}'.format(
+            landmarks.names[i], landmarks.side(i), ', '.join(checks)))
+        records.append({'image': landmarks.names[i], 'side': landmarks.side(i),
+                        'status': 'rejected',
+                        'error': 'landmark checks failed: {}'.format(', '.join(checks)),
+                        'measures': {}})
+    return records
+
+
+def prefilter_cohort(img_names, folder_img, folder_pts, model, **kwargs):
+    """
+    This function loads the landmark points of a cohort and the image sizes
+    from the image headers, and checks the landmarks before any image is
+    decoded. Images for which a points file is missing are not checked.
+
+    Parameters
+    ----------
+    img_names : list
+        Names of the images.
+    folder_img : WindowsPath
+        Folder containing the images.
+    folder_pts : WindowsPath
+        Folder containing the points files.
+    model : LandmarkModel or str
+        The landmark model of the points.
+    **kwargs
+        Further keyword arguments passed to check_landmarks.
+
+    Returns
+    -------
+    records : list
+        Result records of the rejected hips, see reject_records.
+
+    """
+    landmarks = HipLandmarks.from_points_files(img_names, Path(folder_pts), model)
+    shapes = {}
+    for name in dict.fromkeys(landmarks.names):
+        try:
+            shapes[name] = image_shape(Path(folder_img) / name)
+        except Exception as e:
+            print('Image size could not be read for {}: {!r}'.format(name, e))
+        if shapes.get(name) is None:
+            shapes[name] = (np.nan, np.nan)
+    if len(landmarks) == 0:
+        return []
+    image_shapes = np.array([shapes[name] for name in landmarks.names], dtype=float)
+    failures = check_landmarks(landmarks, image_shapes, **kwargs)
+    return reject_records(landmarks, failures)
@@ -0,0 +1,317 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Mon Oct 19 11:48:06 2026
+
+Registry of landmark models. A landmark model declares which landmark
+points of a point file (e.g. of the BoneFinder search model for 13 year
+olds) form the named landmark groups used by the measurements. When a model
+is registered, the groups are compiled into integer index arrays and the
+circle subsets into boolean masks, so all coordinates needed for a hip (or a
+whole cohort) can be gathered in one fancy-indexing pass.
+
+@author: Fleur Boel, f.boel@erasmusmc.nl
+"""
+
+import numpy as np
+from opt_circle_fit import CIRCLE_SUBSETS_13Y, subset_masks
+
+# Landmark groups used by the measurements
+GROUPS = {
+    'circle': 'femoral head points used for the best-fitting circle (opt_circle_fit)',
+    'fhn': 'lateral femoral head and neck points (calc_alpha_angle, calc_TI)',
+    'ln': 'lateral femoral neck points (calc_neck_axis)',
+    'mn': 'medial femoral neck points (calc_neck_axis)',
+    'lfh': 'points on the lateral side of the femoral head (calc_EI)',
+    'mfh': 'points on the medial side of the femoral head (calc_EI)',
+    'io': 'most caudal point of the ischium and superolateral corner of the obturator foramen (calc_HRLP)',
+    'AS': 'most medial point of the acetabular sourcil (calc_ADR)',
+    'AE': 'most lateral bony point of the acetabulum (calc_AI, calc_CEA, calc_EI, calc_ADR)',
+    'TC': 'most lateral point of the triradiate cartilage (calc_AI)',
+    'TD': 'most inferior point of the teardrop (calc_ADR)',
+    'TMI': 'inferior point of the minor trochanter (calc_shaft_axis)',
+    'IC': 'most caudal point of the ischium (calc_shaft_axis_pelvic)'}
+
+# Groups which consist of a single landmark point
+POINT_GROUPS = ('AS', 'AE', 'TC', 'TD', 'TMI', 'IC')
+
+_registry = {}
+
+
+class LandmarkModel:
+    """
+    Compiled index plan of a landmark model.
+
+    Parameters
+    ----------
+    name : str
+        Name of the model, e.g. 'bonefinder_13y'.
+    n_points : int
+        Number of landmark points in a point file of this model.
+    groups : dict
+        Dictionary with the group name as key and the landmark indices of the
+        group as value (a single int for the groups in POINT_GROUPS).
+    circle_subsets : list of slice, optional
+        Subsets of the circle points used by opt_circle_fit. The default is
+        None, in which case the subsets for 13 year olds are used.
+    description : str, optional
+        Description of the model. The default is ''.
+    """
+
+    def __init__(self, name, n_points, groups, circle_subsets=None, description=''):
+        self.name = name
+        self.n_points = int(n_points)
+        self.description = description
+        if circle_subsets is None:
+            circle_subsets = CIRCLE_SUBSETS_13Y
+        self.circle_subsets = list(circle_subsets)
+
+        # Compile the groups into integer index arrays
+        self.groups = {}
+        for group, indices in groups.items():
+            if group not in GROUPS:
+                raise ValueError('Unknown landmark group {} in model {}'.format(group, name))
+            indices = np.atleast_1d(np.asarray(indices, dtype=np.intp))
+            if group in POINT_GROUPS and len(indices) != 1:
+                raise ValueError('Group {} of model {} should contain one point'.format(group, name))
+            if np.any(indices < 0) or np.any(indices >= self.n_points):
+                raise ValueError('Group {} of model {} contains indices outside 0-{}'.format(
+                    group, name, self.n_points-1))
+            self.groups[group] = indices
+            self.groups[group].setflags(write=False)
+
+        # Compile the circle subsets into boolean masks (subset x circle point)
+        # which are used by opt_circle_fit and opt_circle_fit_batch
+        self.subset_masks = subset_masks(self.circle_subsets, len(self.groups.get('circle', [])))
+        self.subset_masks.setflags(write=False)
+
+        # Plan for gathering all groups in one fancy-indexing pass: the
+        # indices of all groups are concatenated and each group is a slice
+        # of the gathered coordinates.
+        self.group_names = list(self.groups)
+        self.gather_index = np.concatenate([self.groups[g] for g in self.group_names]
+                                           ) if self.groups else np.zeros(0, dtype=np.intp)
+        self.offsets = {}
+        start = 0
+        for group in self.group_names:
+            stop = start + len(self.groups[group])
+            self.offsets[group] = slice(start, stop)
+            start = stop
+
+        # Groups with equally spaced indices can be taken as a slice of the
+        # landmark points, which gives a view instead of a copy
+        self.group_slices = {}
+        for group in self.group_names:
+            self.group_slices[group] = _as_slice(self.groups[group])
+
+    def __repr__(self):
+        return 'LandmarkModel({!r}, n_points={}, groups={})'.format(
+            self.name, self.n_points, self.group_names)
+
+    def has(self, *groups):
+        """
+        This function checks whether all given groups are declared.
+
+        Returns
+        -------
+        declared : boolean
+            True if all groups are declared in the model.
+
+        """
+        return all(group in self.groups for group in groups)
+
+    def index(self, group):
+        """
+        This function returns the landmark indices of a group, or the index
+        of the landmark point for groups in POINT_GROUPS.
+
+        Parameters
+        ----------
+        group : str
+            Name of the group.
+
+        Returns
+        -------
+        index : array of int or int
+            The landmark indices of the group.
+
+        """
+        if group in POINT_GROUPS:
+            return int(self.groups[group][0])
+        return self.groups[group]
+
+    def gather(self, pts):
+        """
+        This function gathers the coordinates of all groups in one
+        fancy-indexing pass. The returned groups are views on the gathered
+        array. Points of groups in POINT_GROUPS are returned as (..., 2) arrays.
+
+        Parameters
+        ----------
+        pts : array of float
+            The x- and y-coordinates of the landmark points, array of shape
+            (n_points, 2) for one hip or (..., n_points, 2) for a batch of hips.
+
+        Returns
+        -------
+        coords : dict
+            Dictionary with the group name as key and the coordinates of the
+            group as value, array of shape (..., n_group, 2).
+
+        """
+        pts = np.asarray(pts)
+        if pts.shape[-2] != self.n_points:
+            raise ValueError('Expected {} landmark points for model {}, got {}'.format(
+                self.n_points, self.name, pts.shape[-2]))
+        gathered = pts[..., self.gather_index, :]
+
+        coords = {}
+        for group in self.group_names:
+            if group in POINT_GROUPS:
+                coords[group] = gathered[..., self.offsets[group].start, :]
+            else: coords[group] = gathered[..., self.offsets[group], :]
+
+        return coords
+
+
+def _as_slice(indices):
+    # Convert equally spaced indices to a slice, None if not possible
+    if len(indices) == 1:
+        return slice(int(indices[0]), int(indices[0])+1)
+    step = int(indices[1] - indices[0])
+    if step == 0 or np.any(np.diff(indices) != step):
+        return None
+    stop = int(indices[-1]) + step
+    return slice(int(indices[0]), stop if stop >= 0 else None, step)
+
+
+def register_model(name, n_points, groups, circle_subsets=None, description=''):
+    """
+    This function compiles a landmark model and adds it to the registry.
+    A model with the same name is replaced.
+
+    Parameters
+    ----------
+    name : str
+        Name of the model.
+    n_points : int
+        Number of landmark points in a point file of this model.
+    groups : dict
+        Dictionary with the group name as key and the landmark indices of the
+        group as value.
+    circle_subsets : list of slice, optional
+        Subsets of the circle points used by opt_circle_fit. The default is
+        None, in which case the subsets for 13 year olds are used.
+    description : str, optional
+        Description of the model. The default is ''.
+
+    Returns
+    -------
+    model : LandmarkModel
+        The compiled model.
+
+    """
+    model = LandmarkModel(name, n_points, groups, circle_subsets, description)
+    _registry[name] = model
+
+    return model
+
+
+def get_model(name):
+    """
+    This function returns a registered landmark model.
+
+    Parameters
+    ----------
+    name : str or LandmarkModel
+        Name of the model. If a LandmarkModel is given it is returned as is.
+
+    Returns
+    -------
+    model : LandmarkModel
+        The compiled model.
+
+    """
+    if isinstance(name, LandmarkModel):
+        return name
+    if name not in _registry:
+        raise KeyError('Landmark model {} is not registered, available models: {}'.format(
+            name, ', '.join(sorted(_registry)) or 'none'))
+    return _registry[name]
+
+
+def list_models():
+    """
+    This function returns the names of all registered landmark models.
+
+    Returns
+    -------
+    names : list
+        Sorted list of model names.
+
+    """
+    return sorted(_registry)
+
+
+def _parse_indices(text):
+    # Parse indices separated by spaces or commas, a range can be given as
+    # start:stop (stop not included)
+    indices = []
+    for token in text.replace(',', ' ').split():
+        if ':' in token:
+            start, stop = token.split(':')
+            indices.extend(range(int(start), int(stop)))
+        else: indices.append(int(token))
+    return indices
+
+
+def _parse_slice(token):
+    # Parse a slice given as start:stop, e.g. '1:-2' or '2:'
+    start, stop = token.split(':')
+    return slice(int(start) if start.strip() else 0,
+                 int(stop) if stop.strip() else None)
+
+
+def load_model_file(filepath):
+    """
+    This function reads a landmark model from a model file and adds it to
+    the registry. The model file should be in the same format as the
+    example_modelfile.txt.
+
+    Parameters
+    ----------
+    filepath : WindowsPath
+        WindowsPath object containing the file path to the model file.
+
+    Returns
+    -------
+    model : LandmarkModel
+        The compiled model.
+
+    """
+    with open(filepath, 'r') as fr:
+        lines = [line.strip() for line in fr.read().split('\n')]
+
+    settings = {}
+    groups = {}
+    in_groups = False
+    for line in lines:
+        if line == '' or line.startswith('#'):
+            continue
+        if line == '{':
+            in_groups = True
+        elif line == '}':
+            in_groups = False
+        elif in_groups is True:
+            group, indices = line.split(':', 1)
+            groups[group.strip()] = _parse_indices(indices)
+        else:
+            key, value = line.split(':', 1)
+            settings[key.strip()] = value.strip()
+
+    circle_subsets = None
+    if settings.get('circle_subsets'):
+        circle_subsets = [_parse_slice(token) for token in
+                          settings['circle_subsets'].replace(',', ' ').split()]
+
+    return register_model(settings['model'], int(settings['n_points']), groups,
+                          circle_subsets, settings.get('description', ''))
@@ -0,0 +1,554 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sun Oct 25 10:14:37 2026
+
+Monte Carlo uncertainty of the landmark-only measures (alpha angle, TI, CEA,
+AI, ADR and EI) under landmark placement noise. The landmark points of all
+hips are jittered with normally distributed noise into a tensor of shape
+(n_hips x n_draws x n_points x 2), and all measures are evaluated for all
+draws at once:
+    - the best-fitting circles with opt_circle_fit_batch
+    - the neck axis, CEA, AI, ADR and EI with array arithmetic
+    - the alpha angle and TI on the linear interpolating spline of the
+      head-neck profile (see head_neck_profile). Instead of sampling the
+      spline segment with a step of 0.01, the first sample outside of the
+      circle (alpha angle) and the sample closest to the line through H (TI)
+      are solved per linear piece of the spline, which gives the same
+      sample as calc_alpha_angle and calc_TI.
+A draw for which a measure cannot be determined (e.g. no point outside of
+the circle, or a profile which is not monotonic in y) gives NaN for that
+measure. The draws are processed in chunks, so the memory use is bounded
+by max_memory_mb and not by the number of draws.
+
+@author: Fleur Boel, f.boel@erasmusmc.nl
+"""
+
+import numpy as np
+import instrumentation
+from landmark_models import get_model
+from opt_circle_fit import opt_circle_fit_batch
+from dist_measures import perp_dist, dist_2_points
+
+# Landmark-only measures, the neck-shaft angle needs the image
+LANDMARK_MEASURES = ['alpha_angle', 'TI', 'CEA', 'AI', 'ADR', 'EI']
+
+DEFAULT_PERCENTILES = (2.5, 50, 97.5)
+
+# Step of the y-values at which the spline is sampled, see HeadNeckProfile
+SPLINE_STEP = 0.01
+
+# Number of float64 values per landmark coordinate held at once while
+# evaluating a chunk (the jittered points, gathered groups and intermediates)
+_VALUES_PER_COORD = 8
+
+
+def jitter_landmarks(pts, n_draws, sigma=1.0, seed=0, start=0):
+    """
+    This function adds normally distributed noise to the landmark points of
+    each hip. The noise of draw d does not depend on the number of draws
+    generated at once, so chunks of draws can be generated separately.
+
+    Parameters
+    ----------
+    pts : array of float
+        The x- and y-coordinates of the landmark points of the hips, array
+        of shape (n_hips, n_points, 2).
+    n_draws : int
+        Number of draws.
+    sigma : float or array of float, optional
+        Standard deviation of the landmark placement in pixels, a single
+        value, one value per landmark point (n_points,) or one value per
+        coordinate (n_points, 2). The default is 1.0.
+    seed : int, optional
+        Seed of the random numbers. The default is 0.
+    start : int, optional
+        Index of the first draw. The default is 0.
+
+    Returns
+    -------
+    jittered : array of float
+        The jittered landmark points, array of shape (n_hips, n_draws,
+        n_points, 2).
+
+    """
+    pts = np.asarray(pts, dtype=float)
+    sigma = np.asarray(sigma, dtype=float)
+    if sigma.ndim == 1:
+        sigma = sigma[:, None]
+    # Each draw has its own random numbers, so draw d is the same for any
+    # chunking of the draws
+    noise = np.empty((pts.shape[0], n_draws) + pts.shape[1:])
+    for d in range(n_draws):
+        noise[:, d] = np.random.default_rng([seed, start+d]).standard_normal(pts.shape)
+    return pts[:, None] + noise*sigma
+
+
+def _xy(p):
+    # Coordinate arrays of points of shape (..., 2), as used by dist_measures
+    return np.moveaxis(p, -1, 0)
+
+
+def _angle(p0, p1, p2):
+    # Angle p0p1p2 in degrees of each row of points, see angle_3_points
+    v0 = p0 - p1
+    v1 = p2 - p1
+    cross = v0[...,0]*v1[...,1] - v0[...,1]*v1[...,0]
+    dot = v0[...,0]*v1[...,0] + v0[...,1]*v1[...,1]
+    return np.degrees(np.arctan2(np.abs(cross), dot))
+
+
+def head_neck_profiles(fhn_pts):
+    """
+    This function determines the head-neck profile of each row (see
+    HeadNeckProfile) and the knots of its linear interpolating spline (see
+    spline_int).
+
+    Parameters
+    ----------
+    fhn_pts : array of float
+        The x- and y-coordinates of the lateral femoral head and neck points,
+        array of shape (n, n_fhn, 2).
+
+    Returns
+    -------
+    last : array of int
+        Index of the most superior point of the femoral head, the last point
+        of the profile.
+    first_knot : array of int
+        Index of the lowest point of the profile, the first point of the
+        spline (the knots are the points first_knot up to last).
+    valid : array of bool
+        Indicates whether the spline exists, i.e. whether the y-coordinates
+        of the knots are strictly decreasing.
+
+    """
+    y = fhn_pts[..., 1]
+    n_fhn = y.shape[1]
+    last = np.argmin(y, axis=1)
+    in_profile = np.arange(n_fhn)[None, :] <= last[:, None]
+    # The lowest point, the last one if several points are equally low
+    y_profile = np.where(in_profile, y, -np.inf)
+    first_knot = n_fhn-1 - np.argmax(y_profile[:, ::-1], axis=1)
+    j = np.arange(n_fhn-1)[None, :]
+    in_spline = (j >= first_knot[:, None]) & (j < last[:, None])
+    decreasing = np.all(~in_spline | (y[:, :-1] > y[:, 1:]), axis=1)
+    valid = decreasing & (last > first_knot)
+    return last, first_knot, valid
+
+
+def _spline_pieces(fhn_pts, last, first_knot):
+    # Linear pieces of the splines in ascending y, each piece as the points
+    # (x_a, y_a) and (x_b, y_b) between which it interpolates, its y-range
+    # and whether the row has this piece. The first and last piece are
+    # extrapolated, as in HeadNeckProfile.evaluate.
+    rows = np.arange(len(fhn_pts))
+    for s in range(fhn_pts.shape[1]-1):
+        j = last-1-s
+        has = j >= first_knot
+        j = np.maximum(j, 0)
+        a = fhn_pts[rows, j+1]
+        b = fhn_pts[rows, j]
+        lo = np.where(s == 0, -np.inf, a[:, 1])
+        hi = np.where(j == first_knot, np.inf, b[:, 1])
+        yield a, b, lo, hi, has
+
+
+def _piece_x(a, b, y):
+    # x-value of the linear piece through a and b at y
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return a[:, 0] + (y - a[:, 1])*(b[:, 0] - a[:, 0])/(b[:, 1] - a[:, 1])
+
+
+def _sample_grid(y0, y1, step):
+    # Start, step and number of samples of np.arange(y0, y1, step)
+    delta = (y0 + step) - y0
+    n = np.maximum(np.ceil((y1 - y0)/step), 0)
+    return delta, np.nan_to_num(n).astype(np.int64)
+
+
+def _piece_range(y0, delta, n, lo, hi):
+    # Samples k_lo up to k_hi of the grid which lie on the piece [lo, hi)
+    with np.errstate(invalid='ignore'):
+        k_lo = np.clip(np.ceil((lo - y0)/delta), 0, n)
+        k_hi = np.clip(np.ceil((hi - y0)/delta), 0, n)
+    return np.nan_to_num(k_lo).astype(np.int64), np.nan_to_num(k_hi).astype(np.int64)
+
+
+def alpha_angle_batch(fhn_pts, c_vals, c_n, error_margin_points=1.04, error_margin_spline=1,
+                      step=SPLINE_STEP):
+    """
+    This function calculates the alpha angle of each row like
+    calc_alpha_angle. The first sample of the spline segment outside of the
+    best-fitting circle is solved per linear piece of the spline, from the
+    intersections of the piece with the circle.
+
+    Parameters
+    ----------
+    fhn_pts : array of float
+        The x- and y-coordinates of the lateral femoral head and neck points,
+        array of shape (n, n_fhn, 2).
+    c_vals : array of float
+        The x-coordinate, y-coordinate and radius of the best-fitting circle,
+        array of shape (n, 3).
+    c_n : array of float
+        The x- and y-coordinates of the femoral neck center, array of shape
+        (n, 2).
+    error_margin_points, error_margin_spline : float, optional
+        See calc_alpha_angle. The defaults are 1.04 and 1.
+    step : float, optional
+        Step of the y-values at which the spline is sampled. The default is
+        0.01.
+
+    Returns
+    -------
+    alpha_angle : array of float
+        The alpha angle in degrees, NaN if it could not be determined.
+
+    """
+    n, n_fhn = fhn_pts.shape[:2]
+    rows = np.arange(n)
+    c_fh = c_vals[:, :2]
+    last, first_knot, valid = head_neck_profiles(fhn_pts)
+    n_profile = last+1
+    j = np.arange(n_fhn)[None, :]
+
+    # Index of the point around which the head leaves the circle, see
+    # alpha_point_index
+    dist = np.hypot(fhn_pts[..., 0]-c_fh[:, 0, None], fhn_pts[..., 1]-c_fh[:, 1, None])
+    outside = (dist >= (c_vals[:, 2]*error_margin_points)[:, None]) & (j <= last[:, None])
+    found = outside.any(axis=1)
+    first_out = np.argmax(outside, axis=1)
+    last_out = n_fhn-1 - np.argmax(outside[:, ::-1], axis=1)
+    run = np.where(outside.all(axis=1), n_fhn, np.argmax(~outside, axis=1))
+    index = np.where(first_out == 0, run-1, last_out)
+
+    # y-range of the spline segment, see spline_segment
+    y = fhn_pts[..., 1]
+    at = lambda k: y[rows, np.clip(k, 0, n_fhn-1)]
+    valid &= found & ~((index == 0) & (n_profile < 3))
+    first = index == 0
+    end = ~first & (index == n_profile-1)
+    # For a profile of two points index-2 is the last point, as in spline_segment
+    before2 = np.where(index-2 < 0, index-2+n_profile, index-2)
+    y0 = np.select([first & (at(index+2) < at(index)), first, end],
+                   [at(index+2), at(index+1), at(index)], at(index+1))
+    y1 = np.select([first, end & (at(index) < at(before2)), end, at(index+1) < at(index-1)],
+                   [at(index), at(before2), at(index-1), at(index-1)], at(index))
+
+    # First sample of the spline segment outside of the circle
+    limit = c_vals[:, 2]*error_margin_spline
+    delta, n_samples = _sample_grid(y0, y1, step)
+    k_found = np.full(n, -1, dtype=np.int64)
+    ap = fhn_pts[rows, np.clip(index, 0, n_fhn-1)].copy()
+    for a, b, lo, hi, has in _spline_pieces(fhn_pts, last, first_knot):
+        k_lo, k_hi = _piece_range(y0, delta, n_samples, lo, hi)
+        todo = has & (k_found < 0) & (k_lo < k_hi)
+        # Intersections of the piece with the circle, in y relative to the
+        # circle center: (e + slope*u)^2 + u^2 = limit^2
+        with np.errstate(divide='ignore', invalid='ignore'):
+            slope = (b[:, 0] - a[:, 0])/(b[:, 1] - a[:, 1])
+            e = a[:, 0] + slope*(c_fh[:, 1] - a[:, 1]) - c_fh[:, 0]
+            qa = slope**2 + 1
+            disc = (slope*e)**2 - qa*(e**2 - limit**2)
+            u2 = (-slope*e + np.sqrt(np.maximum(disc, 0)))/qa
+            k_root = np.ceil((c_fh[:, 1] + u2 - y0)/delta)
+        k_root = np.clip(np.nan_to_num(k_root, nan=-1, posinf=-1, neginf=-1), k_lo, k_hi)
+        # The first sample of the piece, or the first sample beyond the
+        # second intersection; the neighbouring samples are checked so the
+        # outcome is the same as comparing the sampled distances
+        for k in (k_lo, k_root-1, k_root, k_root+1):
+            k = np.maximum(k, k_lo)
+            ys = y0 + k*delta
+            outside_k = np.hypot(_piece_x(a, b, ys)-c_fh[:, 0], ys-c_fh[:, 1]) >= limit
+            hit = todo & (k < k_hi) & outside_k & ((k_found < 0) | (k < k_found))
+            k_found = np.where(hit, k, k_found)
+            ap = np.where(hit[:, None], np.stack([_piece_x(a, b, ys), ys], axis=-1), ap)
+
+    alpha_angle = _angle(ap, c_fh, c_n)
+    alpha_angle[~valid] = np.nan
+    return alpha_angle
+
+
+def TI_batch(fhn_pts, c_vals, c_n, na_slope, step=SPLINE_STEP):
+    """
+    This function calculates the triangular index of each row like calc_TI.
+    The sample of the spline segment closest to the line through H is solved
+    per linear piece of the spline, from the intersection of the piece with
+    the line.
+
+    Parameters
+    ----------
+    fhn_pts : array of float
+        The x- and y-coordinates of the lateral femoral head and neck points,
+        array of shape (n, n_fhn, 2).
+    c_vals : array of float
+        The x-coordinate, y-coordinate and radius of the best-fitting circle,
+        array of shape (n, 3).
+    c_n : array of float
+        The x- and y-coordinates of the femoral neck center, array of shape
+        (n, 2).
+    na_slope : array of float
+        The slope of the femoral neck axis.
+    step : float, optional
+        Step of the y-values at which the spline is sampled. The default is
+        0.01.
+
+    Returns
+    -------
+    TI : array of float
+        The triangular index, NaN if it could not be determined.
+
+    """
+    n, n_fhn = fhn_pts.shape[:2]
+    rows = np.arange(n)
+    c_fh = c_vals[:, :2]
+    last, first_knot, valid = head_neck_profiles(fhn_pts)
+    j = np.arange(n_fhn)[None, :]
+
+    # Point H and the line through H perpendicular to the neck axis
+    with np.errstate(divide='ignore', invalid='ignore'):
+        v = c_n - c_fh
+        H = c_fh + (c_vals[:, 2]*0.5)[:, None]*v/np.hypot(v[:, 0], v[:, 1])[:, None]
+        slope_h = -1/na_slope
+    intercept_h = H[:, 1] - slope_h*H[:, 0]
+    line_dist = lambda x, y: np.abs(slope_h*x - y + intercept_h)/np.sqrt(slope_h**2 + 1)
+
+    # The two profile points closest to the line
+    dist = line_dist(fhn_pts[..., 0].T, fhn_pts[..., 1].T).T
+    dist = np.where(j <= last[:, None], dist, np.inf)
+    closest = np.argsort(dist, axis=1)[:, :2]
+    y_c = fhn_pts[rows[:, None], closest, 1]
+    y0 = y_c.min(axis=1)
+    y1 = y_c.max(axis=1)
+    delta, n_samples = _sample_grid(y0, y1, step)
+    valid &= (last >= 1) & (n_samples > 0)
+
+    # Sample with the smallest distance to the line, the first one if
+    # several samples are equally close
+    best = np.full(n, np.inf)
+    best_k = np.zeros(n, dtype=np.int64)
+    S = np.full((n, 2), np.nan)
+    for a, b, lo, hi, has in _spline_pieces(fhn_pts, last, first_knot):
+        k_lo, k_hi = _piece_range(y0, delta, n_samples, lo, hi)
+        todo = has & (k_lo < k_hi)
+        # The signed distance is linear in k on the piece
+        d0 = slope_h*_piece_x(a, b, y0) - y0 + intercept_h
+        d1 = slope_h*_piece_x(a, b, y0+delta) - (y0+delta) + intercept_h
+        with np.errstate(divide='ignore', invalid='ignore'):
+            k_root = -d0/(d1 - d0)
+        k_root = np.nan_to_num(k_root, nan=0, posinf=0, neginf=0)
+        k_root = np.clip(k_root, -1, np.maximum(n_samples, 1)).astype(np.float64)
+        for k in (np.floor(k_root)-1, np.floor(k_root), np.ceil(k_root), np.ceil(k_root)+1,
+                  k_lo, k_hi-1):
+            k = np.clip(k, k_lo, np.maximum(k_hi-1, k_lo)).astype(np.int64)
+            ys = y0 + k*delta
+            xs = _piece_x(a, b, ys)
+            d = line_dist(xs, ys)
+            better = todo & ((d < best) | ((d == best) & (k < best_k)))
+            best = np.where(better, d, best)
+            best_k = np.where(better, k, best_k)
+            S = np.where(better[:, None], np.stack([xs, ys], axis=-1), S)
+
+    TI = np.hypot(S[:, 0]-c_fh[:, 0], S[:, 1]-c_fh[:, 1])
+    TI[~valid] = np.nan
+    return TI
+
+
+@instrumentation.timed()
+def measures_batch(pts, model, hip_side_right=True, error_margin_points=1.04,
+                   error_margin_spline=1):
+    """
+    This function calculates the landmark-only measures of many hips (or
+    draws) at once, with the same definitions as measure_hip. Measures for
+    which the landmark model does not declare the required landmark groups
+    are skipped.
+
+    Parameters
+    ----------
+    pts : array of float
+        The x- and y-coordinates of the landmark points, array of shape
+        (n, n_points, 2).
+    model : LandmarkModel or str
+        The landmark model of the points.
+    hip_side_right : boolean or array of bool, optional
+        The hip side of each row, True for the right hip. The default is True.
+    error_margin_points, error_margin_spline : float, optional
+        See calc_alpha_angle. The defaults are 1.04 and 1.
+
+    Returns
+    -------
+    measures : dict
+        Dictionary with the measure as key and an array of shape (n,) as
+        value, NaN where the measure could not be determined.
+
+    """
+    model = get_model(model)
+    pts = np.asarray(pts, dtype=float)
+    right = np.broadcast_to(np.asarray(hip_side_right, dtype=bool), pts.shape[:1])
+    coords = model.gather(pts)
+    measures = {}
+
+    c_vals = opt_circle_fit_batch(model.index('circle'), pts, masks=model.subset_masks)
+    c_fh = c_vals[:, :2]
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        if model.has('ln', 'mn'):
+            # The neck center is the mean of all lateral-medial midpoints,
+            # see calc_neck_axis
+            c_n = (coords['ln'].mean(axis=1) + coords['mn'].mean(axis=1))/2
+            na_slope = (c_n[:, 1] - c_fh[:, 1])/(c_n[:, 0] - c_fh[:, 0])
+            if model.has('fhn'):
+                measures['alpha_angle'] = alpha_angle_batch(coords['fhn'], c_vals, c_n,
+                                                            error_margin_points,
+                                                            error_margin_spline)
+                measures['TI'] = TI_batch(coords['fhn'], c_vals, c_n, na_slope)
+
+        if model.has('AE'):
+            p_AE = coords['AE']
+            cea = _angle(c_fh - np.array([0, 1]), c_fh, p_AE)
+            positive = np.where(right, c_fh[:, 0] > p_AE[:, 0], ~(c_fh[:, 0] < p_AE[:, 0]))
+            measures['CEA'] = np.where(positive, cea, -cea)
+        if model.has('AE', 'TC'):
+            p_H = coords['TC'] + np.where(right, -10., 10.)[:, None]*np.array([1, 0])
+            ai = _angle(coords['AE'], coords['TC'], p_H)
+            measures['AI'] = np.where(coords['AE'][:, 1] > coords['TC'][:, 1], -ai, ai)
+        if model.has('AS', 'AE', 'TD'):
+            measures['ADR'] = (perp_dist(_xy(coords['AS']), _xy(coords['AE']), _xy(coords['TD'])) /
+                               dist_2_points(_xy(coords['AE']), _xy(coords['TD'])) * 1000)
+        if model.has('lfh', 'mfh', 'AE'):
+            x_lfh = coords['lfh'][..., 0]
+            x_mfh = coords['mfh'][..., 0]
+            EI_x0 = np.where(right, x_lfh.min(axis=1), x_lfh.max(axis=1))
+            EI_x2 = np.where(right, x_mfh.max(axis=1), x_mfh.min(axis=1))
+            measures['EI'] = (coords['AE'][:, 0] - EI_x0) / (EI_x2 - EI_x0) * 100
+
+    return {key: np.where(np.isfinite(value), value, np.nan) for key, value in measures.items()}
+
+
+@instrumentation.timed()
+def landmark_uncertainty(pts, model, hip_side_right=True, n_draws=1000, sigma=1.0,
+                         percentiles=DEFAULT_PERCENTILES, seed=0, error_margin_points=1.04,
+                         error_margin_spline=1, max_memory_mb=256, return_draws=False):
+    """
+    This function determines the uncertainty of the landmark-only measures of
+    each hip under landmark placement noise, see the module docstring.
+
+    Parameters
+    ----------
+    pts : array of float
+        The x- and y-coordinates of the landmark points of the hips, array of
+        shape (n_hips, n_points, 2), e.g. HipLandmarks.coords.
+    model : LandmarkModel or str
+        The landmark model of the points.
+    hip_side_right : boolean or array of bool, optional
+        The hip side of each hip, True for the right hip. The default is True.
+    n_draws : int, optional
+        Number of draws per hip. The default is 1000.
+    sigma : float or array of float, optional
+        Standard deviation of the landmark placement in pixels, see
+        jitter_landmarks. The default is 1.0.
+    percentiles : tuple of float, optional
+        Percentiles of each measure over the draws. The default is (2.5, 50,
+        97.5), the median and the 95% interval.
+    seed : int, optional
+        Seed of the random numbers. The default is 0.
+    error_margin_points, error_margin_spline : float, optional
+        See calc_alpha_angle. The defaults are 1.04 and 1.
+    max_memory_mb : float, optional
+        Memory budget of the jittered landmark points of a chunk of draws in
+        MB. The default is 256.
+    return_draws : boolean, optional
+        Indicates whether the measures of all draws are returned. The default
+        is False.
+
+    Returns
+    -------
+    result : dict
+        Dictionary with:
+            - 'percentiles': the percentiles
+            - 'measures': per measure the measure at the given landmarks,
+              array of shape (n_hips,)
+            - 'quantiles': per measure the percentiles over the draws, array
+              of shape (n_hips, n_percentiles), NaN if no draw gave a value
+            - 'n_valid': per measure the number of draws which gave a value,
+              array of shape (n_hips,)
+            - 'draws': per measure the values of all draws, array of shape
+              (n_hips, n_draws), only if return_draws is True
+
+    """
+    model = get_model(model)
+    pts = np.asarray(pts, dtype=float)
+    n_hips, n_points = pts.shape[:2]
+    right = np.broadcast_to(np.asarray(hip_side_right, dtype=bool), (n_hips,))
+    measures = measures_batch(pts, model, right, error_margin_points, error_margin_spline)
+
+    # Number of draws per chunk within the memory budget
+    bytes_per_draw = n_hips*n_points*2*8*_VALUES_PER_COORD
+    chunk = int(min(max(max_memory_mb*2**20 // bytes_per_draw, 1), max(n_draws, 1)))
+    draws = {key: np.full((n_hips, n_draws), np.nan) for key in measures}
+    for start in range(0, n_draws, chunk):
+        stop = min(start+chunk, n_draws)
+        jittered = jitter_landmarks(pts, stop-start, sigma, seed, start)
+        values = measures_batch(jittered.reshape((-1, n_points, 2)), model,
+                                np.repeat(right, stop-start), error_margin_points,
+                                error_margin_spline)
+        for key, value in values.items():
+            draws[key][:, start:stop] = value.reshape(n_hips, stop-start)
+        instrumentation.count('uncertainty_draws', n_hips*(stop-start))
+
+    result = {'percentiles': tuple(percentiles), 'measures': measures, 'quantiles': {},
+              'n_valid': {}}
+    for key, value in draws.items():
+        n_valid = np.sum(~np.isnan(value), axis=1)
+        quantiles = np.full((n_hips, len(percentiles)), np.nan)
+        if np.any(n_valid > 0):
+            quantiles[n_valid > 0] = np.nanpercentile(value[n_valid > 0], percentiles, axis=1).T
+        result['quantiles'][key] = quantiles
+        result['n_valid'][key] = n_valid
+    if return_draws is True:
+        result['draws'] = draws
+
+    return result
+
+
+def compare_measure_hip(pts, model, hip_side_right=True, error_margin_points=1.04,
+                        error_margin_spline=1):
+    """
+    This function compares measures_batch with measure_hip for a batch of
+    landmark points, e.g. a set of draws, to check the batched measures.
+    Rows for which measure_hip fails are skipped.
+
+    Returns
+    -------
+    max_diff : dict
+        Per measure the largest absolute difference, over the rows for which
+        both give a value.
+    mismatch : dict
+        Per measure the number of rows for which only one of both gives a
+        value.
+
+    """
+    from measure_hip import measure_hip
+
+    model = get_model(model)
+    pts = np.asarray(pts, dtype=float)
+    right = np.broadcast_to(np.asarray(hip_side_right, dtype=bool), pts.shape[:1])
+    batch = measures_batch(pts, model, right, error_margin_points, error_margin_spline)
+    max_diff = {key: 0.0 for key in batch}
+    mismatch = {key: 0 for key in batch}
+    for i in range(len(pts)):
+        try:
+            scalar = measure_hip(pts[i], model, bool(right[i]),
+                                 error_margin_points=error_margin_points,
+                                 error_margin_spline=error_margin_spline)
+        except Exception:
+            continue
+        for key in batch:
+            value = scalar.get(key, 'NaN')
+            value = np.nan if value == 'NaN' else float(value)
+            if np.isnan(value) != np.isnan(batch[key][i]):
+                mismatch[key] += 1
+            elif not np.isnan(value):
+                max_diff[key] = max(max_diff[key], abs(value - batch[key][i]))
+
+    return max_diff, mismatch
@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Mon Oct 19 10:41:52 2026
+
+Lazy imports of the heavy dependencies (matplotlib, pydicom, scikit-image
+and scipy). The modules are only imported when they are used for the first
+time, so landmark-only jobs do not pay their import time.
+
+@author: Fleur Boel, f.boel@erasmusmc.nl
+"""
+
+import os
+import sys
+import types
+import importlib
+
+
+class LazyModule(types.ModuleType):
+    """
+    Placeholder for a module which is imported on first attribute access.
+
+    Parameters
+    ----------
+    name : str
+        Full name of the module, e.g. 'matplotlib.pyplot'.
+    setup : function, optional
+        Function which is called once before the module is imported. The
+        default is None.
+    """
+
+    def __init__(self, name, setup=None):
+        super().__init__(name)
+        self._lazy_setup = setup
+        self._lazy_module = None
+
+    def _lazy_load(self):
+        if self._lazy_module is None:
+            if self._lazy_setup is not None:
+                self._lazy_setup()
+            self._lazy_module = importlib.import_module(self.__name__)
+        return self._lazy_module
+
+    def __getattr__(self, attr):
+        return getattr(self._lazy_load(), attr)
+
+    def __dir__(self):
+        return dir(self._lazy_load())
+
+
+def lazy_import(name, setup=None):
+    """
+    This function returns the module if it is already imported, otherwise a
+    placeholder is returned which imports the module on first use.
+
+    Parameters
+    ----------
+    name : str
+        Full name of the module, e.g. 'matplotlib.pyplot'.
+    setup : function, optional
+        Function which is called once before the module is imported. The
+        default is None.
+
+    Returns
+    -------
+    module : module or LazyModule
+        The (placeholder of the) module.
+
+    """
+    if name in sys.modules:
+        return sys.modules[name]
+    return LazyModule(name, setup)
+
+
+def headless_backend():
+    """
+    This function selects the non-interactive Agg backend of matplotlib if no
+    display is available and no backend is chosen by the user (MPLBACKEND),
+    e.g. in worker processes on a server. On Windows and macOS the default
+    backend is kept.
+
+    """
+    if 'MPLBACKEND' in os.environ or 'matplotlib.pyplot' in sys.modules:
+        return
+    if sys.platform.startswith('linux') is False:
+        return
+    if os.environ.get('DISPLAY') or os.environ.get('WAYLAND_DISPLAY'):
+        return
+    import matplotlib
+    matplotlib.use('Agg')
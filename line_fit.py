@@ -0,0 +1,239 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sat Oct 24 13:05:52 2026
+
+Robust fitting of the shaft axis through the shaft midpoints. The shaft is
+close to vertical, so the line is fitted as x = a*y + b (which is well
+conditioned) and converted to the slope and intercept of y = slope*x +
+intercept used by calc_NSA and plot_NSA. The outliers are handled by the
+estimator instead of a threshold relative to the mean x-coordinate, which
+depends on where the femur lies in the image:
+    - 'theil-sen': median of the slopes of the point pairs which lie half
+      the number of points apart (sorted on y), and median of the residual
+      intercepts
+    - 'ransac': lines through a fixed number of random point pairs, the
+      least-squares fit of x on y through the inliers of the line with the
+      most inliers
+All functions work on a batch of point sets (e.g. several hips or several
+Otsu parameters) at once, padded with NaN.
+
+@author: Fleur Boel, f.boel@erasmusmc.nl
+"""
+
+import numpy as np
+
+FIT_METHODS = ('polyfit', 'theil-sen', 'ransac')
+
+# Smallest absolute value of a, so the slope of a vertical line is finite
+MIN_A = 1e-12
+
+
+def pad_points(point_sets):
+    """
+    This function stacks point sets of different lengths, each sorted on the
+    y-coordinate, into arrays padded with NaN.
+
+    Parameters
+    ----------
+    point_sets : list
+        The x- and y-coordinates of the points of each set, 2D arrays.
+
+    Returns
+    -------
+    X : array of float
+        The x-coordinates, array of shape (n_sets, max_points).
+    Y : array of float
+        The y-coordinates, same shape as X.
+    n : array of int
+        The number of points of each set.
+
+    """
+    n = np.array([len(pts) for pts in point_sets], dtype=np.intp)
+    X = np.full((len(point_sets), max(n.max(initial=0), 1)), np.nan)
+    Y = np.full_like(X, np.nan)
+    for k, pts in enumerate(point_sets):
+        if n[k] > 0:
+            pts = np.asarray(pts, dtype=float)
+            order = np.argsort(pts[:,1], kind='stable')
+            X[k, :n[k]] = pts[order, 0]
+            Y[k, :n[k]] = pts[order, 1]
+    return X, Y, n
+
+
+def theil_sen_batch(X, Y, n):
+    """
+    This function fits x = a*y + b with the Theil-Sen estimator for each row
+    of a batch (see pad_points). The slope a is the median of the slopes of
+    the pairs (i, i+n//2).
+
+    Returns
+    -------
+    a : array of float
+        The slope of x as a function of y for each row, NaN if the row has
+        less than 2 points.
+    b : array of float
+        The intercept of x as a function of y for each row.
+
+    """
+    half = n//2
+    i = np.arange(X.shape[1])[None, :]
+    j = np.minimum(i + half[:, None], X.shape[1]-1)
+    valid = i < (n - half)[:, None]
+    rows = np.arange(X.shape[0])[:, None]
+    dx = X[rows, j] - X
+    dy = Y[rows, j] - Y
+    valid &= dy != 0
+    with np.errstate(divide='ignore', invalid='ignore'):
+        slopes = np.where(valid, dx/dy, np.nan)
+    a = _nanmedian(slopes)
+    b = _nanmedian(X - a[:, None]*Y)
+    return a, b
+
+
+def ransac_batch(X, Y, n, n_iter=200, threshold=2.0, seed=0):
+    """
+    This function fits x = a*y + b with RANSAC for each row of a batch (see
+    pad_points). The same random numbers are used for each row, so the
+    result of a row does not depend on the other rows of the batch.
+
+    Parameters
+    ----------
+    X, Y, n
+        See pad_points.
+    n_iter : int, optional
+        Number of random point pairs. The default is 200.
+    threshold : float, optional
+        Maximum distance in x of an inlier to the line in pixels. The default
+        is 2.0.
+    seed : int, optional
+        Seed of the random numbers. The default is 0.
+
+    Returns
+    -------
+    a : array of float
+        The slope of x as a function of y for each row, NaN if the row has
+        less than 2 points.
+    b : array of float
+        The intercept of x as a function of y for each row.
+
+    """
+    rng = np.random.default_rng(seed)
+    u = rng.random((n_iter, 2))
+    rows = np.arange(X.shape[0])[:, None]
+    p = np.minimum((u[None, :, 0]*n[:, None]).astype(np.intp), np.maximum(n[:, None]-1, 0))
+    q = np.minimum((u[None, :, 1]*n[:, None]).astype(np.intp), np.maximum(n[:, None]-1, 0))
+    dy = Y[rows, q] - Y[rows, p]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        a_c = (X[rows, q] - X[rows, p]) / dy
+    b_c = X[rows, p] - a_c*Y[rows, p]
+
+    # Number of inliers of each candidate line, in chunks of candidates
+    n_inliers = np.zeros(a_c.shape, dtype=np.intp)
+    chunk = max(1, 2**22 // max(X.size, 1))
+    for start in range(0, n_iter, chunk):
+        stop = start + chunk
+        with np.errstate(invalid='ignore'):
+            resid = np.abs(X[:, None, :] - a_c[:, start:stop, None]*Y[:, None, :]
+                           - b_c[:, start:stop, None])
+        n_inliers[:, start:stop] = np.sum(resid <= threshold, axis=2)
+    n_inliers[~(dy != 0)] = -1
+    best = np.argmax(n_inliers, axis=1)
+
+    # Least-squares fit of x on y through the inliers of the best line
+    with np.errstate(invalid='ignore'):
+        resid = np.abs(X - a_c[rows[:, 0], best][:, None]*Y - b_c[rows[:, 0], best][:, None])
+    w = (resid <= threshold).astype(float)
+    n_w = w.sum(axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean_x = np.nansum(w*X, axis=1)/n_w
+        mean_y = np.nansum(w*Y, axis=1)/n_w
+        dev_y = np.where(w > 0, Y - mean_y[:, None], 0)
+        dev_x = np.where(w > 0, X - mean_x[:, None], 0)
+        a = np.sum(dev_x*dev_y, axis=1)/np.sum(dev_y**2, axis=1)
+    b = mean_x - a*mean_y
+    a[n < 2] = np.nan
+    b[n < 2] = np.nan
+    return a, b
+
+
+def _nanmedian(values):
+    # Median of each row ignoring NaN, NaN for rows without values
+    valid = ~np.isnan(values)
+    result = np.full(values.shape[0], np.nan)
+    has = valid.any(axis=1)
+    if has.any():
+        result[has] = np.nanmedian(values[has], axis=1)
+    return result
+
+
+def to_slope_intercept(a, b):
+    """
+    This function converts lines x = a*y + b to y = slope*x + intercept.
+
+    """
+    a = np.where(np.abs(a) < MIN_A, np.copysign(MIN_A, a), a)
+    return 1/a, -b/a
+
+
+def fit_shaft_lines(point_sets, method='theil-sen', **kwargs):
+    """
+    This function fits the shaft axis through several sets of midpoints at
+    once with a robust estimator.
+
+    Parameters
+    ----------
+    point_sets : list
+        The x- and y-coordinates of the midpoints of each set, 2D arrays.
+    method : str, optional
+        'theil-sen' or 'ransac'. The default is 'theil-sen'.
+    **kwargs
+        Further keyword arguments of ransac_batch.
+
+    Returns
+    -------
+    slopes : array of float
+        The slope of each shaft axis, NaN if it could not be fitted.
+    intercepts : array of float
+        The intercept of each shaft axis, NaN if it could not be fitted.
+
+    """
+    X, Y, n = pad_points(point_sets)
+    if method == 'theil-sen':
+        a, b = theil_sen_batch(X, Y, n)
+    elif method == 'ransac':
+        a, b = ransac_batch(X, Y, n, **kwargs)
+    else:
+        raise ValueError('Unknown line fit method {}, choose from {}'.format(method, FIT_METHODS[1:]))
+    return to_slope_intercept(a, b)
+
+
+def fit_shaft_line(midpoints, method='polyfit', **kwargs):
+    """
+    This function fits the shaft axis through the midpoints, with np.polyfit
+    of y on x (method 'polyfit', as before) or with a robust estimator (see
+    fit_shaft_lines).
+
+    Parameters
+    ----------
+    midpoints : array of float
+        The x- and y-coordinates of the midpoints, 2D array.
+    method : str, optional
+        'polyfit', 'theil-sen' or 'ransac'. The default is 'polyfit'.
+
+    Returns
+    -------
+    sa_slope : float
+        The slope of the shaft axis, 'NaN' if it could not be fitted.
+    sa_intercept : float
+        The intercept of the shaft axis, 'NaN' if it could not be fitted.
+
+    """
+    if method == 'polyfit':
+        if len(midpoints) < 2:
+            return 'NaN', 'NaN'
+        [sa_slope, sa_intercept] = np.polyfit(midpoints[:,0], midpoints[:,1], 1)
+        return sa_slope, sa_intercept
+    slopes, intercepts = fit_shaft_lines([midpoints], method, **kwargs)
+    if np.isnan(slopes[0]):
+        return 'NaN', 'NaN'
+    return float(slopes[0]), float(intercepts[0])
@@ -6,9 +6,13 @@ Created on Fri Jun 18 15:55:22 2021
 """
 
 
+import os
 import numpy as np
-import matplotlib.pyplot as plt
-import pydicom
+import instrumentation
+from lazy_imports import lazy_import, headless_backend
+
+plt = lazy_import('matplotlib.pyplot', setup=headless_backend)
+pydicom = lazy_import('pydicom')
 
 def load_point_data(filepath):
     """
@@ -29,18 +33,19 @@ def load_point_data(filepath):
         The x- and y-coordinates of all the landmark points, 2D array
 
     """
-    # Get number of points from file
-    NoP = np.loadtxt(filepath, skiprows=1, max_rows=1, usecols=(1))
-    NoP = np.int(NoP)
-    
-    with open(filepath, 'r') as fr:
-        lines = fr.readlines()
-    NoP_check = len(lines[3:len(lines)-1])
-    
-    if NoP == NoP_check:
-        # Load data, skip first 3 rows, since these don't contain point coordinates
-        point_data = np.loadtxt(filepath, skiprows=3, max_rows=NoP)
-    else: point_data = []; print('NoP incorrect {}'.format(filepath))
+    with instrumentation.stage('load_point_data', os.path.getsize(filepath)):
+        # Get number of points from file
+        NoP = np.loadtxt(filepath, skiprows=1, max_rows=1, usecols=(1))
+        NoP = int(NoP)
+        
+        with open(filepath, 'r') as fr:
+            lines = fr.readlines()
+        NoP_check = len(lines[3:len(lines)-1])
+        
+        if NoP == NoP_check:
+            # Load data, skip first 3 rows, since these don't contain point coordinates
+            point_data = np.loadtxt(filepath, skiprows=3, max_rows=NoP)
+        else: point_data = []; print('NoP incorrect {}'.format(filepath))
     
     return point_data
 
@@ -66,17 +71,18 @@ def load_image(filepath):
 
     """
     
-    if filepath[-3:len(filepath)] == 'dcm' or filepath[-3:len(filepath)] == 'DCM':
-        dcm_img = pydicom.dcmread(filepath)
-        img = dcm_img.pixel_array
-        if hasattr(dcm_img, "PixelSpacing") is True:
-            spacing = dcm_img.PixelSpacing[0]
-        else: spacing = 0
-    else: 
-        img = plt.imread(filepath)
-        if np.ndim(img) == 3:
-            img = img[:,:,0]
-        spacing = 0
+    with instrumentation.stage('load_image', os.path.getsize(filepath)):
+        if filepath[-3:len(filepath)] == 'dcm' or filepath[-3:len(filepath)] == 'DCM':
+            dcm_img = pydicom.dcmread(filepath)
+            img = dcm_img.pixel_array
+            if hasattr(dcm_img, "PixelSpacing") is True:
+                spacing = dcm_img.PixelSpacing[0]
+            else: spacing = 0
+        else: 
+            img = plt.imread(filepath)
+            if np.ndim(img) == 3:
+                img = img[:,:,0]
+            spacing = 0
     
         
     return img, spacing
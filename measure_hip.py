@@ -0,0 +1,340 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Tue Oct 20 09:20:14 2026
+
+Run all measurements for one hip, or for both hips of a scan, using the
+landmark indices of a landmark model.
+
+@author: Fleur Boel, f.boel@erasmusmc.nl
+"""
+
+import os
+import numpy as np
+import instrumentation
+from profiling_hooks import profile_hip
+from landmark_models import get_model
+from opt_circle_fit import opt_circle_fit
+from calc_neck_axis import calc_neck_axis
+from head_neck_profile import HeadNeckProfile
+from calc_alpha_angle import calc_alpha_angle
+from calc_TI import calc_TI
+from calc_CEA import calc_CEA
+from calc_AI import calc_AI
+from calc_ADR import calc_ADR
+from calc_EI import calc_EI
+from calc_HRLP import calc_HRLP
+from calc_NSA import calc_NSA
+from calc_shaft_axis import calc_shaft_axis
+from calc_shaft_axis_pelvic import calc_shaft_axis_pelvic
+from shaft_multires import calc_shaft_axis_multires
+from shaft_streaming import calc_shaft_axis_streaming
+from shaft_window import plan_shaft_window
+from shared_images import as_image
+from plot_alpha_angle import plot_alpha_angle
+from plot_TI import plot_TI
+from plot_CEA import plot_CEA
+from plot_AI import plot_AI
+from plot_ADR import plot_ADR
+from plot_EI import plot_EI
+from plot_NSA import plot_NSA
+
+# Measures reported for each hip
+MEASURES = ['alpha_angle', 'TI', 'CEA', 'AI', 'ADR', 'EI', 'NSA']
+
+# Landmark groups on which each measure depends. The radius of the
+# best-fitting circle bounds the shaft crop, so the NSA depends on the circle.
+MEASURE_GROUPS = {'alpha_angle': ('circle', 'ln', 'mn', 'fhn'),
+                  'TI': ('circle', 'ln', 'mn', 'fhn'),
+                  'CEA': ('circle', 'AE'),
+                  'AI': ('AE', 'TC'),
+                  'ADR': ('AS', 'AE', 'TD'),
+                  'EI': ('lfh', 'mfh', 'AE'),
+                  'NSA': ('circle', 'ln', 'mn', 'TMI', 'IC')}
+
+
+def _to_builtin(value):
+    # Convert numpy scalars to Python scalars, so results can be stored as JSON
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+def measure_hip(pts, model, hip_side_right=True, img=None, name=None,
+                angle_HRLP=None, outputfolder=None, shaft_method='full', shaft_window=False,
+                error_margin_points=1.04, error_margin_spline=1,
+                otsu_levels=3, otsu_thres=1, otsu_bins=None, shaft_fit='polyfit', c_vals=None,
+                only=None):
+    """
+    This function calculates all measures for a single hip. Measures for
+    which the landmark model does not declare the required landmark groups
+    are skipped. The neck-shaft angle is only determined if an image is given.
+
+    Parameters
+    ----------
+    pts : array of float
+        The x- and y-coordinates of all the landmark points of the hip, 2D array.
+    model : LandmarkModel or str
+        The landmark model of the points.
+    hip_side_right : boolean, optional
+        Indicates the hip side, True for the right hip. The default is True.
+    img : array of float or dict, optional
+        Matrix containing the image pixel array, or the handle of a shared
+        image. The default is None.
+    name : str, optional
+        Name of the image, used for messages and file names. The default is None.
+    angle_HRLP : float, optional
+        The angle of the horizontal reference line of the pelvis in degrees,
+        used for the plots. The default is None, in which case 0 is used.
+    outputfolder : WindowsPath, optional
+        Folder where the plots are saved. The default is None, in which case
+        no plots are made.
+    shaft_method : str, optional
+        'full' to use calc_shaft_axis, 'pelvic' to use calc_shaft_axis_pelvic,
+        'multires' to use calc_shaft_axis_multires (for large images) or
+        'streaming' to use calc_shaft_axis_streaming (for long or
+        memory-mapped images). The default is 'full'.
+    shaft_window : boolean, optional
+        Indicates whether the shaft crop is limited to the columns around
+        the femoral shaft, see shaft_window. The window changes the NSA and
+        can cut off the cortex of a wide or displaced shaft, so the default
+        is False (the full image width).
+    error_margin_points : float, optional
+        See calc_alpha_angle. The default is 1.04.
+    error_margin_spline : float, optional
+        See calc_alpha_angle. The default is 1.
+    otsu_levels : int, optional
+        See calc_shaft_axis. The default is 3.
+    otsu_thres : int, optional
+        See calc_shaft_axis. The default is 1.
+    otsu_bins : int, optional
+        See calc_shaft_axis. The default is None.
+    shaft_fit : str, optional
+        Line fit method of the shaft axis, 'polyfit', 'theil-sen' or 'ransac'
+        (see calc_shaft_axis). The streaming method only supports
+        'polyfit'. The default is 'polyfit'.
+    c_vals : list, optional
+        The x-coordinate, y-coordinate and radius of the best-fitting circle,
+        e.g. from opt_circle_fit_batch. The default is None, in which case
+        the circle is fitted with opt_circle_fit.
+    only : list, optional
+        Only these measures (see MEASURES) are calculated, e.g. the measures
+        whose landmark groups changed (see incremental). The best-fitting
+        circle is always determined. The default is None, in which case all
+        measures are calculated.
+
+    Returns
+    -------
+    measures : dict
+        Dictionary containing the measures, the best-fitting circle (c_x,
+        c_y, r) and the paths of the saved plots (figures).
+
+    """
+    if shaft_method == 'streaming' and shaft_fit != 'polyfit':
+        raise ValueError("shaft_method 'streaming' only supports shaft_fit 'polyfit', not {}".format(shaft_fit))
+    model = get_model(model)
+    pts = np.asarray(pts, dtype=float)
+    coords = model.gather(pts)
+    side = 'R' if hip_side_right is True else 'L'
+    tag = '{}_{}'.format(name, side)
+    plot = outputfolder is not None and img is not None
+    if angle_HRLP is None or angle_HRLP == 'NaN':
+        angle_HRLP = 0
+    wanted = MEASURES if only is None else only
+    measures = {}
+    figures = []
+
+    # Best-fitting circle around the femoral head
+    if c_vals is None:
+        c_vals, c_val_pts = opt_circle_fit(model.index('circle'), pts, masks=model.subset_masks)
+    else: c_vals = list(np.asarray(c_vals, dtype=float))
+    measures['c_x'], measures['c_y'], measures['r'] = c_vals
+    c_fh = np.array([c_vals[0], c_vals[1]])
+
+    # Neck axis, alpha angle and triangular index
+    if model.has('ln', 'mn'):
+        c_n, na_slope, na_intercept = calc_neck_axis(coords['ln'], coords['mn'], c_fh)
+        if model.has('fhn') and ('alpha_angle' in wanted or 'TI' in wanted):
+            # The head-neck spline is built once for both measures
+            profile = HeadNeckProfile(coords['fhn'])
+            if 'alpha_angle' in wanted:
+                alpha_angle, ap = calc_alpha_angle(coords['fhn'], c_vals, c_n,
+                                                   error_margin_points, error_margin_spline,
+                                                   profile=profile)
+                measures['alpha_angle'] = alpha_angle
+                if plot is True and alpha_angle != 'NaN':
+                    plot_alpha_angle(img, ap, c_n, c_vals, na_slope, na_intercept,
+                                     tag, outputfolder)
+                    figures.append(tag+'_Alpha_angle.png')
+            if 'TI' in wanted:
+                TI, H, S = calc_TI(coords['fhn'], c_n, c_vals, na_slope, profile=profile)
+                measures['TI'] = TI
+                if plot is True:
+                    plot_TI(img, H, S, na_slope, na_intercept, c_vals, tag, outputfolder)
+                    figures.append(tag+'_TI.png')
+
+    # Acetabular measures
+    if model.has('AE') and 'CEA' in wanted:
+        measures['CEA'] = calc_CEA(c_vals[0], c_vals[1], coords['AE'], hip_side_right)
+        if plot is True:
+            plot_CEA(img, c_vals, coords['AE'], angle_HRLP, tag, outputfolder)
+            figures.append(tag+'_CEA.png')
+    if model.has('AE', 'TC') and 'AI' in wanted:
+        measures['AI'] = calc_AI(coords['AE'], coords['TC'], hip_side_right=hip_side_right)
+        if plot is True:
+            plot_AI(img, coords['AE'], coords['TC'], angle_HRLP, tag, outputfolder)
+            figures.append(tag+'_AI.png')
+    if model.has('AS', 'AE', 'TD') and 'ADR' in wanted:
+        measures['ADR'] = calc_ADR(coords['AS'], coords['AE'], coords['TD'])
+        if plot is True:
+            plot_ADR(img, coords['AS'], coords['AE'], coords['TD'], tag, outputfolder)
+            figures.append(tag+'_ADR.png')
+    if model.has('lfh', 'mfh', 'AE') and 'EI' in wanted:
+        EI, EI_x0, EI_x1, EI_x2 = calc_EI(model.index('lfh'), model.index('mfh'),
+                                          coords['AE'], pts, hip_side_right)
+        measures['EI'] = EI
+        if plot is True:
+            plot_EI(img, EI_x0, EI_x1, EI_x2, c_vals, tag, outputfolder)
+            figures.append(tag+'_EI.png')
+
+    # Neck-shaft angle, which needs the shaft axis from the image
+    if img is not None and model.has('TMI', 'ln', 'mn') and 'NSA' in wanted:
+        pelvic = shaft_method == 'pelvic' and model.has('IC')
+        window = None
+        if shaft_window is True:
+            window = plan_shaft_window(np.shape(as_image(img)), coords['TMI'], c_vals[2],
+                                       hip_side_right, coords['IC'] if pelvic else None)
+        if pelvic is True:
+            sa_slope, sa_intercept = calc_shaft_axis_pelvic(img, coords['TMI'], coords['IC'],
+                                                            otsu_levels, otsu_thres,
+                                                            hip_side_right,
+                                                            otsu_bins=otsu_bins, window=window,
+                                                            fit_method=shaft_fit)
+        elif shaft_method == 'multires':
+            sa_slope, sa_intercept = calc_shaft_axis_multires(img, coords['TMI'], c_vals[2], tag,
+                                                              otsu_levels, otsu_thres,
+                                                              otsu_bins=otsu_bins, window=window,
+                                                              fit_method=shaft_fit)
+        elif shaft_method == 'streaming':
+            sa_slope, sa_intercept = calc_shaft_axis_streaming(img, coords['TMI'], c_vals[2], tag,
+                                                               otsu_levels, otsu_thres,
+                                                               otsu_bins=otsu_bins, window=window)
+        else:
+            sa_slope, sa_intercept = calc_shaft_axis(img, coords['TMI'], c_vals[2], tag,
+                                                     otsu_levels, otsu_thres,
+                                                     otsu_bins=otsu_bins, window=window,
+                                                     fit_method=shaft_fit)
+        if sa_slope != 'NaN':
+            measures['NSA'] = calc_NSA(sa_slope, na_slope)
+            if plot is True:
+                plot_NSA(img, sa_slope, sa_intercept, na_slope, na_intercept,
+                         tag, outputfolder)
+                figures.append(tag+'_NSA.png')
+        else: measures['NSA'] = 'NaN'
+
+    measures = {key: _to_builtin(value) for key, value in measures.items()}
+    measures['figures'] = [os.path.join(outputfolder, f) for f in figures]
+
+    return measures
+
+
+def scan_hrlp(pts_data_L, pts_data_R, model, name=None):
+    """
+    This function determines the horizontal reference line of the pelvis
+    (HRLP) of a scan, based on the io points of both hips.
+
+    Parameters
+    ----------
+    pts_data_L : array of float
+        Landmark points of the _L points file (RIGHT hip), 2D array.
+    pts_data_R : array of float
+        Landmark points of the _R points file (LEFT hip), 2D array.
+    model : LandmarkModel or str
+        The landmark model of the points.
+    name : str, optional
+        Name of the image, used for messages. The default is None.
+
+    Returns
+    -------
+    angle_HRLP : float
+        The angle of the HRLP in degrees, the string "NaN" if it could not be
+        determined.
+
+    """
+    model = get_model(model)
+    angle_HRLP = 'NaN'
+    if model.has('io'):
+        try:
+            angle_HRLP = _to_builtin(calc_HRLP(model.index('io'), pts_data_R, pts_data_L))
+        except Exception as e:
+            print('HRLP could not be determined for {}: {}'.format(name, e))
+
+    return angle_HRLP
+
+
+def measure_hip_record(pts, model, hip_side_right=True, img=None, name=None,
+                       angle_HRLP=None, **kwargs):
+    """
+    This function calculates all measures for a single hip, see measure_hip,
+    and returns them as a result record. If the measurements fail, the
+    record has the status 'failed' and contains the error message.
+
+    Returns
+    -------
+    record : dict
+        Result record with image, side, status, error and measures.
+
+    """
+    side = 'R' if hip_side_right is True else 'L'
+    record = {'image': name, 'side': side, 'status': 'ok', 'error': ''}
+    with instrumentation.stage('measure_hip'), profile_hip(name, side):
+        try:
+            record['measures'] = measure_hip(pts, model, hip_side_right, img, name,
+                                             angle_HRLP, **kwargs)
+            record['measures']['HRLP'] = 'NaN' if angle_HRLP is None else angle_HRLP
+        except Exception as e:
+            print('Measurements failed for {} ({}): {!r}'.format(name, side, e))
+            record['status'] = 'failed'
+            record['error'] = repr(e)
+            record['measures'] = {}
+
+    return record
+
+
+def measure_scan(pts_data_L, pts_data_R, model, img=None, name=None, **kwargs):
+    """
+    This function calculates all measures for both hips of a scan. Please
+    note that due to the naming convention of BoneFinder, the _L points
+    belong to the RIGHT hip and the _R points belong to the LEFT hip.
+    A hip for which the measurements fail is recorded with the status
+    'failed' and the error message.
+
+    Parameters
+    ----------
+    pts_data_L : array of float
+        Landmark points of the _L points file (RIGHT hip), 2D array.
+    pts_data_R : array of float
+        Landmark points of the _R points file (LEFT hip), 2D array.
+    model : LandmarkModel or str
+        The landmark model of the points.
+    img : array of float or dict, optional
+        Matrix containing the image pixel array, or the handle of a shared
+        image. The default is None.
+    name : str, optional
+        Name of the image. The default is None.
+    **kwargs
+        Further keyword arguments passed to measure_hip.
+
+    Returns
+    -------
+    records : list
+        List with a result record (dict with image, side, status, error and
+        measures) for the right and the left hip.
+
+    """
+    model = get_model(model)
+    angle_HRLP = scan_hrlp(pts_data_L, pts_data_R, model, name)
+
+    records = [measure_hip_record(pts_data_L, model, True, img, name, angle_HRLP, **kwargs),
+               measure_hip_record(pts_data_R, model, False, img, name, angle_HRLP, **kwargs)]
+
+    return records
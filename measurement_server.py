@@ -0,0 +1,388 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Thu Oct 22 09:37:15 2026
+
+Local HTTP measurement server for interactive tools. The server is started
+once, so the Python start-up and the imports of matplotlib, scikit-image
+and pydicom are only paid once, and the worker processes for scans with an
+image are kept warm. Concurrent requests are collected into micro-batches:
+the best-fitting circles of all hips in a batch are fitted in one
+vectorized call (opt_circle_fit_batch) before the other measures are
+calculated.
+
+Endpoints (JSON):
+    POST /measure   {"name": str, "pts_L": [[x, y], ...], "pts_R": [[x, y], ...],
+                     "image": optional file path of the image}
+                    returns {"name": str, "records": [...], "latency_ms": float}
+    GET  /metrics   latency percentiles, throughput and batch sizes
+    GET  /health    {"status": "ok"}
+
+Please note that due to the naming convention of BoneFinder, the _L points
+belong to the RIGHT hip and the _R points belong to the LEFT hip.
+
+Usage: python measurement_server.py modelfile [port]
+
+@author: Fleur Boel, f.boel@erasmusmc.nl
+"""
+
+import os
+import sys
+import json
+import time
+import queue
+import threading
+import collections
+from concurrent.futures import Future
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+import numpy as np
+from landmark_models import get_model, load_model_file
+from load_files import load_image
+from opt_circle_fit import opt_circle_fit_batch
+from measure_hip import scan_hrlp, measure_hip_record
+from async_pipeline import make_executor, warm_executor
+
+
+def measure_request(pts_L, pts_R, model, name=None, img=None, c_vals_L=None,
+                    c_vals_R=None, options=None):
+    """
+    This function measures both hips of one request. It is run in the server
+    for landmark-only requests and in a warm worker process for requests
+    with an image.
+
+    Parameters
+    ----------
+    pts_L : array of float
+        Landmark points of the _L points file (RIGHT hip), None if not given.
+    pts_R : array of float
+        Landmark points of the _R points file (LEFT hip), None if not given.
+    model : LandmarkModel
+        The landmark model of the points.
+    name : str, optional
+        Name of the scan. The default is None.
+    img : str, optional
+        File path of the image, which is loaded in the worker. The default is
+        None.
+    c_vals_L, c_vals_R : list, optional
+        Best-fitting circles of the hips from the batched circle fit. The
+        default is None.
+    options : dict, optional
+        Further keyword arguments passed to measure_hip. The default is None.
+
+    Returns
+    -------
+    records : list
+        Result records of the given hips.
+
+    """
+    if options is None:
+        options = {}
+    if img is not None:
+        img, spacing = load_image(img)
+    angle_HRLP = 'NaN'
+    if pts_L is not None and pts_R is not None:
+        angle_HRLP = scan_hrlp(pts_L, pts_R, model, name)
+    records = []
+    if pts_L is not None:
+        records.append(measure_hip_record(pts_L, model, True, img, name, angle_HRLP,
+                                          c_vals=c_vals_L, **options))
+    if pts_R is not None:
+        records.append(measure_hip_record(pts_R, model, False, img, name, angle_HRLP,
+                                          c_vals=c_vals_R, **options))
+    return records
+
+
+class _Metrics:
+    # Latency, throughput and batch size of the served requests
+    def __init__(self, window=1000):
+        self.started = time.time()
+        self.n_requests = 0
+        self.n_errors = 0
+        self.n_batches = 0
+        self.latencies = collections.deque(maxlen=window)
+        self.finished = collections.deque(maxlen=window)
+        self.batch_sizes = collections.deque(maxlen=window)
+        self.lock = threading.Lock()
+
+    def add_request(self, latency, error=False):
+        with self.lock:
+            self.n_requests += 1
+            self.n_errors += int(error)
+            self.latencies.append(latency)
+            self.finished.append(time.time())
+
+    def add_batch(self, size):
+        with self.lock:
+            self.n_batches += 1
+            self.batch_sizes.append(size)
+
+    def summary(self):
+        with self.lock:
+            latencies = np.array(self.latencies) * 1000
+            finished = np.array(self.finished)
+            batch_sizes = np.array(self.batch_sizes)
+            summary = {'uptime_s': time.time() - self.started, 'n_requests': self.n_requests,
+                       'n_errors': self.n_errors, 'n_batches': self.n_batches}
+        if len(latencies) > 0:
+            p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+            summary.update({'latency_ms_mean': float(latencies.mean()),
+                            'latency_ms_p50': float(p50), 'latency_ms_p95': float(p95),
+                            'latency_ms_p99': float(p99),
+                            'latency_ms_max': float(latencies.max())})
+        if len(finished) > 1 and finished[-1] > finished[0]:
+            summary['throughput_rps'] = (len(finished)-1) / (finished[-1]-finished[0])
+        if len(batch_sizes) > 0:
+            summary['batch_size_mean'] = float(batch_sizes.mean())
+            summary['batch_size_max'] = int(batch_sizes.max())
+        return summary
+
+
+class MeasurementServer:
+    """
+    Local HTTP server with warm workers and micro-batching, see the module
+    docstring for the endpoints.
+
+    Parameters
+    ----------
+    model : LandmarkModel or str
+        The landmark model of the points.
+    host : str, optional
+        Host name. The default is '127.0.0.1', so the server is only
+        reachable from the local machine.
+    port : int, optional
+        Port number. The default is 0, in which case a free port is chosen.
+    n_workers : int, optional
+        Number of worker processes for requests with an image. The default
+        is None (number of CPUs).
+    max_batch : int, optional
+        Maximum number of requests in a batch. The default is 64.
+    max_delay : float, optional
+        Maximum time in seconds the first request of a batch waits for more
+        requests. The default is 0.005.
+    **options
+        Further keyword arguments passed to measure_hip.
+    """
+
+    def __init__(self, model, host='127.0.0.1', port=0, n_workers=None, max_batch=64,
+                 max_delay=0.005, **options):
+        self.model = get_model(model)
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.options = options
+        self.metrics = _Metrics()
+        self._requests = queue.Queue()
+        self.n_workers = n_workers or os.cpu_count() or 1
+        self._executor = make_executor(self.n_workers)
+        self._httpd = ThreadingHTTPServer((host, port), _make_handler(self))
+        self._threads = []
+
+    @property
+    def url(self):
+        host, port = self._httpd.server_address[:2]
+        return 'http://{}:{}'.format(host, port)
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def start(self, warm=True):
+        """
+        This function warms the worker processes and starts serving in
+        background threads.
+
+        """
+        if warm is True:
+            warm_executor(self._executor, self.n_workers)
+        self._threads = [threading.Thread(target=self._batch_loop, daemon=True),
+                         threading.Thread(target=self._httpd.serve_forever, daemon=True)]
+        for thread in self._threads:
+            thread.start()
+
+    def stop(self):
+        """
+        This function stops the server and its workers.
+
+        """
+        self._httpd.shutdown()
+        self._httpd.server_close()
+        self._requests.put(None)
+        for thread in self._threads:
+            thread.join()
+        self._executor.shutdown()
+
+    def submit(self, request):
+        """
+        This function adds a request to the next batch.
+
+        Parameters
+        ----------
+        request : dict
+            Decoded JSON body of a /measure request.
+
+        Returns
+        -------
+        future : Future
+            Future with the list of result records.
+
+        """
+        future = Future()
+        self._requests.put((request, future))
+        return future
+
+    def _batch_loop(self):
+        # Collect requests into batches of at most max_batch requests, the
+        # first request waits at most max_delay for the others
+        while True:
+            item = self._requests.get()
+            if item is None:
+                break
+            batch = [item]
+            deadline = time.perf_counter() + self.max_delay
+            stopping = False
+            while len(batch) < self.max_batch:
+                timeout = deadline - time.perf_counter()
+                try:
+                    if timeout > 0:
+                        item = self._requests.get(timeout=timeout)
+                    else: item = self._requests.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+            self.metrics.add_batch(len(batch))
+            self._run_batch(batch)
+            if stopping is True:
+                break
+
+    def _run_batch(self, batch):
+        # Parse the requests and fit the circles of all hips in one call
+        jobs = []
+        hips = []
+        for request, future in batch:
+            try:
+                job = _parse_request(request, self.model)
+            except Exception as e:
+                future.set_exception(e)
+                continue
+            jobs.append((job, future))
+            for key in ('pts_L', 'pts_R'):
+                if job[key] is not None:
+                    hips.append((job, key, job[key]))
+
+        if len(hips) > 0 and self.model.has('circle'):
+            try:
+                c_values = opt_circle_fit_batch(self.model.index('circle'),
+                                                np.stack([pts for job, key, pts in hips]),
+                                                masks=self.model.subset_masks)
+                for (job, key, pts), c_vals in zip(hips, c_values):
+                    job['c_vals'+key[3:]] = c_vals.tolist()
+            except Exception as e:
+                # The circles are fitted per hip instead
+                print('Batched circle fit failed: {!r}'.format(e))
+
+        for job, future in jobs:
+            args = (job['pts_L'], job['pts_R'], self.model, job['name'], job['image'],
+                    job.get('c_vals_L'), job.get('c_vals_R'), self.options)
+            if job['image'] is None:
+                try:
+                    future.set_result(measure_request(*args))
+                except Exception as e:
+                    future.set_exception(e)
+            else:
+                _chain(self._executor.submit(measure_request, *args), future)
+
+
+def _chain(source, target):
+    # Pass the outcome of a worker future to the future of the request
+    def done(f):
+        if f.exception() is not None:
+            target.set_exception(f.exception())
+        else: target.set_result(f.result())
+    source.add_done_callback(done)
+
+
+def _parse_request(request, model):
+    # Check the body of a /measure request and convert the points to arrays
+    if not isinstance(request, dict):
+        raise ValueError('request should be a JSON object')
+    job = {'name': request.get('name'), 'image': request.get('image')}
+    for key in ('pts_L', 'pts_R'):
+        pts = request.get(key)
+        if pts is not None:
+            pts = np.asarray(pts, dtype=float)
+            if pts.shape != (model.n_points, 2):
+                raise ValueError('{} should have shape ({}, 2), got {}'.format(
+                    key, model.n_points, pts.shape))
+        job[key] = pts
+    if job['pts_L'] is None and job['pts_R'] is None:
+        raise ValueError('request should contain pts_L and/or pts_R')
+    return job
+
+
+def _make_handler(server):
+    # Request handler class bound to a MeasurementServer
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, format, *args):
+            pass
+
+        def _send(self, code, body):
+            data = json.dumps(body).encode('utf-8')
+            self.send_response(code)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            if self.path == '/metrics':
+                self._send(200, server.metrics.summary())
+            elif self.path == '/health':
+                self._send(200, {'status': 'ok'})
+            else: self._send(404, {'error': 'not found'})
+
+        def do_POST(self):
+            if self.path != '/measure':
+                self._send(404, {'error': 'not found'})
+                return
+            t = time.perf_counter()
+            try:
+                length = int(self.headers.get('Content-Length', 0))
+                request = json.loads(self.rfile.read(length))
+                records = server.submit(request).result()
+            except (ValueError, TypeError) as e:
+                server.metrics.add_request(time.perf_counter()-t, error=True)
+                self._send(400, {'error': str(e)})
+                return
+            except Exception as e:
+                server.metrics.add_request(time.perf_counter()-t, error=True)
+                self._send(500, {'error': repr(e)})
+                return
+            latency = time.perf_counter() - t
+            server.metrics.add_request(latency)
+            self._send(200, {'name': request.get('name'), 'records': records,
+                             'latency_ms': latency*1000})
+
+    return Handler
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        print(__doc__)
+        sys.exit(2)
+    model = load_model_file(sys.argv[1])
+    port = int(sys.argv[2]) if len(sys.argv) > 2 else 8765
+    server = MeasurementServer(model, port=port)
+    server.start()
+    print('Serving on {}'.format(server.url))
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        server.stop()
@@ -0,0 +1,422 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Fri Oct 23 14:26:07 2026
+
+Histogram-based multi-otsu thresholding of image crops, e.g. the shaft crop
+below the minor trochanter. The pixels of an image are assigned to bins
+once (ImageHistogram), so the histogram of any crop is a bincount of the
+bin indices, and the histograms of both hips and of later calls are reused.
+
+By default (nbins=None) the histogram of a crop is the one of
+skimage.filters.threshold_multiotsu (integer images use one bin per grey
+value of the crop, up to MAX_GREY_VALUES grey values, floating point images
+use SKIMAGE_BINS bins of equal width over the range of the crop), and the
+thresholds are searched by skimage on this histogram, so they are the same
+as those of skimage.filters.threshold_multiotsu on the crop.
+
+Optionally the number of bins can be limited with nbins, in which case the
+bins span the range of the whole image (integer images of which the range
+fits in nbins still use one bin per grey value) and the thresholds are found
+with a dynamic-programming search over the non-empty bins, of which the cost
+grows with classes x bins^2 instead of bins^(classes-1). This is much faster
+for 16-bit images, but the thresholds can differ by a bin from skimage.
+compare_skimage checks the thresholds against skimage.
+
+@author: Fleur Boel, f.boel@erasmusmc.nl
+"""
+
+import weakref
+import numpy as np
+import instrumentation
+from shared_images import as_image
+from lazy_imports import lazy_import
+
+filters = lazy_import('skimage.filters')
+
+# Default number of bins, None for the histogram of skimage.filters.threshold_multiotsu
+DEFAULT_BINS = None
+
+# Number of bins of floating point crops used by skimage, and the largest
+# number of grey values of integer images with one bin per grey value
+SKIMAGE_BINS = 256
+MAX_GREY_VALUES = 2**16
+
+# Histograms of the last images: id of the image -> (weak reference, ImageHistogram)
+_histograms = {}
+_MAX_IMAGES = 4
+
+
+def _binning(vmin, vmax, dtype, nbins):
+    # Number of bins, bin centers, offset and bin width (None for one bin per
+    # grey value) for an image with values vmin to vmax
+    if nbins is None:
+        nbins = MAX_GREY_VALUES if np.issubdtype(dtype, np.integer) else SKIMAGE_BINS
+    if np.issubdtype(dtype, np.integer) and int(vmax)-int(vmin) < nbins:
+        return int(vmax)-int(vmin)+1, np.arange(int(vmin), int(vmax)+1), int(vmin), None
+    width = (float(vmax)-float(vmin))/nbins
+    if width == 0:
+        width = 1.0
+    return nbins, float(vmin) + width*(np.arange(nbins)+0.5), float(vmin), width
+
+
+def _bin_indices(values, nbins, offset, width):
+    # Bin index of each value
+    if width is None:
+        return values.astype(np.int64) - offset
+    indices = np.floor((values.astype(np.float64)-offset)/width)
+    return np.clip(indices, 0, nbins-1).astype(np.int64)
+
+
+def _float_histogram(values, vmin, vmax):
+    # Histogram of floating point values with SKIMAGE_BINS bins from vmin to
+    # vmax, with the bins of skimage (np.histogram)
+    counts, edges = np.histogram(values, SKIMAGE_BINS, range=(float(vmin), float(vmax)))
+    return counts, (edges[:-1] + edges[1:]) / 2
+
+
+class ImageHistogram:
+    """
+    Bin indices of all pixels of an image, from which the histogram of a crop
+    is computed. With the default binning, floating point images are binned
+    per crop over the range of the crop, as skimage does. The image should
+    not be changed after the ImageHistogram is created.
+
+    Parameters
+    ----------
+    img : array of float
+        Matrix containing the image pixel array.
+    nbins : int, optional
+        Maximum number of bins. The default is DEFAULT_BINS (None), see the
+        module docstring.
+    """
+
+    def __init__(self, img, nbins=DEFAULT_BINS):
+        img = np.asarray(img)
+        self.shape = img.shape
+        self._crops = {}
+        self._img = None
+        if nbins is None and not np.issubdtype(img.dtype, np.integer):
+            self._img = weakref.ref(img)
+            self.nbins, self.centers, self.indices = SKIMAGE_BINS, None, None
+            return
+        with instrumentation.stage('otsu_histogram'):
+            self.nbins, self.centers, offset, width = _binning(img.min(), img.max(), img.dtype,
+                                                               nbins)
+            indices = _bin_indices(img, self.nbins, offset, width)
+            self.indices = indices.astype(np.uint8 if self.nbins <= 256 else np.uint16)
+
+    def crop(self, rows=slice(None), cols=slice(None)):
+        """
+        This function returns the normalized histogram of a crop of the image.
+        Histograms are cached per crop.
+
+        Parameters
+        ----------
+        rows : slice, optional
+            Rows of the crop. The default is all rows.
+        cols : slice, optional
+            Columns of the crop. The default is all columns.
+
+        Returns
+        -------
+        counts : array of int
+            The number of pixels of the crop in each bin, 1D array.
+        centers : array of float
+            The bin centers, 1D array.
+
+        """
+        key = (rows.indices(self.shape[0]), cols.indices(self.shape[1]))
+        if key not in self._crops:
+            with instrumentation.stage('otsu_histogram'):
+                if self.indices is None:
+                    img_c = self._img()[rows, cols]
+                    counts, centers = _float_histogram(img_c, img_c.min(), img_c.max())
+                else:
+                    counts = np.bincount(self.indices[rows, cols].ravel(), minlength=self.nbins)
+                    centers = self.centers
+            self._crops[key] = (counts, centers)
+        return self._crops[key]
+
+
+def image_histogram(img, nbins=DEFAULT_BINS):
+    """
+    This function returns the ImageHistogram of an image. The histograms of
+    the last images are cached, so the two hips of a scan share one.
+
+    Parameters
+    ----------
+    img : array of float or dict
+        Matrix containing the image pixel array, or the handle of a shared
+        image (see shared_images).
+    nbins : int, optional
+        Maximum number of bins. The default is DEFAULT_BINS.
+
+    Returns
+    -------
+    histogram : ImageHistogram
+        The histogram of the image.
+
+    """
+    img = as_image(img)
+    key = (id(img), nbins)
+    if key in _histograms:
+        ref, histogram = _histograms[key]
+        if ref() is img:
+            return histogram
+    histogram = ImageHistogram(img, nbins)
+    if len(_histograms) >= _MAX_IMAGES:
+        _histograms.pop(next(iter(_histograms)))
+    _histograms[key] = (weakref.ref(img), histogram)
+    return histogram
+
+
+def stream_crop_histogram(img, rows=slice(None), cols=slice(None), nbins=DEFAULT_BINS,
+                          chunk_rows=256):
+    """
+    This function computes the same histogram of a crop as ImageHistogram,
+    but reads the image in chunks of rows, so the memory use does not grow
+    with the size of the image. With the default binning only the crop is
+    read (twice), with nbins also the range of the whole image is read.
+
+    Parameters
+    ----------
+    img : array of float or dict
+        Matrix containing the image pixel array (e.g. a memory-mapped array),
+        or the handle of a shared image.
+    rows, cols : slice, optional
+        Rows and columns of the crop. The default is all rows and columns.
+    nbins : int, optional
+        Maximum number of bins. The default is DEFAULT_BINS.
+    chunk_rows : int, optional
+        Number of rows read at once. The default is 256.
+
+    Returns
+    -------
+    counts : array of int
+        The number of pixels of the crop in each bin, 1D array.
+    centers : array of float
+        The bin centers, 1D array.
+
+    """
+    img = as_image(img)
+    r0, r1 = rows.indices(img.shape[0])[:2]
+    with instrumentation.stage('otsu_histogram'):
+        # With nbins the bins span the range of the whole image, as in
+        # ImageHistogram, by default integer images have one bin per grey
+        # value and floating point images are binned over the crop
+        vmin = None
+        vmax = None
+        if nbins is None:
+            blocks = ((start, min(start+chunk_rows, r1), cols) for start in range(r0, r1, chunk_rows))
+        else:
+            blocks = ((start, start+chunk_rows, slice(None)) for start in range(0, img.shape[0], chunk_rows))
+        for start, stop, block_cols in blocks:
+            block = np.asarray(img[start:stop, block_cols])
+            if block.size == 0:
+                continue
+            vmin = block.min() if vmin is None else min(vmin, block.min())
+            vmax = block.max() if vmax is None else max(vmax, block.max())
+        if vmin is None:
+            raise ValueError('The crop of the image is empty')
+        exact_float = nbins is None and not np.issubdtype(img.dtype, np.integer)
+        if exact_float is True:
+            counts, centers = _float_histogram([], vmin, vmax)
+        else:
+            n, centers, offset, width = _binning(vmin, vmax, img.dtype, nbins)
+            counts = np.zeros(n, dtype=np.int64)
+
+        for start in range(r0, r1, chunk_rows):
+            block = np.asarray(img[start:min(start+chunk_rows, r1), cols])
+            if exact_float is True:
+                counts += _float_histogram(block, vmin, vmax)[0]
+            else:
+                counts += np.bincount(_bin_indices(block, n, offset, width).ravel(), minlength=n)
+    return counts, centers
+
+
+def multiotsu_indices(prob, classes=3, chunk=256, values=None):
+    """
+    This function finds the multi-otsu thresholds of a histogram, i.e. the
+    bins which maximize the between-class variance, with a dynamic-programming
+    search over the number of classes.
+
+    Parameters
+    ----------
+    prob : array of float
+        The normalized histogram, 1D array.
+    classes : int, optional
+        Number of classes. The default is 3.
+    chunk : int, optional
+        Number of bins evaluated at once. The default is 256.
+    values : array of float, optional
+        The value of each bin, e.g. the bin centers if empty bins are left
+        out. The default is None, in which case the bins are equally spaced.
+
+    Returns
+    -------
+    thresh_idx : array of int
+        For each threshold the index of the last bin of the lower class, 1D
+        array of length classes-1.
+
+    """
+    prob = np.asarray(prob, dtype=np.float64)
+    n = len(prob)
+    nvalues = np.count_nonzero(prob)
+    if nvalues < classes:
+        raise ValueError('The histogram has only {} different values. It cannot be thresholded in {} classes.'.format(nvalues, classes))
+    if nvalues == classes:
+        return np.flatnonzero(prob)[:-1]
+
+    # Cumulative probability and first moment, class a..b-1 is (a, b)
+    if values is None:
+        values = np.arange(n)
+    else:
+        values = np.asarray(values, dtype=np.float64) - values[0]
+    P = np.concatenate(([0], np.cumsum(prob)))
+    S = np.concatenate(([0], np.cumsum(prob*values)))
+
+    # best[b]: maximum of sum(S_k^2/P_k) over c classes covering bins 0..b-1
+    with np.errstate(divide='ignore', invalid='ignore'):
+        best = np.where(P > 0, S**2/P, 0)
+        best[0] = -np.inf
+        choices = []
+        for c in range(2, classes+1):
+            new = np.full(n+1, -np.inf)
+            choice = np.zeros(n+1, dtype=np.intp)
+            for start in range(c, n+1, chunk):
+                b = np.arange(start, min(start+chunk, n+1))
+                a = np.arange(n+1)
+                dP = P[b][:, None] - P[a][None, :]
+                dS = S[b][:, None] - S[a][None, :]
+                total = best[None, :] + np.where(dP > 0, dS**2/dP, 0)
+                # The previous classes end before a, and class c is not empty
+                total[a[None, :] >= b[:, None]] = -np.inf
+                choice[b] = np.argmax(total, axis=1)
+                new[b] = total[np.arange(len(b)), choice[b]]
+            choices.append(choice)
+            best = new
+
+    # Backtrack the starts of the classes
+    thresh_idx = []
+    b = n
+    for choice in reversed(choices):
+        b = choice[b]
+        thresh_idx.append(b-1)
+    return np.array(thresh_idx[::-1])
+
+
+def histogram_thresholds(counts, centers, classes=3, exact=True):
+    """
+    This function returns the multi-otsu thresholds of a histogram.
+
+    Parameters
+    ----------
+    counts : array of int
+        The histogram, 1D array.
+    centers : array of float
+        The bin centers, 1D array.
+    classes : int, optional
+        Number of classes. The default is 3.
+    exact : boolean, optional
+        True to search the thresholds with skimage on the bins from the first
+        to the last non-empty bin, which is the histogram skimage computes
+        for the crop. False for the dynamic-programming search over the
+        non-empty bins (see multiotsu_indices). The default is True.
+
+    Returns
+    -------
+    thres : array of float
+        The thresholds, 1D array of length classes-1.
+
+    """
+    counts = np.asarray(counts)
+    centers = np.asarray(centers)
+    nonzero = np.flatnonzero(counts)
+    if len(nonzero) == 0:
+        raise ValueError('The histogram is empty')
+    prob = counts / counts.sum()
+    if exact is True:
+        used = slice(nonzero[0], nonzero[-1]+1)
+        return filters.threshold_multiotsu(classes=classes, hist=(prob[used], centers[used]))
+    thresh_idx = multiotsu_indices(prob[nonzero], classes, values=centers[nonzero])
+    return centers[nonzero[thresh_idx]]
+
+
+def crop_thresholds(img, classes=3, rows=slice(None), cols=slice(None), nbins=DEFAULT_BINS):
+    """
+    This function calculates the multi-otsu thresholds of a crop of an image,
+    with the same semantics as skimage.filters.threshold_multiotsu: the
+    pixels above thres[i] belong to class i+1 or higher.
+
+    Parameters
+    ----------
+    img : array of float or dict
+        Matrix containing the image pixel array (not the crop), or the handle
+        of a shared image.
+    classes : int, optional
+        Number of classes. The default is 3.
+    rows : slice, optional
+        Rows of the crop. The default is all rows.
+    cols : slice, optional
+        Columns of the crop. The default is all columns.
+    nbins : int, optional
+        Maximum number of bins. The default is DEFAULT_BINS (None), which
+        gives the thresholds of skimage, see the module docstring.
+
+    Returns
+    -------
+    thres : array of float
+        The thresholds, 1D array of length classes-1.
+
+    """
+    histogram = image_histogram(img, nbins)
+    counts, centers = histogram.crop(rows, cols)
+    return histogram_thresholds(counts, centers, classes, nbins is None)
+
+
+def compare_skimage(img, classes=3, rows=slice(None), cols=slice(None), nbins=DEFAULT_BINS,
+                    tolerance=1):
+    """
+    This function checks the thresholds of crop_thresholds against those of
+    skimage.filters.threshold_multiotsu of the crop.
+
+    Parameters
+    ----------
+    img, classes, rows, cols, nbins
+        See crop_thresholds.
+    tolerance : float, optional
+        Maximum accepted difference in bin widths. The default is 1.
+
+    Returns
+    -------
+    report : dict
+        Dictionary with the thresholds of both methods, the maximum difference
+        in bin widths and whether the difference is within the tolerance.
+
+    """
+    centers = image_histogram(img, nbins).crop(rows, cols)[1]
+    thres = crop_thresholds(img, classes, rows, cols, nbins)
+    thres_skimage = filters.threshold_multiotsu(np.asarray(as_image(img))[rows, cols], classes)
+    width = centers[1]-centers[0] if len(centers) > 1 else 1
+    difference = float(np.max(np.abs(thres - thres_skimage)) / width)
+    return {'thresholds': thres, 'thresholds_skimage': thres_skimage,
+            'difference': difference, 'within_tolerance': difference <= tolerance}
+
+
+if __name__ == '__main__':
+    # Check the default thresholds against skimage, for the full crop and
+    # for the crop streamed in chunks of rows
+    rng = np.random.default_rng(0)
+    images = {'uint8': rng.integers(0, 256, (300, 200)).astype(np.uint8),
+              'uint16': rng.integers(1000, 1600, (300, 200)).astype(np.uint16),
+              'float': rng.normal(0, 1, (300, 200))}
+    rows, cols = slice(60, None), slice(20, 180)
+    for name, img in images.items():
+        for classes in (2, 3, 4):
+            thres_skimage = filters.threshold_multiotsu(img[rows, cols], classes)
+            thres = crop_thresholds(img, classes, rows, cols)
+            counts, centers = stream_crop_histogram(img, rows, cols, chunk_rows=64)
+            thres_stream = histogram_thresholds(counts, centers, classes)
+            print('{:16s} classes {}  identical: {}  streamed identical: {}'.format(
+                name, classes, np.array_equal(thres, thres_skimage),
+                np.array_equal(thres_stream, thres_skimage)))
@@ -6,12 +6,47 @@ Created on Thu Sep  8 12:13:41 2022
 """
 
 import numpy as np
-from circle_fit import circle_fit
+from circle_fit import circle_fit, circle_fit_batch
+import instrumentation
 
-def opt_circle_fit(c_points, pts):
+# Subsets of the circle points used for 13 year olds: the nine combinations
+# obtained by removing up to two points on the lateral and medial side of
+# the femoral head.
+CIRCLE_SUBSETS_13Y = [slice(0, None), slice(1, None), slice(0, -1), slice(0, -2),
+                      slice(2, None), slice(1, -1), slice(1, -2), slice(2, -1),
+                      slice(2, -2)]
+
+
+def subset_masks(subsets, n_points):
+    """
+    This function converts subsets of the circle points (e.g. slices) into
+    boolean masks.
+
+    Parameters
+    ----------
+    subsets : list of slice
+        The subsets of the circle points.
+    n_points : int
+        Number of circle points.
+
+    Returns
+    -------
+    masks : array of bool
+        Array of shape (n_subsets, n_points), True for the points of a subset.
+    """
+    
+    masks = np.zeros((len(subsets), n_points), dtype=bool)
+    for i, subset in enumerate(subsets):
+        masks[i, subset] = True
+    
+    return masks
+
+
+@instrumentation.timed()
+def opt_circle_fit(c_points, pts, subsets=None, masks=None):
     """
     This function finds the best-fitting circle based on the given points and
-    indices. Nine different circles are fitted based on nine different 
+    indices. A circle is fitted for each of the (by default nine) different 
     combinations of points in order to optimize the circle fit. The best-fitting
     circle is chosen as the circle with the smallest error and the smallest
     radius. If these circles are not the same, an even trade-off is made 
@@ -24,6 +59,14 @@ def opt_circle_fit(c_points, pts):
         needs to be determined.
     pts : array array of float
         The x- and y-coordinates of of all landmark points of the hip, 2D array.
+    subsets : list of slice, optional
+        The subsets of the circle points for which a circle is fitted. The 
+        default is None, in which case the nine subsets for 13 year olds 
+        (CIRCLE_SUBSETS_13Y) are used.
+    masks : array of bool, optional
+        The subsets as boolean masks of shape (n_subsets, n_circle_points), 
+        e.g. the subset_masks of a landmark model. If given, subsets is 
+        ignored. The default is None.
 
     Returns
     -------
@@ -40,17 +83,13 @@ def opt_circle_fit(c_points, pts):
     
     # Obtain x- and y-coordinates of the points used to find the best fitting 
     # circle
-    c_pts = []
-    for i in c_points:
-        c_pts.append(pts[i,:])
+    c_pts = pts[np.asarray(c_points), :]
     
-    # Create nine different variations by removing points on the lateral and
+    # Create different variations by removing points on the lateral and
     # medial side of the femoral head.
-    
-    # 13 year olds
-    opt_c_pts = [c_pts, c_pts[1:len(c_pts)], c_pts[0:-1], c_pts[0:-2],  
-                 c_pts[2:len(c_pts)], c_pts[1:-1], c_pts[1:-2], 
-                 c_pts[2:-1], c_pts[2:-2]]
+    if masks is None:
+        masks = subset_masks(CIRCLE_SUBSETS_13Y if subsets is None else subsets, len(c_pts))
+    opt_c_pts = [c_pts[mask] for mask in masks]
     
     
     # Determine the circle fit using the circle_fit function, which returns
@@ -84,4 +123,51 @@ def opt_circle_fit(c_points, pts):
     c_values = [cf_x[small], cf_y[small], cf_r[small]]
     c_val_pts = np.array(opt_c_pts[small])
     
-    return c_values, c_val_pts
\ No newline at end of file
+    return c_values, c_val_pts
+
+
+@instrumentation.timed()
+def opt_circle_fit_batch(c_points, pts, subsets=None, masks=None):
+    """
+    This function finds the best-fitting circle for many hips at once, with 
+    the same selection as opt_circle_fit. For each subset of the circle 
+    points one batched circle fit is done for all hips.
+    
+    Parameters
+    ----------
+    c_points : array of float
+        The indices of the circle points.
+    pts : array of float
+        The x- and y-coordinates of all landmark points of the hips, array of
+        shape (n_hips, n_points, 2).
+    subsets : list of slice, optional
+        The subsets of the circle points for which a circle is fitted. The 
+        default is None, in which case CIRCLE_SUBSETS_13Y is used.
+    masks : array of bool, optional
+        The subsets as boolean masks, see opt_circle_fit. The default is None.
+
+    Returns
+    -------
+    c_values : array of float
+        The x-coordinate, y-coordinate and radius of the best-fitting circle 
+        of each hip, array of shape (n_hips, 3).
+    """
+    
+    c_pts = np.asarray(pts, dtype=float)[:, np.asarray(c_points), :]
+    if masks is None:
+        masks = subset_masks(CIRCLE_SUBSETS_13Y if subsets is None else subsets, 
+                             c_pts.shape[1])
+    
+    # Circle parameters and errors of shape (n_subsets, n_hips)
+    fits = [circle_fit_batch(c_pts[:, mask, :]) for mask in masks]
+    cf_x, cf_y, cf_r, cf_error = [np.array(values) for values in zip(*fits)]
+    
+    # Trade off between smallest error and smallest radius
+    sort_err = np.argsort(np.argsort(cf_error, axis=0), axis=0)
+    sort_r = np.argsort(np.argsort(cf_r, axis=0), axis=0)
+    small = np.argmin(sort_err + sort_r, axis=0)
+    
+    hips = np.arange(c_pts.shape[0])
+    c_values = np.stack([cf_x[small, hips], cf_y[small, hips], cf_r[small, hips]], axis=-1)
+    
+    return c_values
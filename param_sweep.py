@@ -0,0 +1,350 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Thu Oct 22 15:52:36 2026
+
+Parameter sweeps over a cohort for method validation. The points and the
+image of each scan are loaded once, and for each hip the best-fitting
+circle, the neck axis, the femoral head-neck spline and the Otsu histogram
+of the shaft crop (see multi_otsu) are determined once. Only the parameter-dependent tail is
+evaluated for each grid value:
+    - alpha angle: error_margin_points x error_margin_spline
+    - neck-shaft angle: otsu_levels x otsu_thres
+The results are written as (hip x parameter) arrays.
+
+@author: Fleur Boel, f.boel@erasmusmc.nl
+"""
+
+import numpy as np
+from pathlib import Path
+import instrumentation
+from lazy_imports import lazy_import
+from landmark_models import get_model
+from load_files import load_image, load_full_body_points
+from opt_circle_fit import opt_circle_fit
+from calc_neck_axis import calc_neck_axis
+from calc_alpha_angle import alpha_point_index, spline_segment, spline_alpha_point
+from angle_3_points import angle_3_points
+from head_neck_profile import HeadNeckProfile
+from calc_shaft_axis import shaft_midpoints
+from calc_NSA import calc_NSA
+from multi_otsu import image_histogram, histogram_thresholds, DEFAULT_BINS
+from shaft_window import plan_shaft_window
+from line_fit import fit_shaft_line, fit_shaft_lines
+
+morphology = lazy_import('skimage.morphology')
+
+# Default grid, the default values of the measurement functions
+DEFAULT_GRID = {'error_margin_points': [1.04], 'error_margin_spline': [1],
+                'otsu_levels': [3], 'otsu_thres': [1]}
+
+
+def sweep_alpha_angle(fhn_pts, c_vals, c_n, error_margins_points, error_margins_spline,
+                      profile=None):
+    """
+    This function calculates the alpha angle (see calc_alpha_angle) for a
+    grid of error margins. The spline through the femoral head neck points
+    is fitted once (see HeadNeckProfile), and the spline segment around each
+    alpha point index is evaluated once.
+
+    Parameters
+    ----------
+    fhn_pts : array of float
+        The x- and y-coordinates of all lateral femoral head and neck points,
+        2D array.
+    c_vals : list
+        List containing the x-coordinate, y-coordinate and radius of the
+        best-fitting circle.
+    c_n : array of float
+        The x- and y-coordinates of the femoral neck center, 1D array.
+    error_margins_points : list of float
+        Values of error_margin_points.
+    error_margins_spline : list of float
+        Values of error_margin_spline.
+    profile : HeadNeckProfile, optional
+        The femoral head-neck profile of fhn_pts. The default is None, in
+        which case it is created.
+
+    Returns
+    -------
+    alpha_angles : array of float
+        The alpha angles in degrees, array of shape (len(error_margins_points),
+        len(error_margins_spline)). NaN where the alpha angle could not be
+        determined.
+
+    """
+    alpha_angles = np.full((len(error_margins_points), len(error_margins_spline)), np.nan)
+    if profile is None:
+        profile = HeadNeckProfile(fhn_pts)
+    fhn_pts_aa = profile.points
+    dist = np.sqrt((fhn_pts_aa[:,0]-c_vals[0])**2 + (fhn_pts_aa[:,1]-c_vals[1])**2)
+    c_h = np.array([c_vals[0], c_vals[1]])
+
+    for i, margin_points in enumerate(error_margins_points):
+        index = alpha_point_index(dist, c_vals[2]*margin_points)
+        if index is None:
+            continue
+        y0, y1 = spline_segment(fhn_pts_aa, index)
+        xspl, yspl, dist_spl = profile.circle_distance(y0, y1, c_vals)
+        for j, margin_spline in enumerate(error_margins_spline):
+            ap = spline_alpha_point(xspl, yspl, dist_spl, c_vals[2]*margin_spline,
+                                    fhn_pts_aa[index])
+            alpha_angles[i, j] = angle_3_points(ap, c_h, c_n, degree=True)
+
+    return alpha_angles
+
+
+def shaft_crop(img, p_TMI, radius=None, p_IC=None, hip_side_right=True, window=None):
+    """
+    This function returns the rows and columns of the crop below the minor
+    trochanter as used by calc_shaft_axis, or by calc_shaft_axis_pelvic if
+    p_IC is given. The columns are limited to window if given.
+
+    Returns
+    -------
+    rows : slice
+        Rows of the crop, None if too little of the shaft is depicted.
+    cols : slice
+        Columns of the crop.
+
+    """
+    tm_cut = round(p_TMI[1])
+    rows = slice(tm_cut, np.size(img, axis=0))
+    if window is None:
+        window = (0, np.size(img, axis=1))
+    if p_IC is None:
+        if np.size(img, axis=0)-tm_cut <= 0.5*radius:
+            return None, slice(None)
+        return rows, slice(window[0], window[1])
+    ic_cut = round(p_IC[0])
+    if hip_side_right is True:
+        return rows, slice(window[0], min(ic_cut, window[1]))
+    return rows, slice(max(ic_cut, window[0]), window[1])
+
+
+def sweep_shaft_axis(img, p_TMI, otsu_levels, otsu_thres, radius=None, p_IC=None,
+                     hip_side_right=True, otsu_bins=DEFAULT_BINS, window=None,
+                     fit_method='polyfit'):
+    """
+    This function determines the shaft axis (see calc_shaft_axis and
+    calc_shaft_axis_pelvic) for a grid of Otsu parameters. The image is
+    cropped and its histogram is computed once (see multi_otsu), the
+    multi-Otsu thresholds are computed once per number of classes. With a
+    robust fit method the lines of all thresholds are fitted in one batch.
+
+    Parameters
+    ----------
+    img : array of float
+        Matrix containing the image pixel array.
+    p_TMI : array of float
+        The x- and y-coordinates of the inferior point of the minor
+        trochanter, 1D array.
+    otsu_levels : list of int
+        Values of otsu_levels.
+    otsu_thres : list of int
+        Values of otsu_thres.
+    radius : float, optional
+        The radius of the best-fitting circle, used by the full method. The
+        default is None.
+    p_IC : array of float, optional
+        The x- and y-coordinates of the most caudal point of the ischium. If
+        given, the crop of calc_shaft_axis_pelvic is used. The default is None.
+    hip_side_right : boolean, optional
+        Indicates the hip side, used by the pelvic method. The default is True.
+    otsu_bins : int, optional
+        Maximum number of histogram bins, see calc_shaft_axis. The default
+        is None.
+    window : tuple of int, optional
+        The columns of the shaft, see shaft_window. The default is None.
+    fit_method : str, optional
+        'polyfit', 'theil-sen' or 'ransac', see calc_shaft_axis. The default
+        is 'polyfit'.
+
+    Returns
+    -------
+    slopes : array of float
+        The slopes of the shaft axis, array of shape (len(otsu_levels),
+        len(otsu_thres)). NaN where the shaft axis could not be determined,
+        e.g. if otsu_thres is not smaller than otsu_levels-1.
+    intercepts : array of float
+        The intercepts of the shaft axis, same shape as slopes.
+
+    """
+    slopes = np.full((len(otsu_levels), len(otsu_thres)), np.nan)
+    intercepts = np.full((len(otsu_levels), len(otsu_thres)), np.nan)
+    rows, cols = shaft_crop(img, p_TMI, radius, p_IC, hip_side_right, window)
+    if rows is None:
+        return slopes, intercepts
+    tm_cut = rows.start
+    img_c = img[rows, cols]
+
+    # Same histogram as calc_shaft_axis uses
+    histogram = image_histogram(img, otsu_bins)
+    counts, centers = histogram.crop(rows, cols)
+    masks = {}
+    cells = []
+    for i, levels in enumerate(otsu_levels):
+        try:
+            with instrumentation.stage('threshold_multiotsu'):
+                thres = histogram_thresholds(counts, centers, levels, otsu_bins is None)
+        except ValueError as e:
+            print('Multi-otsu thresholding with {} classes failed: {}'.format(levels, e))
+            continue
+        for j, level in enumerate(otsu_thres):
+            if level >= len(thres):
+                continue
+            # Different Otsu parameters can result in the same threshold
+            key = float(thres[level])
+            if key not in masks:
+                mask_otsu = np.asarray(img_c) > thres[level]
+                with instrumentation.stage('closing'):
+                    masked_img = morphology.closing(mask_otsu, morphology.square(5))
+                pts_l, pts_m, adj_midpoints = shaft_midpoints(masked_img, tm_cut, cols.start,
+                                                              fit_method == 'polyfit')
+                masks[key] = adj_midpoints
+            cells.append((i, j, key))
+
+    # Fit the shaft axis once per distinct threshold, a threshold for which
+    # no line can be fitted only gives NaN for its own cells
+    keys = list(masks)
+    if fit_method == 'polyfit':
+        lines = []
+        for key in keys:
+            try:
+                line = fit_shaft_line(masks[key], fit_method)
+            except Exception as e:
+                print('Shaft axis could not be fitted for threshold {}: {!r}'.format(key, e))
+                line = ('NaN', 'NaN')
+            lines.append([np.nan if value == 'NaN' else value for value in line])
+    else:
+        lines = np.column_stack(fit_shaft_lines([masks[key] for key in keys], fit_method))
+    lines = dict(zip(keys, lines))
+    for i, j, key in cells:
+        slopes[i, j], intercepts[i, j] = lines[key]
+
+    return slopes, intercepts
+
+
+def sweep_cohort(img_names, folder_img, folder_pts, model, grid=None, outputfile=None,
+                 load_images=True, shaft_method='full', shaft_window=False,
+                 fit_method='polyfit', otsu_bins=DEFAULT_BINS):
+    """
+    This function sweeps the alpha angle margins and the Otsu parameters of
+    the shaft axis over all hips of a cohort. Each scan is loaded once.
+
+    Parameters
+    ----------
+    img_names : list
+        Names of the images.
+    folder_img : WindowsPath
+        Folder containing the images.
+    folder_pts : WindowsPath
+        Folder containing the points files.
+    model : LandmarkModel or str
+        The landmark model of the points.
+    grid : dict, optional
+        Lists of values for error_margin_points, error_margin_spline,
+        otsu_levels and otsu_thres. Missing keys use the default value of
+        the measurement functions. The default is None.
+    outputfile : WindowsPath, optional
+        File path of a .npz file in which the results are saved. The default
+        is None.
+    load_images : boolean, optional
+        Indicates whether images are loaded for the neck-shaft angle sweep.
+        The default is True.
+    shaft_method : str, optional
+        'full' for the crop of calc_shaft_axis or 'pelvic' for the crop of
+        calc_shaft_axis_pelvic. The default is 'full'.
+    shaft_window : boolean, optional
+        Indicates whether the shaft crop is limited to the columns around the
+        femoral shaft, as in measure_hip. The default is False.
+    fit_method : str, optional
+        'polyfit', 'theil-sen' or 'ransac', see calc_shaft_axis. The default
+        is 'polyfit'.
+    otsu_bins : int, optional
+        Maximum number of histogram bins, see sweep_shaft_axis. The default
+        is None.
+
+    Returns
+    -------
+    results : dict
+        Dictionary with the image names and hip sides of the rows ('image',
+        'side'), the grid values and the arrays 'alpha_angle' of shape
+        (n_hips, n_error_margin_points, n_error_margin_spline) and 'NSA' of
+        shape (n_hips, n_otsu_levels, n_otsu_thres). NaN where a measure
+        could not be determined.
+
+    """
+    model = get_model(model)
+    grid = dict(DEFAULT_GRID, **(grid or {}))
+    names = list(dict.fromkeys(img_names))
+    images = []
+    sides = []
+    alpha_angles = []
+    NSAs = []
+    shape_aa = (len(grid['error_margin_points']), len(grid['error_margin_spline']))
+    shape_nsa = (len(grid['otsu_levels']), len(grid['otsu_thres']))
+
+    for name in names:
+        pts_data_L, pts_data_R = load_full_body_points(name, Path(folder_pts))
+        if len(pts_data_L) == 0 or len(pts_data_R) == 0:
+            continue
+        img = None
+        if load_images is True and model.has('TMI', 'ln', 'mn'):
+            try:
+                img = load_image(str(Path(folder_img) / name))[0]
+            except Exception as e:
+                print('Image could not be read for {}, the NSA is not swept: {!r}'.format(name, e))
+
+        # Please note that the _L points belong to the RIGHT hip
+        for pts, hip_side_right in ((pts_data_L, True), (pts_data_R, False)):
+            images.append(name)
+            sides.append('R' if hip_side_right is True else 'L')
+            aa = np.full(shape_aa, np.nan)
+            nsa = np.full(shape_nsa, np.nan)
+            alpha_angles.append(aa)
+            NSAs.append(nsa)
+
+            # The circle and neck axis are shared by both sweeps
+            try:
+                coords = model.gather(pts)
+                c_vals, c_val_pts = opt_circle_fit(model.index('circle'), pts,
+                                                   masks=model.subset_masks)
+                c_n, na_slope, na_intercept = calc_neck_axis(
+                    coords['ln'], coords['mn'], np.array([c_vals[0], c_vals[1]]))
+            except Exception as e:
+                print('Sweep failed for {} ({}): {!r}'.format(name, sides[-1], e))
+                continue
+
+            # A failure of one sweep leaves the grid of the other sweep filled
+            if model.has('fhn'):
+                try:
+                    aa[...] = sweep_alpha_angle(coords['fhn'], c_vals, c_n,
+                                                grid['error_margin_points'],
+                                                grid['error_margin_spline'])
+                except Exception as e:
+                    print('Alpha angle sweep failed for {} ({}): {!r}'.format(name, sides[-1], e))
+            if img is not None:
+                try:
+                    p_IC = coords['IC'] if shaft_method == 'pelvic' and model.has('IC') else None
+                    window = None
+                    if shaft_window is True:
+                        window = plan_shaft_window(np.shape(img), coords['TMI'], c_vals[2],
+                                                   hip_side_right, p_IC)
+                    slopes, intercepts = sweep_shaft_axis(img, coords['TMI'], grid['otsu_levels'],
+                                                          grid['otsu_thres'], c_vals[2], p_IC,
+                                                          hip_side_right, otsu_bins=otsu_bins,
+                                                          window=window, fit_method=fit_method)
+                    valid = ~np.isnan(slopes)
+                    nsa[valid] = [calc_NSA(slope, na_slope) for slope in slopes[valid]]
+                except Exception as e:
+                    print('NSA sweep failed for {} ({}): {!r}'.format(name, sides[-1], e))
+
+    results = {'image': np.array(images), 'side': np.array(sides),
+               'alpha_angle': np.array(alpha_angles).reshape((-1,) + shape_aa),
+               'NSA': np.array(NSAs).reshape((-1,) + shape_nsa)}
+    for key, values in grid.items():
+        results[key] = np.asarray(values)
+    if outputfile is not None:
+        np.savez(outputfile, **results)
+
+    return results
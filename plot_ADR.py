@@ -6,9 +6,14 @@ Created on Wed Jun 21 15:11:19 2023
 """
 
 import numpy as np
-import matplotlib.pyplot as plt
 import os
+import instrumentation
+from shared_images import as_image
+from lazy_imports import lazy_import, headless_backend
 
+plt = lazy_import('matplotlib.pyplot', setup=headless_backend)
+
+@instrumentation.timed()
 def plot_ADR(img, p_AS, p_AE, p_TD, name=None, outputfolder=None):
     """
     This function visualizes the acetabular depth-width ratio. The resulting 
@@ -16,8 +21,9 @@ def plot_ADR(img, p_AS, p_AE, p_TD, name=None, outputfolder=None):
 
     Parameters
     ----------
-    img : array of float
-        Matrix containing the image pixel array.
+    img : array of float or dict
+        Matrix containing the image pixel array, or the handle of a shared 
+        image (see shared_images).
     p_AS : array of float
         The x- and y-coordinates of the most medial point of the acetabular 
         sourcil, 1D array.
@@ -39,6 +45,7 @@ def plot_ADR(img, p_AS, p_AE, p_TD, name=None, outputfolder=None):
     None.
 
     """
+    img = as_image(img)
     
     # Create image and save
     plt.figure(dpi=300)
@@ -6,9 +6,14 @@ Created on Wed Jun 21 12:58:23 2023
 """
 
 import numpy as np
-import matplotlib.pyplot as plt
 import os
+import instrumentation
+from shared_images import as_image
+from lazy_imports import lazy_import, headless_backend
 
+plt = lazy_import('matplotlib.pyplot', setup=headless_backend)
+
+@instrumentation.timed()
 def plot_AI(img, p_AE, p_TC, angle_HRLP, name=None, outputfolder=None):
     """
     This function visualizes the acetabular index based on the most lateral 
@@ -19,8 +24,9 @@ def plot_AI(img, p_AE, p_TC, angle_HRLP, name=None, outputfolder=None):
     
     Parameters
     ----------
-    img : array of float
-        Matrix containing the image pixel array.
+    img : array of float or dict
+        Matrix containing the image pixel array, or the handle of a shared 
+        image (see shared_images).
     p_AE : array of float
         The x- and y-coordinates of the most lateral bony point of the 
         acetabulum, 1D array.
@@ -41,6 +47,7 @@ def plot_AI(img, p_AE, p_TC, angle_HRLP, name=None, outputfolder=None):
     None.
 
     """
+    img = as_image(img)
     
     # Create image and save
     plt.figure(dpi=300)
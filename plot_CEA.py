@@ -6,9 +6,14 @@ Created on Wed Jun 21 14:16:38 2023
 """
 
 import numpy as np
-import matplotlib.pyplot as plt
 import os
+import instrumentation
+from shared_images import as_image
+from lazy_imports import lazy_import, headless_backend
 
+plt = lazy_import('matplotlib.pyplot', setup=headless_backend)
+
+@instrumentation.timed()
 def plot_CEA(img, c_vals, p_A, angle_HRLP, name=None, outputfolder=None):
     """
     This function visualizes the center edge angle based on the femoral head 
@@ -17,8 +22,9 @@ def plot_CEA(img, c_vals, p_A, angle_HRLP, name=None, outputfolder=None):
 
     Parameters
     ----------
-    img : array of float
-        Matrix containing the image pixel array.
+    img : array of float or dict
+        Matrix containing the image pixel array, or the handle of a shared 
+        image (see shared_images).
     c_vals : list
         List containing the x-coordinate, y-coordinate and radius of the
         best fitting circle.
@@ -40,6 +46,7 @@ def plot_CEA(img, c_vals, p_A, angle_HRLP, name=None, outputfolder=None):
     None.
 
     """
+    img = as_image(img)
     
     # Adjust the horizontal reference line of the pelvis (HRLP) for 
     # the fact that the origin is at the top left of the image
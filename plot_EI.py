@@ -6,9 +6,14 @@ Created on Wed Jun 21 14:32:39 2023
 """
 
 import numpy as np
-import matplotlib.pyplot as plt
 import os
+import instrumentation
+from shared_images import as_image
+from lazy_imports import lazy_import, headless_backend
 
+plt = lazy_import('matplotlib.pyplot', setup=headless_backend)
+
+@instrumentation.timed()
 def plot_EI(img, EI_x0, EI_x1, EI_x2, c_vals, name=None, outputfolder=None):
     """
     This function visualizes the extrusion index. The resulting plot is saved  
@@ -16,8 +21,9 @@ def plot_EI(img, EI_x0, EI_x1, EI_x2, c_vals, name=None, outputfolder=None):
 
     Parameters
     ----------
-    img : array of float
-        Matrix containing the image pixel array.
+    img : array of float or dict
+        Matrix containing the image pixel array, or the handle of a shared 
+        image (see shared_images).
     EI_x0 : float
         x-coordinate of the most lateral point of the femoral head.
     EI_x1 : float
@@ -39,6 +45,7 @@ def plot_EI(img, EI_x0, EI_x1, EI_x2, c_vals, name=None, outputfolder=None):
     None.
 
     """
+    img = as_image(img)
     
     # Create image and save
     plt.figure(dpi=300)
@@ -6,9 +6,14 @@ Created on Wed Jun 21 15:03:50 2023
 """
 
 import numpy as np
-import matplotlib.pyplot as plt
 import os
+import instrumentation
+from shared_images import as_image
+from lazy_imports import lazy_import, headless_backend
 
+plt = lazy_import('matplotlib.pyplot', setup=headless_backend)
+
+@instrumentation.timed()
 def plot_NSA(img, slope_shaft_axis, intercept_shaft_axis, slope_neck_axis, 
              intercept_neck_axis, name=None, outputfolder=None):
     """
@@ -17,8 +22,9 @@ def plot_NSA(img, slope_shaft_axis, intercept_shaft_axis, slope_neck_axis,
 
     Parameters
     ----------
-    img : array of float
-        Matrix containing the image pixel array.
+    img : array of float or dict
+        Matrix containing the image pixel array, or the handle of a shared 
+        image (see shared_images).
     slope_shaft_axis : float
         The slope of the femoral neck axis.
     intercept_shaft_axis : float
@@ -39,6 +45,7 @@ def plot_NSA(img, slope_shaft_axis, intercept_shaft_axis, slope_neck_axis,
     None.
 
     """
+    img = as_image(img)
     
     # Create image and save
     plt.figure(dpi=300)
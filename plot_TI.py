@@ -6,9 +6,14 @@ Created on Thu Jun 22 09:26:16 2023
 """
 
 import numpy as np
-import matplotlib.pyplot as plt
 import os
+import instrumentation
+from shared_images import as_image
+from lazy_imports import lazy_import, headless_backend
 
+plt = lazy_import('matplotlib.pyplot', setup=headless_backend)
+
+@instrumentation.timed()
 def plot_TI(img, H, S, slope_neck_axis, intercept_neck_axis, c_vals, 
             name=None, outputfolder=None):
     """
@@ -17,8 +22,9 @@ def plot_TI(img, H, S, slope_neck_axis, intercept_neck_axis, c_vals,
 
     Parameters
     ----------
-    img : array of float
-        Matrix containing the image pixel array.
+    img : array of float or dict
+        Matrix containing the image pixel array, or the handle of a shared 
+        image (see shared_images).
     H : array of float
         The x- and y-coordinates of point H, which is the point at half the 
         radius from the femoral head center along the neck_axis, 1D array. 
@@ -43,6 +49,7 @@ def plot_TI(img, H, S, slope_neck_axis, intercept_neck_axis, c_vals,
     None.
 
     """
+    img = as_image(img)
     
     # Create image
     plt.figure(dpi=300)
@@ -6,9 +6,14 @@ Created on Thu Jun 22 09:16:08 2023
 """
 
 import numpy as np
-import matplotlib.pyplot as plt
 import os
+import instrumentation
+from shared_images import as_image
+from lazy_imports import lazy_import, headless_backend
 
+plt = lazy_import('matplotlib.pyplot', setup=headless_backend)
+
+@instrumentation.timed()
 def plot_alpha_angle(img, ap, c_n, c_vals, slope_neck_axis, 
                      intercept_neck_axis, name=None, outputfolder=None):
     """
@@ -17,8 +22,9 @@ def plot_alpha_angle(img, ap, c_n, c_vals, slope_neck_axis,
 
     Parameters
     ----------
-    img : array of float
-        Matrix containing the image pixel array.
+    img : array of float or dict
+        Matrix containing the image pixel array, or the handle of a shared 
+        image (see shared_images).
     ap : array of float
         The x- and y-coordinates of the found alpha point, 1D array.
     c_n : array of float
@@ -38,6 +44,7 @@ def plot_alpha_angle(img, ap, c_n, c_vals, slope_neck_axis,
     None.
 
     """
+    img = as_image(img)
     
     # Create image
     plt.figure(dpi=300)
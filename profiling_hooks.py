@@ -0,0 +1,225 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Mon Oct 19 10:03:17 2026
+
+Opt-in profiling hooks for single hips. A hip is profiled with cProfile and
+tracemalloc, but the profile is only saved if the hip exceeds the time or
+memory threshold. This way slow cases can be reproduced without profiling
+whole runs. The memory snapshot is taken by a watcher thread while the hip
+is running, as soon as the traced memory exceeds the memory threshold (and
+again each time it grows by another 10%), so it shows the allocations
+around the peak instead of what is left after the hip finished. Very short
+peaks in between two polls of the watcher can be missed.
+tracemalloc traces the whole process, so the hook is only valid for one
+hip at a time per process: hips profiled concurrently in threads get each
+other's allocations. If tracing was already started elsewhere, its peak is
+not reset, so the peak memory of the hip may include earlier allocations.
+
+@author: Fleur Boel, f.boel@erasmusmc.nl
+"""
+
+import os
+import json
+import time
+import cProfile
+import threading
+import tracemalloc
+from contextlib import contextmanager
+
+ENV_DIR = 'HIP_PROFILE_DIR'
+ENV_TIME = 'HIP_PROFILE_TIME'
+ENV_MEM = 'HIP_PROFILE_MEM'
+
+# Number of frames stored per allocation, and number of traceback statistics
+# saved next to the snapshot
+TRACE_FRAMES = 10
+TOP_STATS = 25
+
+
+def profiling_settings():
+    """
+    This function reads the profiling settings from the environment
+    variables HIP_PROFILE_DIR, HIP_PROFILE_TIME (seconds) and
+    HIP_PROFILE_MEM (megabytes).
+
+    Returns
+    -------
+    outputfolder : str
+        Folder where the profiles are saved, None if profiling is switched off.
+    time_limit : float
+        Time threshold in seconds, None if not set.
+    mem_limit : float
+        Memory threshold in megabytes, None if not set.
+
+    """
+    outputfolder = os.environ.get(ENV_DIR) or None
+    time_limit = os.environ.get(ENV_TIME)
+    mem_limit = os.environ.get(ENV_MEM)
+    if time_limit is not None:
+        time_limit = float(time_limit)
+    if mem_limit is not None:
+        mem_limit = float(mem_limit)
+
+    return outputfolder, time_limit, mem_limit
+
+
+@contextmanager
+def profile_hip(name, side, outputfolder=None, time_limit=None, mem_limit=None):
+    """
+    Context manager which profiles the processing of a single hip. If the
+    processing time exceeds time_limit or the peak traced memory exceeds
+    mem_limit, the cProfile statistics and the tracemalloc snapshot are
+    saved in the outputfolder, tagged with the image name and hip side.
+    If no outputfolder is given (and HIP_PROFILE_DIR is not set), or neither
+    threshold is set, nothing is profiled. Only one hip at a time can be
+    profiled per process, see the module docstring.
+
+    Parameters
+    ----------
+    name : str
+        Name of the image.
+    side : str
+        Hip side, e.g. 'R' or 'L'.
+    outputfolder : WindowsPath, optional
+        Folder where the profiles are saved. The default is None, in which
+        case HIP_PROFILE_DIR is used.
+    time_limit : float, optional
+        Time threshold in seconds. The default is None, in which case
+        HIP_PROFILE_TIME is used.
+    mem_limit : float, optional
+        Memory threshold in megabytes. The default is None, in which case
+        HIP_PROFILE_MEM is used.
+
+    Yields
+    ------
+    record : dict
+        Dictionary which is filled with the image name, hip side, elapsed
+        time, peak memory and the saved files once the context is left.
+
+    """
+    env_folder, env_time, env_mem = profiling_settings()
+    if outputfolder is None:
+        outputfolder = env_folder
+    if time_limit is None:
+        time_limit = env_time
+    if mem_limit is None:
+        mem_limit = env_mem
+
+    record = {'name': name, 'side': side, 'elapsed_s': None,
+              'peak_mb': None, 'files': []}
+    if outputfolder is None or (time_limit is None and mem_limit is None):
+        yield record
+        return
+
+    # Start tracing memory, unless this is already done elsewhere
+    started_tracing = False
+    if tracemalloc.is_tracing() is False:
+        tracemalloc.start(TRACE_FRAMES)
+        started_tracing = True
+    # The peak of another tracer is not reset
+    if started_tracing is True:
+        tracemalloc.reset_peak()
+    watcher = None
+    if mem_limit is not None:
+        watcher = _PeakWatcher(mem_limit * 1024**2)
+        watcher.start()
+
+    # Only one profiler can be active at the time, if another profiler is
+    # active only the memory and time are checked
+    prof = cProfile.Profile()
+    try:
+        prof.enable()
+        profiling = True
+    except ValueError:
+        profiling = False
+
+    t_start = time.perf_counter()
+    try:
+        yield record
+    finally:
+        elapsed = time.perf_counter() - t_start
+        if profiling is True:
+            prof.disable()
+        if watcher is not None:
+            watcher.stop()
+        peak = tracemalloc.get_traced_memory()[1] / 1024**2
+        record['elapsed_s'] = elapsed
+        record['peak_mb'] = peak
+
+        # Save the profiles if the hip exceeds one of the thresholds
+        too_slow = time_limit is not None and elapsed > time_limit
+        too_large = mem_limit is not None and peak > mem_limit
+        if too_slow is True or too_large is True:
+            snapshot = watcher.snapshot if watcher is not None else None
+            record['files'] = _save_profiles(outputfolder, name, side, record,
+                                             prof if profiling else None, snapshot)
+
+        if started_tracing is True:
+            tracemalloc.stop()
+
+
+class _PeakWatcher:
+    # Thread which polls the traced memory and takes a tracemalloc snapshot
+    # when it exceeds the limit, and again each time it grows by 10%
+
+    def __init__(self, limit, interval=0.01):
+        self.limit = limit
+        self.interval = interval
+        self.snapshot = None
+        self.snapshot_size = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            current = tracemalloc.get_traced_memory()[0]
+            if current > self.limit and current > 1.1*self.snapshot_size:
+                self.snapshot = tracemalloc.take_snapshot()
+                self.snapshot_size = current
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+
+def _save_profiles(outputfolder, name, side, record, prof, snapshot=None):
+    # Save the cProfile statistics, the tracemalloc snapshot (taken at the
+    # peak if available, else now), its largest traceback statistics and a
+    # small summary file with the tags of the hip
+    os.makedirs(outputfolder, exist_ok=True)
+    tag = '{}_{}'.format(os.path.basename(str(name)), side)
+    files = []
+
+    if prof is not None:
+        path_prof = os.path.join(outputfolder, tag+'.prof')
+        prof.dump_stats(path_prof)
+        files.append(path_prof)
+
+    if snapshot is None:
+        snapshot = tracemalloc.take_snapshot()
+    path_snap = os.path.join(outputfolder, tag+'.tracemalloc')
+    snapshot.dump(path_snap)
+    files.append(path_snap)
+
+    path_stats = os.path.join(outputfolder, tag+'_tracemalloc.txt')
+    with open(path_stats, 'w') as fw:
+        for stat in snapshot.statistics('traceback')[:TOP_STATS]:
+            fw.write('{} blocks, {:.1f} KiB\n'.format(stat.count, stat.size / 1024))
+            for line in stat.traceback.format():
+                fw.write(line + '\n')
+            fw.write('\n')
+    files.append(path_stats)
+
+    path_json = os.path.join(outputfolder, tag+'_profile.json')
+    with open(path_json, 'w') as fw:
+        json.dump({'name': str(name), 'side': side,
+                   'elapsed_s': record['elapsed_s'],
+                   'peak_mb': record['peak_mb'], 'files': files}, fw, indent=2)
+    files.append(path_json)
+    print('Profile saved for {} ({:.1f} s, {:.1f} MB)'.format(tag, record['elapsed_s'],
+                                                               record['peak_mb']))
+
+    return files
@@ -0,0 +1,225 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Tue Oct 20 10:02:47 2026
+
+Results store for batch runs: an SQLite file with one row per hip, keyed by
+image name and hip side. Rows are replaced when a hip is measured again.
+Next to the results, the fingerprint of the points file of each hip is
+stored (see incremental), so a later run can find the changed hips.
+
+@author: Fleur Boel, f.boel@erasmusmc.nl
+"""
+
+import csv
+import json
+import time
+import sqlite3
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    image TEXT NOT NULL,
+    side TEXT NOT NULL,
+    status TEXT NOT NULL,
+    error TEXT,
+    measures TEXT,
+    updated REAL,
+    PRIMARY KEY (image, side)
+)
+"""
+
+_SCHEMA_FINGERPRINTS = """
+CREATE TABLE IF NOT EXISTS fingerprints (
+    image TEXT NOT NULL,
+    side TEXT NOT NULL,
+    fingerprint TEXT NOT NULL,
+    PRIMARY KEY (image, side)
+)
+"""
+
+
+class ResultsStore:
+    """
+    SQLite-backed store of the result records of a run.
+
+    Parameters
+    ----------
+    filepath : WindowsPath
+        File path of the SQLite file, which is created if it does not exist.
+    """
+
+    def __init__(self, filepath):
+        self.filepath = str(filepath)
+        # The store may be written from a writer thread
+        self.conn = sqlite3.connect(self.filepath, check_same_thread=False)
+        self.conn.execute(_SCHEMA)
+        self.conn.execute(_SCHEMA_FINGERPRINTS)
+        self.conn.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self):
+        return self.conn.execute('SELECT COUNT(*) FROM results').fetchone()[0]
+
+    def close(self):
+        """
+        This function closes the store.
+
+        """
+        self.conn.close()
+
+    def put(self, record):
+        """
+        This function adds or replaces the record of a hip.
+
+        """
+        self.put_many([record])
+
+    def put_many(self, records):
+        """
+        This function adds or replaces the records of multiple hips in one
+        transaction.
+
+        Parameters
+        ----------
+        records : list
+            List of records, dicts with image, side, status, error and measures.
+            The fingerprint of a record is stored if the record contains one.
+
+        """
+        now = time.time()
+        rows = [(r['image'], r['side'], r['status'], r.get('error', ''),
+                 json.dumps(r.get('measures', {})), now) for r in records]
+        fingerprints = [(r['image'], r['side'], json.dumps(r['fingerprint'], sort_keys=True))
+                        for r in records if r.get('fingerprint') is not None]
+        with self.conn:
+            self.conn.executemany('INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?, ?)',
+                                  rows)
+            self.conn.executemany('INSERT OR REPLACE INTO fingerprints VALUES (?, ?, ?)',
+                                  fingerprints)
+
+    def get(self, image, side):
+        """
+        This function returns the record of a hip, None if it is not stored.
+
+        """
+        row = self.conn.execute('SELECT * FROM results WHERE image = ? AND side = ?',
+                                (image, side)).fetchone()
+        return None if row is None else _row_to_record(row)
+
+    def get_fingerprint(self, image, side):
+        """
+        This function returns the stored fingerprint of the points file of a
+        hip, None if it is not stored.
+
+        """
+        row = self.conn.execute('SELECT fingerprint FROM fingerprints WHERE image = ? AND '
+                                'side = ?', (image, side)).fetchone()
+        return None if row is None else json.loads(row[0])
+
+    def fingerprints(self):
+        """
+        This function returns the stored fingerprints as a dictionary with the
+        (image, side) key.
+
+        """
+        return {(row[0], row[1]): json.loads(row[2]) for row in
+                self.conn.execute('SELECT image, side, fingerprint FROM fingerprints')}
+
+    def update_measures(self, image, side, measures, fingerprint=None):
+        """
+        This function updates measures of a stored hip in place, the other
+        measures of the hip are kept.
+
+        Parameters
+        ----------
+        image : str
+            Name of the image.
+        side : str
+            Hip side, 'R' or 'L'.
+        measures : dict
+            The updated measures.
+        fingerprint : dict, optional
+            The new fingerprint of the points file of the hip. The default is
+            None, in which case the stored fingerprint is kept.
+
+        """
+        record = self.get(image, side)
+        if record is None:
+            raise KeyError('No record is stored for {} ({})'.format(image, side))
+        figures = list(record['measures'].get('figures', []))
+        record['measures'].update(measures)
+        for figure in measures.get('figures', []):
+            if figure not in figures:
+                figures.append(figure)
+        if figures:
+            record['measures']['figures'] = figures
+        record['fingerprint'] = fingerprint
+        self.put_many([record])
+
+    def records(self, status=None):
+        """
+        This function returns all records ordered by image name and hip side.
+
+        Parameters
+        ----------
+        status : str, optional
+            Only return records with this status, e.g. 'ok'. The default is
+            None, in which case all records are returned.
+
+        Returns
+        -------
+        records : list
+            List of records.
+
+        """
+        if status is None:
+            rows = self.conn.execute('SELECT * FROM results ORDER BY image, side')
+        else:
+            rows = self.conn.execute('SELECT * FROM results WHERE status = ? '
+                                     'ORDER BY image, side', (status,))
+        return [_row_to_record(row) for row in rows]
+
+    def keys(self):
+        """
+        This function returns the (image, side) keys of all stored hips.
+
+        """
+        return [tuple(row) for row in
+                self.conn.execute('SELECT image, side FROM results ORDER BY image, side')]
+
+    def export_csv(self, filepath, measures=None):
+        """
+        This function writes all records to a CSV file with one row per hip.
+
+        Parameters
+        ----------
+        filepath : WindowsPath
+            File path of the CSV file.
+        measures : list, optional
+            Measures to include as columns. The default is None, in which case
+            all measures found in the records are used.
+
+        """
+        records = self.records()
+        if measures is None:
+            measures = []
+            for record in records:
+                for key in record['measures']:
+                    if key not in measures and key != 'figures':
+                        measures.append(key)
+
+        with open(filepath, 'w', newline='') as fw:
+            writer = csv.writer(fw)
+            writer.writerow(['image', 'side', 'status', 'error'] + measures)
+            for r in records:
+                writer.writerow([r['image'], r['side'], r['status'], r['error']] +
+                                [r['measures'].get(m, '') for m in measures])
+
+
+def _row_to_record(row):
+    return {'image': row[0], 'side': row[1], 'status': row[2], 'error': row[3],
+            'measures': json.loads(row[4]) if row[4] else {}, 'updated': row[5]}
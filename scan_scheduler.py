@@ -0,0 +1,191 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Tue Oct 20 14:31:09 2026
+
+Memory-bounded scheduling of scans. The decoded size of each scan is
+estimated from its header before it is decoded, and scans are only admitted
+while the estimated size of all scans in flight stays below a memory budget.
+Large and small scans are interleaved, so the workers stay busy while a
+large scan waits for memory.
+
+@author: Fleur Boel, f.boel@erasmusmc.nl
+"""
+
+import os
+import math
+import struct
+import asyncio
+from lazy_imports import lazy_import
+
+pydicom = lazy_import('pydicom')
+
+
+def estimate_footprint(filepath):
+    """
+    This function estimates the size of the decoded pixel array of an image
+    from its header, without decoding the pixel data. For DICOM images this
+    is rows x columns x bytes per pixel (x samples x frames), for PNG images
+    the image is read by matplotlib as float32 per channel. For other
+    formats four times the file size is used.
+
+    Parameters
+    ----------
+    filepath : WindowsPath
+        WindowsPath object containing the file path to the image file.
+
+    Returns
+    -------
+    nbytes : int
+        Estimated size of the decoded image in bytes.
+
+    """
+    filepath = str(filepath)
+    if filepath[-3:] in ('dcm', 'DCM'):
+        hdr = pydicom.dcmread(filepath, stop_before_pixels=True)
+        rows = int(getattr(hdr, 'Rows', 0))
+        cols = int(getattr(hdr, 'Columns', 0))
+        bits = int(getattr(hdr, 'BitsAllocated', 16))
+        samples = int(getattr(hdr, 'SamplesPerPixel', 1))
+        frames = int(getattr(hdr, 'NumberOfFrames', 1) or 1)
+        return rows * cols * math.ceil(bits/8) * samples * frames
+
+    if filepath[-3:] in ('png', 'PNG'):
+        with open(filepath, 'rb') as fr:
+            header = fr.read(26)
+        # Width and height are stored in the IHDR chunk, colour type at byte 25
+        width, height = struct.unpack('>II', header[16:24])
+        channels = {0: 1, 2: 3, 3: 3, 4: 2, 6: 4}.get(header[25], 4)
+        return width * height * 4 * channels
+
+    return 4 * os.path.getsize(filepath)
+
+
+def image_shape(filepath):
+    """
+    This function reads the number of rows and columns of an image from its
+    header, without decoding the pixel data, for DICOM and PNG images.
+
+    Parameters
+    ----------
+    filepath : WindowsPath
+        WindowsPath object containing the file path to the image file.
+
+    Returns
+    -------
+    shape : tuple of int
+        The number of rows and columns, None for other formats.
+
+    """
+    filepath = str(filepath)
+    if filepath[-3:] in ('dcm', 'DCM'):
+        hdr = pydicom.dcmread(filepath, stop_before_pixels=True)
+        return int(getattr(hdr, 'Rows', 0)), int(getattr(hdr, 'Columns', 0))
+
+    if filepath[-3:] in ('png', 'PNG'):
+        with open(filepath, 'rb') as fr:
+            header = fr.read(24)
+        width, height = struct.unpack('>II', header[16:24])
+        return height, width
+
+    return None
+
+
+def interleave_by_size(names, footprints):
+    """
+    This function orders the scans by alternating the largest and the
+    smallest remaining scan, so large scans are spread over the run.
+
+    Parameters
+    ----------
+    names : list
+        Names of the scans.
+    footprints : list
+        Estimated decoded size of each scan in bytes.
+
+    Returns
+    -------
+    order : list
+        List of (name, footprint) tuples in processing order.
+
+    """
+    by_size = sorted(zip(names, footprints), key=lambda item: item[1], reverse=True)
+    order = []
+    i = 0
+    j = len(by_size) - 1
+    while i <= j:
+        order.append(by_size[i])
+        if i != j:
+            order.append(by_size[j])
+        i += 1
+        j -= 1
+    return order
+
+
+class MemoryBudget:
+    """
+    Admission of scans within a memory budget, for use in an asyncio
+    pipeline. A scan is admitted if the estimated size of all scans in flight
+    plus the new scan stays within the budget. If the next scan does not fit,
+    the first later scan which does fit is admitted instead. A scan larger
+    than the whole budget is admitted once nothing else is in flight.
+
+    Parameters
+    ----------
+    budget : int
+        Memory budget in bytes.
+    scans : list
+        List of (name, footprint) tuples in the preferred order.
+    overhead : float, optional
+        Factor applied to each footprint to account for copies made while
+        decoding and sharing the image. The default is 2.
+    """
+
+    def __init__(self, budget, scans, overhead=2.0):
+        self.budget = budget
+        self.overhead = overhead
+        self.pending = [(name, int(nbytes*overhead)) for name, nbytes in scans]
+        self.in_flight = 0
+        self.peak = 0
+        self._cond = asyncio.Condition()
+
+    def _pick(self):
+        # First pending scan which fits in the remaining budget
+        for i, (name, nbytes) in enumerate(self.pending):
+            if self.in_flight + nbytes <= self.budget:
+                return i
+        if self.in_flight == 0 and len(self.pending) > 0:
+            return 0
+        return None
+
+    async def acquire(self):
+        """
+        This function waits until a scan can be admitted.
+
+        Returns
+        -------
+        name : str
+            Name of the admitted scan, None if no scans are left.
+        nbytes : int
+            Reserved memory for the scan, to be returned with release.
+
+        """
+        async with self._cond:
+            while True:
+                if len(self.pending) == 0:
+                    return None, 0
+                i = self._pick()
+                if i is not None:
+                    name, nbytes = self.pending.pop(i)
+                    self.in_flight += nbytes
+                    self.peak = max(self.peak, self.in_flight)
+                    return name, nbytes
+                await self._cond.wait()
+
+    async def release(self, nbytes):
+        """
+        This function returns the reserved memory of a finished scan.
+
+        """
+        async with self._cond:
+            self.in_flight -= nbytes
+            self._cond.notify_all()
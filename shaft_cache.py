@@ -0,0 +1,338 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Thu Oct 22 13:18:44 2026
+
+Persistent content-addressed cache of the shaft axis. The key is a hash of
+the pixel data, the landmark and Otsu parameters and the code version (the
+source of all modules the shaft axis depends on, see SHAFT_MODULES, and the
+NumPy and scikit-image versions), so a cached shaft axis is only reused for
+exactly the same input and code. Each entry is a small
+JSON file, the least recently used entries are removed when the cache
+exceeds its size limit. The cache can be shared by runs and machines.
+
+The cache is switched off by default and can be switched on with
+set_cache() or by setting the environment variable HIP_SHAFT_CACHE to the
+cache folder (and optionally HIP_SHAFT_CACHE_MB to the size limit).
+
+@author: Fleur Boel, f.boel@erasmusmc.nl
+"""
+
+import os
+import sys
+import json
+import hashlib
+import inspect
+import functools
+import importlib.util
+import numpy as np
+import instrumentation
+from shared_images import is_image_handle, as_image
+
+ENV_DIR = 'HIP_SHAFT_CACHE'
+ENV_SIZE = 'HIP_SHAFT_CACHE_MB'
+
+# Default size limit in megabytes
+DEFAULT_SIZE_MB = 256
+
+# Version of the cache format, increase to invalidate all entries
+CACHE_VERSION = 1
+
+# Modules of which the source is part of the code version, a module which
+# the shaft axis starts to depend on should be added here
+SHAFT_MODULES = ('calc_shaft_axis', 'calc_shaft_axis_pelvic', 'shaft_multires', 'shaft_streaming',
+                 'shaft_window', 'multi_otsu', 'line_fit', 'jit_kernels', 'shared_images',
+                 'shaft_cache')
+
+_cache = None
+_versions = {}
+# Pixel digests of shared images in this process: handle key -> digest
+_digests = {}
+
+
+class ShaftCache:
+    """
+    On-disk cache with one JSON file per entry and least recently used
+    eviction.
+
+    Parameters
+    ----------
+    folder : WindowsPath
+        Folder of the cache, which is created if it does not exist.
+    max_bytes : int, optional
+        Size limit of the cache in bytes. The default is DEFAULT_SIZE_MB.
+    prune_interval : int, optional
+        Number of added entries after which the size limit is checked. The
+        default is 256.
+    """
+
+    def __init__(self, folder, max_bytes=DEFAULT_SIZE_MB*1024**2, prune_interval=256):
+        self.folder = str(folder)
+        self.max_bytes = max_bytes
+        self.prune_interval = prune_interval
+        self.hits = 0
+        self.misses = 0
+        self._n_put = 0
+        os.makedirs(self.folder, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.folder, key[:2], key+'.json')
+
+    def get(self, key):
+        """
+        This function returns the cached value of a key, None if the key is
+        not in the cache.
+
+        """
+        filepath = self._path(key)
+        try:
+            with open(filepath, 'r') as fr:
+                value = json.load(fr)['value']
+        except (OSError, ValueError, KeyError):
+            self.misses += 1
+            instrumentation.count('shaft_cache_miss')
+            return None
+        # Mark the entry as recently used
+        try:
+            os.utime(filepath)
+        except OSError:
+            pass
+        self.hits += 1
+        instrumentation.count('shaft_cache_hit')
+        return value
+
+    def put(self, key, value):
+        """
+        This function adds a JSON serializable value to the cache.
+
+        """
+        filepath = self._path(key)
+        os.makedirs(os.path.dirname(filepath), exist_ok=True)
+        # Write to a temporary file first, so other processes never read a
+        # partially written entry
+        tmp = '{}.{}.tmp'.format(filepath, os.getpid())
+        with open(tmp, 'w') as fw:
+            json.dump({'value': value}, fw)
+        os.replace(tmp, filepath)
+        self._n_put += 1
+        if self._n_put % self.prune_interval == 0:
+            self.prune()
+
+    def size(self):
+        """
+        This function returns the number of entries and the total size of the
+        cache in bytes.
+
+        """
+        entries = self._entries()
+        return len(entries), sum(entry[1] for entry in entries)
+
+    def _entries(self):
+        # (modification time, size, path) of all entries
+        entries = []
+        for root, dirs, files in os.walk(self.folder):
+            for f in files:
+                if f.endswith('.json'):
+                    try:
+                        st = os.stat(os.path.join(root, f))
+                    except OSError:
+                        continue
+                    entries.append((st.st_mtime, st.st_size, os.path.join(root, f)))
+        return entries
+
+    def prune(self):
+        """
+        This function removes the least recently used entries until the cache
+        is within its size limit.
+
+        Returns
+        -------
+        n_removed : int
+            Number of removed entries.
+
+        """
+        entries = sorted(self._entries())
+        total = sum(entry[1] for entry in entries)
+        n_removed = 0
+        for mtime, nbytes, filepath in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(filepath)
+            except OSError:
+                continue
+            total -= nbytes
+            n_removed += 1
+        return n_removed
+
+    def clear(self):
+        """
+        This function removes all entries.
+
+        """
+        for mtime, nbytes, filepath in self._entries():
+            try:
+                os.remove(filepath)
+            except OSError:
+                pass
+
+
+def set_cache(folder, max_mb=DEFAULT_SIZE_MB):
+    """
+    This function switches the shaft-axis cache on for this process and the
+    worker processes started after the call.
+
+    Parameters
+    ----------
+    folder : WindowsPath
+        Folder of the cache, None to switch the cache off.
+    max_mb : float, optional
+        Size limit of the cache in megabytes. The default is DEFAULT_SIZE_MB.
+
+    """
+    global _cache
+    if folder is None:
+        os.environ.pop(ENV_DIR, None)
+        _cache = None
+        return
+    # Worker processes read the settings from the environment
+    os.environ[ENV_DIR] = str(folder)
+    os.environ[ENV_SIZE] = str(max_mb)
+    _cache = ShaftCache(folder, int(max_mb*1024**2))
+
+
+def get_cache():
+    """
+    This function returns the shaft-axis cache, None if it is switched off.
+
+    """
+    global _cache
+    folder = os.environ.get(ENV_DIR, '')
+    if folder == '':
+        return None
+    if _cache is None or _cache.folder != folder:
+        max_mb = float(os.environ.get(ENV_SIZE, DEFAULT_SIZE_MB))
+        _cache = ShaftCache(folder, int(max_mb*1024**2))
+    return _cache
+
+
+def code_version(func):
+    """
+    This function returns the code version of a cached function: a hash of
+    the source of its module and of the modules in SHAFT_MODULES, and of the
+    NumPy and scikit-image versions.
+
+    """
+    module = func.__module__
+    if module not in _versions:
+        h = hashlib.sha256('{}'.format(CACHE_VERSION).encode())
+        for name in sorted(set(SHAFT_MODULES) | {module}):
+            filepath = _module_file(name)
+            h.update(name.encode())
+            if filepath is not None:
+                with open(filepath, 'rb') as fr:
+                    h.update(fr.read())
+        h.update(np.__version__.encode())
+        try:
+            from importlib.metadata import version
+            h.update(version('scikit-image').encode())
+        except Exception:
+            pass
+        _versions[module] = h.hexdigest()
+    return _versions[module]
+
+
+def _module_file(name):
+    # File path of the source of a module, without importing it
+    module = sys.modules.get(name)
+    if module is not None:
+        return getattr(module, '__file__', None)
+    try:
+        spec = importlib.util.find_spec(name)
+    except (ImportError, ValueError):
+        return None
+    return spec.origin if spec is not None and spec.has_location else None
+
+
+def pixel_digest(img):
+    """
+    This function returns a hash of the pixel data, shape and data type of
+    an image. The hash of a shared image is computed once per process.
+
+    Parameters
+    ----------
+    img : array of float or dict
+        Matrix containing the image pixel array, or the handle of a shared
+        image.
+
+    Returns
+    -------
+    digest : str
+        Hexadecimal hash of the image.
+
+    """
+    handle_key = None
+    if is_image_handle(img):
+        handle_key = img['name'] if img['kind'] == 'shm' else img['path']
+        if handle_key in _digests:
+            return _digests[handle_key]
+    arr = np.ascontiguousarray(as_image(img))
+    h = hashlib.blake2b(digest_size=20)
+    h.update('{}{}'.format(arr.shape, arr.dtype.str).encode())
+    h.update(memoryview(arr).cast('B'))
+    digest = h.hexdigest()
+    if handle_key is not None:
+        if len(_digests) > 64:
+            _digests.clear()
+        _digests[handle_key] = digest
+    return digest
+
+
+def _param(value):
+    # JSON representation of a parameter value
+    if isinstance(value, (np.ndarray, np.generic, list, tuple)):
+        return np.asarray(value, dtype=float).tolist()
+    return value
+
+
+def cached(ignore=('name', 'plot')):
+    """
+    Decorator which caches the result of a shaft-axis function. The key
+    consists of the pixel digest of the img argument, the other arguments
+    (except those in ignore) and the code version. Calls with plot=True are
+    not cached, since the plot needs the intermediate results.
+
+    Parameters
+    ----------
+    ignore : tuple, optional
+        Arguments which do not change the result. The default is
+        ('name', 'plot').
+
+    """
+    def decorator(func):
+        signature = inspect.signature(func)
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            cache = get_cache()
+            if cache is None:
+                return func(*args, **kwargs)
+            bound = signature.bind(*args, **kwargs)
+            bound.apply_defaults()
+            if bound.arguments.get('plot') is True:
+                return func(*args, **kwargs)
+
+            params = {name: _param(value) for name, value in bound.arguments.items()
+                      if name != 'img' and name not in ignore}
+            text = json.dumps([func.__qualname__, code_version(func),
+                               pixel_digest(bound.arguments['img']), params], sort_keys=True)
+            key = hashlib.sha256(text.encode()).hexdigest()
+
+            value = cache.get(key)
+            if value is not None:
+                return tuple(value)
+            value = func(*args, **kwargs)
+            cache.put(key, [_param(v) for v in value])
+            return value
+
+        return wrapper
+    return decorator
@@ -0,0 +1,258 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Fri Oct 23 11:02:54 2026
+
+Coarse-to-fine shaft-axis determination for large (e.g. full-leg) images.
+The crop below the minor trochanter is downsampled by block averaging, the
+cortical bone is segmented with the multi-otsu thresholds of the crop (see
+multi_otsu) and closing on the coarse level, and the lateral and medial
+edges are found per coarse row.
+The edges are then refined at full resolution in narrow strips around the
+coarse edges only. The strips are segmented and closed on image-aligned
+columns, per chunk of rows. The midpoints and the regression line are
+determined as in calc_shaft_axis. The result is close to, but not identical
+with, the full-resolution shaft axis: edges outside the strips are not
+found, and the closing only sees the pixels around the strips.
+compare_multires checks the result against the full-resolution shaft axis.
+
+@author: Fleur Boel, f.boel@erasmusmc.nl
+"""
+
+import time
+import inspect
+import numpy as np
+import instrumentation
+import shaft_cache
+from shared_images import as_image
+from lazy_imports import lazy_import
+from calc_shaft_axis import calc_shaft_axis, shaft_edges, edge_midpoints
+from multi_otsu import crop_thresholds, DEFAULT_BINS
+from line_fit import fit_shaft_line
+
+morphology = lazy_import('skimage.morphology')
+
+# Margin in rows and columns around the strips of a chunk of rows, so the
+# 5x5 closing of the strips sees the same pixels as in the image
+HALO = 4
+
+
+def downsample(img, factor):
+    """
+    This function downsamples an image by averaging blocks of factor x
+    factor pixels. Rows and columns which do not fill a whole block are
+    dropped.
+
+    Parameters
+    ----------
+    img : array of float
+        Matrix containing the image pixel array.
+    factor : int
+        Downsampling factor.
+
+    Returns
+    -------
+    coarse : array of float
+        The downsampled image.
+
+    """
+    rows = (img.shape[0]//factor)*factor
+    cols = (img.shape[1]//factor)*factor
+    blocks = np.asarray(img[:rows, :cols], dtype=np.float32)
+    return blocks.reshape(rows//factor, factor, cols//factor, factor).mean(axis=(1, 3))
+
+
+def _strip_edges(img_c, starts, width, thres, first=True, chunk=64):
+    # Segment the full-resolution strips around the coarse edges and find
+    # the edge in each row. Per chunk of rows the image is segmented and
+    # closed over the columns of all strips of the chunk (plus HALO), so
+    # pixels are only merged with the pixels around them in the image, and
+    # the strips are then stacked as a (rows x width) band
+    img_c = np.asarray(img_c)
+    n_rows, n_cols = img_c.shape
+    starts = np.asarray(starts, dtype=np.int64)
+    edge = np.zeros(n_rows, dtype=np.int64)
+    found = np.zeros(n_rows, dtype=bool)
+    for r0 in range(0, n_rows, chunk):
+        r1 = min(r0+chunk, n_rows)
+        h0, h1 = max(r0-HALO, 0), min(r1+HALO, n_rows)
+        c0 = max(int(starts[h0:h1].min())-HALO, 0)
+        c1 = min(int(starts[h0:h1].max())+width+HALO, n_cols)
+        if c1 <= c0:
+            continue
+        with instrumentation.stage('closing'):
+            mask = morphology.closing(img_c[h0:h1, c0:c1] > thres, morphology.square(5))
+        cols = starts[r0:r1, None] + np.arange(width)[None, :] - c0
+        rows = np.arange(r0-h0, r1-h0)
+        band = mask[rows[:, None], np.clip(cols, 0, c1-c0-1)] & (cols >= 0) & (cols < c1-c0)
+        found[r0:r1] = band.any(axis=1)
+        if first is True:
+            edge[r0:r1] = starts[r0:r1] + band.argmax(axis=1)
+        else:
+            edge[r0:r1] = starts[r0:r1] + width - np.flip(band, axis=1).argmax(axis=1)
+    return edge, found
+
+
+@instrumentation.timed()
+@shaft_cache.cached()
+def calc_shaft_axis_multires(img, p_TMI, radius, name, otsu_levels=3, otsu_thres=1,
+                             factor=4, strip=6, otsu_bins=DEFAULT_BINS,
+                             window=None, fit_method='polyfit'):
+    """
+    This function calculates the shaft axis like calc_shaft_axis, but
+    segments the cortical bone on a downsampled image and refines the edges
+    at full resolution in strips around the coarse edges. The function will
+    return the string "NaN" for the slope and intercept if the shaft axis
+    could not be determined.
+
+    Parameters
+    ----------
+    img : array of float or dict
+        Matrix containing the image pixel array, or the handle of a shared
+        image (see shared_images).
+    p_TMI : array of float
+        The x- and y-coordinates of the inferior point of the minor
+        trochanter, 1D array.
+    radius: float
+        The radius of the best-fitting circle around the femoral head.
+    name: str
+        String containing the name for which the shaft axis is determined.
+    otsu_levels : int, optional
+        Number of classes used in the multi-otsu thresholding. The default is 3.
+    otsu_thres : int, optional
+        Indicate which class threshold value of the multi-otsu thresholding
+        is used to create the segmentation mask. The default is 1.
+    factor : int, optional
+        Downsampling factor of the coarse level. The default is 4.
+    strip : int, optional
+        Number of full-resolution pixels searched on both sides of a coarse
+        edge. The default is 6.
+    otsu_bins : int, optional
+        Maximum number of histogram bins of the multi-otsu thresholding (see
+        multi_otsu). The default is None, which gives the thresholds of
+        skimage.filters.threshold_multiotsu.
+    window : tuple of int, optional
+        The first column and the column after the last column of the image
+        which contain the shaft, see shaft_window. The default is None, in
+        which case the full image width is used.
+    fit_method : str, optional
+        'polyfit', 'theil-sen' or 'ransac', see calc_shaft_axis. The default
+        is 'polyfit'.
+
+    Returns
+    -------
+    sa_slope : float
+        The slope of the shaft axis.
+    sa_intercept : float
+        The intercept of the shaft axis.
+    """
+    img = as_image(img)
+
+    tm_cut = round(p_TMI[1])
+    dist = np.size(img, axis=0)-tm_cut
+    if dist <= 0.5*radius:
+        print("The shaft axis could not be determined for {}, too little of the shaft was depicted on the radiograph.".format(name))
+        return 'NaN', 'NaN'
+    if dist < radius:
+        print("Please note that the shaft angle for {} is determined on only a small part of the shaft".format(name))
+    if window is None:
+        window = (0, np.size(img, axis=1))
+    cols = slice(window[0], window[1])
+    img_c = img[tm_cut:np.size(img, axis=0), cols]
+
+    # The thresholds are determined on the histogram of the full-resolution crop
+    with instrumentation.stage('threshold_multiotsu'):
+        thres = crop_thresholds(img, otsu_levels, slice(tm_cut, None), cols, otsu_bins)
+
+    # Coarse level: segment the cortical bone on the downsampled image
+    coarse = downsample(img_c, factor)
+    with instrumentation.stage('closing'):
+        mask_coarse = morphology.closing(coarse > thres[otsu_thres], morphology.square(3))
+    first_c, last_c = shaft_edges(mask_coarse)
+
+    # Coarse edges of each full-resolution row, the rows below the last
+    # whole block use the last coarse row
+    coarse_row = np.minimum(np.arange(img_c.shape[0])//factor, len(first_c)-1)
+    first_c = np.asarray(first_c)[coarse_row]*factor
+    last_c = np.asarray(last_c)[coarse_row]*factor
+
+    # Fine level: refine the edges in strips around the coarse edges
+    width = factor + 2*strip
+    indices_first, found_first = _strip_edges(img_c, first_c-strip, width, thres[otsu_thres],
+                                              first=True)
+    indices_last, found_last = _strip_edges(img_c, last_c-factor-strip, width,
+                                            thres[otsu_thres], first=False)
+    indices_first = np.where(found_first, indices_first, first_c)
+    indices_last = np.where(found_last, indices_last, last_c)
+
+    pts_l, pts_m, adj_midpoints = edge_midpoints(indices_first, indices_last, tm_cut, window[0],
+                                                 fit_method == 'polyfit')
+    sa_slope, sa_intercept = fit_shaft_line(adj_midpoints, fit_method)
+
+    return sa_slope, sa_intercept
+
+
+def _axis_angle(slope):
+    # Angle of a line with the horizontal axis in degrees, 0 to 180
+    return np.degrees(np.arctan(slope)) % 180
+
+
+def compare_multires(img, p_TMI, radius, name=None, otsu_levels=3, otsu_thres=1,
+                     factor=4, strip=6, otsu_bins=DEFAULT_BINS, window=None, tolerance=0.5):
+    """
+    This function checks the coarse-to-fine shaft axis against the
+    full-resolution shaft axis of calc_shaft_axis and reports the time of
+    both.
+
+    Parameters
+    ----------
+    img : array of float or dict
+        Matrix containing the image pixel array, or the handle of a shared
+        image.
+    p_TMI : array of float
+        The x- and y-coordinates of the inferior point of the minor
+        trochanter, 1D array.
+    radius: float
+        The radius of the best-fitting circle around the femoral head.
+    name: str, optional
+        Name used for messages. The default is None.
+    otsu_levels, otsu_thres, factor, strip, otsu_bins : int, optional
+        See calc_shaft_axis_multires.
+    window : tuple of int, optional
+        See calc_shaft_axis_multires.
+    tolerance : float, optional
+        Maximum accepted difference of the shaft-axis angle in degrees. The
+        default is 0.5.
+
+    Returns
+    -------
+    report : dict
+        Dictionary with the slopes of both methods, the angle difference in
+        degrees, the time of both methods in seconds and whether the
+        difference is within the tolerance.
+
+    """
+    img = as_image(img)
+    t = time.perf_counter()
+    # The cache is bypassed, so both methods are actually run
+    slope_full, intercept_full = inspect.unwrap(calc_shaft_axis)(img, p_TMI, radius, name,
+                                                                 otsu_levels, otsu_thres,
+                                                                 otsu_bins=otsu_bins, window=window)
+    time_full = time.perf_counter() - t
+    t = time.perf_counter()
+    slope_multi, intercept_multi = inspect.unwrap(calc_shaft_axis_multires)(
+        img, p_TMI, radius, name, otsu_levels, otsu_thres, factor, strip, otsu_bins, window)
+    time_multi = time.perf_counter() - t
+
+    report = {'slope_full': slope_full, 'slope_multires': slope_multi,
+              'time_full': time_full, 'time_multires': time_multi}
+    if slope_full == 'NaN' or slope_multi == 'NaN':
+        report['difference'] = 'NaN'
+        report['within_tolerance'] = slope_full == slope_multi
+    else:
+        difference = abs(_axis_angle(slope_full) - _axis_angle(slope_multi))
+        report['difference'] = float(min(difference, 180-difference))
+        report['within_tolerance'] = report['difference'] <= tolerance
+    if report['within_tolerance'] is False:
+        print('The multi-resolution shaft axis of {} differs {} degrees from the full-resolution shaft axis'.format(name, report['difference']))
+
+    return report
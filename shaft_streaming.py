@@ -0,0 +1,222 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sat Oct 24 09:47:31 2026
+
+Streaming shaft-axis determination with a memory use which does not grow
+with the length of the depicted shaft, e.g. for full-leg images or
+memory-mapped images (see shared_images). The crop below the minor
+trochanter is processed in chunks of rows:
+    - the multi-otsu histogram of the crop is accumulated per chunk
+      (see multi_otsu.stream_crop_histogram)
+    - each chunk is thresholded and closed with a halo of rows of the
+      neighbouring chunks, so the mask is the same as that of the whole crop
+    - the closest medial point of a lateral point lies within the rows
+      whose distance is at most the distance to the medial point of the
+      same row, so only a band of edge points around the chunk is kept
+    - the midpoints are not stored, only the number of midpoints and the
+      sum of their y-coordinates per x-coordinate (the x-coordinates are
+      multiples of 0.5 within the crop). From these running statistics
+      the mean-based outlier filter and the regression line are computed
+      at the end, in the same way as calc_shaft_axis.
+
+@author: Fleur Boel, f.boel@erasmusmc.nl
+"""
+
+import numpy as np
+import instrumentation
+import shaft_cache
+from shared_images import as_image
+from lazy_imports import lazy_import
+from multi_otsu import stream_crop_histogram, histogram_thresholds, DEFAULT_BINS
+from calc_shaft_axis import closest_points, shaft_edges
+
+morphology = lazy_import('skimage.morphology')
+
+# Rows of the neighbouring chunks needed for the closing with square(5):
+# two rows for the dilation and two rows for the erosion
+HALO = 4
+
+
+class MidpointStats:
+    """
+    Running statistics of the midpoints per x-coordinate, from which the
+    outlier filter and the regression line of calc_shaft_axis are computed
+    without storing the midpoints.
+
+    Parameters
+    ----------
+    width : int
+        Number of columns of the crop.
+    tm_cut : int
+        Row of the image at which the crop starts.
+    col_cut : int, optional
+        Column of the image at which the crop starts. The default is 0.
+    """
+
+    def __init__(self, width, tm_cut, col_cut=0):
+        self.tm_cut = tm_cut
+        self.col_cut = col_cut
+        # Index k corresponds to the x-coordinate k/2 + col_cut
+        self.counts = np.zeros(2*width+1, dtype=np.int64)
+        self.sum_y = np.zeros(2*width+1)
+
+    def add(self, x_sum, y_sum):
+        """
+        This function adds midpoints, given as the sums of the coordinates
+        of the lateral and medial points in the cropped image.
+
+        """
+        np.add.at(self.counts, x_sum, 1)
+        np.add.at(self.sum_y, x_sum, y_sum/2 + self.tm_cut)
+
+    def fit(self):
+        """
+        This function removes the outliers (see edge_midpoints) and fits the
+        regression line through the remaining midpoints.
+
+        Returns
+        -------
+        sa_slope : float
+            The slope of the regression line, 'NaN' if it could not be fitted.
+        sa_intercept : float
+            The intercept of the regression line, 'NaN' if it could not be
+            fitted.
+
+        """
+        x = np.arange(len(self.counts))/2 + self.col_cut
+        n = self.counts.sum()
+        if n == 0:
+            return 'NaN', 'NaN'
+        mean_x = np.sum(self.counts*x)/n
+        keep = (self.counts > 0) & (np.abs(x-mean_x) < 0.1*mean_x)
+        counts = self.counts[keep]
+        x = x[keep]
+        sum_y = self.sum_y[keep]
+        n = counts.sum()
+        if len(counts) < 2:
+            return 'NaN', 'NaN'
+        mean_x = np.sum(counts*x)/n
+        mean_y = np.sum(sum_y)/n
+        sa_slope = np.sum((x-mean_x)*sum_y) / np.sum(counts*(x-mean_x)**2)
+        sa_intercept = mean_y - sa_slope*mean_x
+        return sa_slope, sa_intercept
+
+
+@instrumentation.timed()
+@shaft_cache.cached()
+def calc_shaft_axis_streaming(img, p_TMI, radius, name, otsu_levels=3, otsu_thres=1,
+                              otsu_bins=DEFAULT_BINS, window=None, chunk_rows=256):
+    """
+    This function calculates the shaft axis like calc_shaft_axis, but
+    processes the crop below the minor trochanter in chunks of rows, see the
+    module docstring. The function will return the string "NaN" for the
+    slope and intercept if the shaft axis could not be determined.
+
+    Parameters
+    ----------
+    img : array of float or dict
+        Matrix containing the image pixel array, or the handle of a shared
+        image (see shared_images).
+    p_TMI : array of float
+        The x- and y-coordinates of the inferior point of the minor
+        trochanter, 1D array.
+    radius: float
+        The radius of the best-fitting circle around the femoral head.
+    name: str
+        String containing the name for which the shaft axis is determined.
+    otsu_levels : int, optional
+        Number of classes used in the multi-otsu thresholding. The default is 3.
+    otsu_thres : int, optional
+        Indicate which class threshold value of the multi-otsu thresholding
+        is used to create the segmentation mask. The default is 1.
+    otsu_bins : int, optional
+        Maximum number of histogram bins of the multi-otsu thresholding (see
+        multi_otsu). The default is None, which gives the thresholds of
+        skimage.filters.threshold_multiotsu.
+    window : tuple of int, optional
+        The first column and the column after the last column of the image
+        which contain the shaft, see shaft_window. The default is None, in
+        which case the full image width is used.
+    chunk_rows : int, optional
+        Number of rows processed at once. The default is 256.
+
+    Returns
+    -------
+    sa_slope : float
+        The slope of the shaft axis.
+    sa_intercept : float
+        The intercept of the shaft axis.
+    """
+    img = as_image(img)
+
+    tm_cut = round(p_TMI[1])
+    n_rows = np.size(img, axis=0)-tm_cut
+    if n_rows <= 0.5*radius:
+        print("The shaft axis could not be determined for {}, too little of the shaft was depicted on the radiograph.".format(name))
+        return 'NaN', 'NaN'
+    if n_rows < radius:
+        print("Please note that the shaft angle for {} is determined on only a small part of the shaft".format(name))
+    if window is None:
+        window = (0, np.size(img, axis=1))
+    cols = slice(window[0], window[1])
+    width = window[1]-window[0]
+
+    with instrumentation.stage('threshold_multiotsu'):
+        counts, centers = stream_crop_histogram(img, slice(tm_cut, None), cols, otsu_bins,
+                                                chunk_rows)
+        thres = histogram_thresholds(counts, centers, otsu_levels,
+                                     otsu_bins is None)[otsu_thres]
+
+    stats = MidpointStats(width, tm_cut, window[0])
+    # Edges of the rows buf_start up to the processed rows, and the next row
+    # of which the midpoint is determined
+    first = np.zeros(0, dtype=np.int64)
+    last = np.zeros(0, dtype=np.int64)
+    buf_start = 0
+    next_row = 0
+    for r0 in range(0, n_rows, chunk_rows):
+        r1 = min(r0+chunk_rows, n_rows)
+        # Threshold and close the chunk with a halo of rows
+        h0 = max(r0-HALO, 0)
+        h1 = min(r1+HALO, n_rows)
+        mask_otsu = np.asarray(img[tm_cut+h0:tm_cut+h1, cols]) > thres
+        with instrumentation.stage('closing'):
+            masked_img = morphology.closing(mask_otsu, morphology.square(5))[r0-h0:r1-h0]
+        indices_first, indices_last = shaft_edges(masked_img)
+        first = np.concatenate((first, np.asarray(indices_first, dtype=np.int64)))
+        last = np.concatenate((last, np.asarray(indices_last, dtype=np.int64)))
+
+        # The midpoint of a row is determined once the rows within the
+        # distance to the medial point of the same row have been processed
+        rows = np.arange(next_row, r1)
+        dist = np.abs(first[rows-buf_start] - last[rows-buf_start])
+        if r1 == n_rows:
+            stop = r1
+        else:
+            ready = rows + dist < r1
+            stop = next_row + (len(rows) if ready.all() else int(np.argmin(ready)))
+        if stop > next_row:
+            rows = rows[:stop-next_row]
+            dist = dist[:stop-next_row]
+            lo = max(int(np.min(rows-dist)), buf_start)
+            hi = min(int(np.max(rows+dist))+1, r1)
+            pts_l = np.column_stack((first[rows-buf_start], rows))
+            pts_m = np.column_stack((last[lo-buf_start:hi-buf_start], np.arange(lo, hi)))
+            p_m = closest_points(pts_l, pts_m)
+            stats.add(pts_l[:,0]+p_m[:,0], pts_l[:,1]+p_m[:,1])
+            next_row = stop
+
+        # Keep the edges which can still contain a closest medial point
+        keep_from = r1 - width
+        if next_row < r1:
+            rows = np.arange(next_row, r1)
+            keep_from = min(keep_from, int(np.min(rows - np.abs(first[rows-buf_start] - last[rows-buf_start]))))
+        keep_from = max(keep_from, buf_start)
+        first = first[keep_from-buf_start:]
+        last = last[keep_from-buf_start:]
+        buf_start = keep_from
+
+    sa_slope, sa_intercept = stats.fit()
+    if sa_slope == 'NaN':
+        print("The shaft axis could not be determined for {}, no shaft was segmented.".format(name))
+    return sa_slope, sa_intercept
@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Fri Oct 23 16:40:12 2026
+
+Landmark-guided column window of the shaft crop. Instead of the full image
+width below the minor trochanter, only the columns around the femoral shaft
+are thresholded, closed and scanned. The window is bounded with the
+inferior point of the minor trochanter (TMI), which lies at the medial side
+of the shaft, and the radius of the best-fitting circle around the femoral
+head as a measure of the size of the femur:
+    - lateral bound: lateral x radius lateral of TMI
+    - medial bound: medial x radius medial of TMI, but not beyond the most
+      caudal point of the ischium (IC) if given
+Both bounds are widened with the depth of the crop times tan(tilt), so a
+tilted shaft stays within the window. This keeps the other leg, the
+ischium and most of the background out of the multi-otsu histogram. The
+window is opt-in (shaft_window=True in measure_hip), since it changes the
+NSA and can cut off the cortex of a wide or displaced shaft.
+
+@author: Fleur Boel, f.boel@erasmusmc.nl
+"""
+
+import numpy as np
+
+
+def plan_shaft_window(shape, p_TMI, radius, hip_side_right=True, p_IC=None, lateral=2.0,
+                      medial=0.5, tilt=5):
+    """
+    This function determines the columns of the image which contain the
+    femoral shaft below the minor trochanter.
+
+    Parameters
+    ----------
+    shape : tuple
+        Shape of the image (rows, columns).
+    p_TMI : array of float
+        The x- and y-coordinates of the inferior point of the minor
+        trochanter, 1D array.
+    radius : float
+        The radius of the best-fitting circle around the femoral head.
+    hip_side_right : boolean, optional
+        Indicates for which hip side the window is determined, the value is
+        True for the right hip (lateral is on the left of the image). The
+        default is True.
+    p_IC : array of float, optional
+        The x- and y-coordinates of the most caudal point of the ischium,
+        which bounds the window medially. The default is None.
+    lateral : float, optional
+        Extent of the window lateral of TMI in radii. The default is 2.0.
+    medial : float, optional
+        Extent of the window medial of TMI in radii. The default is 0.5.
+    tilt : float, optional
+        Maximum angle of the shaft with the vertical in degrees. The default
+        is 5.
+
+    Returns
+    -------
+    window : tuple of int
+        The first column and the column after the last column of the window.
+        The full width (0, shape[1]) if the window could not be determined.
+
+    """
+    if radius == 'NaN' or not np.isfinite(radius) or radius <= 0:
+        return (0, shape[1])
+    depth = max(shape[0] - round(p_TMI[1]), 0)
+    margin = depth*np.tan(np.radians(tilt))
+    if hip_side_right is True:
+        x0 = p_TMI[0] - lateral*radius - margin
+        x1 = p_TMI[0] + medial*radius + margin
+        if p_IC is not None:
+            x1 = min(x1, p_IC[0])
+    else:
+        x0 = p_TMI[0] - medial*radius - margin
+        x1 = p_TMI[0] + lateral*radius + margin
+        if p_IC is not None:
+            x0 = max(x0, p_IC[0])
+    x0 = int(np.clip(np.floor(x0), 0, shape[1]))
+    x1 = int(np.clip(np.ceil(x1), 0, shape[1]))
+    if x1 - x0 < 2:
+        return (0, shape[1])
+    return (x0, x1)
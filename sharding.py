@@ -0,0 +1,340 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Wed Oct 21 13:42:17 2026
+
+Sharded execution of a cohort on multiple machines with shared storage.
+The image list is partitioned deterministically by a hash of the image name,
+so the _L and _R points of an image always end up in the same shard. Each
+shard runs on its own and writes its own results store and a manifest with
+the images it is responsible for, and the statistics of its measures (see
+cohort_stats). The merge combines the shard stores into one ordered results
+store and verifies that no hip is missing or duplicated, and merges the
+statistics of the shards. Only files are used, there is no coordinator.
+
+Usage:
+    python sharding.py run imglist folder_pts folder_img modelfile results_folder n_shards shard_index [outputfolder]
+    python sharding.py merge results_folder merged_path
+
+@author: Fleur Boel, f.boel@erasmusmc.nl
+"""
+
+import os
+import sys
+import json
+import time
+import glob
+import hashlib
+from pathlib import Path
+from load_files import read_imglist
+from landmark_models import load_model_file
+from results_store import ResultsStore
+from async_pipeline import run_cohort
+from cohort_stats import merge_stats_files
+
+SIDES = ('R', 'L')
+STATS_SUFFIX = '.stats.json'
+
+
+def shard_of(name, n_shards):
+    """
+    This function returns the shard of an image. The shard only depends on
+    the image name, so it is the same on every machine and for every run.
+
+    Parameters
+    ----------
+    name : str
+        Name of the image.
+    n_shards : int
+        Number of shards.
+
+    Returns
+    -------
+    shard_index : int
+        Index of the shard, from 0 to n_shards-1.
+
+    """
+    digest = hashlib.sha1(name.encode('utf-8')).digest()
+    return int.from_bytes(digest[:8], 'big') % n_shards
+
+
+def shard_names(img_names, n_shards, shard_index):
+    """
+    This function returns the image names belonging to a shard. Duplicate
+    names (read_imglist lists each image for both points files) are removed.
+
+    Parameters
+    ----------
+    img_names : list
+        Names of the images of the whole cohort.
+    n_shards : int
+        Number of shards.
+    shard_index : int
+        Index of the shard, from 0 to n_shards-1.
+
+    Returns
+    -------
+    names : list
+        Names of the images of the shard, in the order of img_names.
+
+    """
+    if shard_index < 0 or shard_index >= n_shards:
+        raise ValueError('shard_index should be between 0 and {}'.format(n_shards-1))
+    return [name for name in dict.fromkeys(img_names)
+            if shard_of(name, n_shards) == shard_index]
+
+
+def cohort_digest(img_names):
+    """
+    This function returns a digest of the image names of a cohort, used to
+    check that all shards were made from the same image list.
+
+    """
+    names = sorted(dict.fromkeys(img_names))
+    return hashlib.sha1('\n'.join(names).encode('utf-8')).hexdigest()
+
+
+def shard_paths(results_folder, n_shards, shard_index):
+    """
+    This function returns the file paths of the results store and the
+    manifest of a shard.
+
+    """
+    stem = 'shard_{:04d}_of_{:04d}'.format(shard_index, n_shards)
+    return (os.path.join(results_folder, stem+'.sqlite'),
+            os.path.join(results_folder, stem+'.json'))
+
+
+def stats_path(filepath):
+    """
+    This function returns the file path of the cohort statistics which belong
+    to a results store.
+
+    """
+    return os.path.splitext(filepath)[0] + STATS_SUFFIX
+
+
+def _write_manifest(filepath, manifest):
+    # Write to a temporary file first, so other machines never read a
+    # partially written manifest
+    tmp = '{}.{}.tmp'.format(filepath, os.getpid())
+    with open(tmp, 'w') as fw:
+        json.dump(manifest, fw, indent=1)
+    os.replace(tmp, filepath)
+
+
+def run_shard(img_names, folder_img, folder_pts, model, results_folder, n_shards,
+              shard_index, outputfolder=None, **kwargs):
+    """
+    This function measures the images of one shard with the asyncio pipeline,
+    see run_cohort. The results are written to the results store of the
+    shard, and the manifest of the shard is marked complete when all images
+    are processed. The statistics of the shard are written next to its
+    results store, see stats_path. A shard which is run again measures all
+    its images again and replaces their records in the same store.
+
+    Parameters
+    ----------
+    img_names : list
+        Names of the images of the whole cohort.
+    folder_img : WindowsPath
+        Folder containing the images.
+    folder_pts : WindowsPath
+        Folder containing the points files.
+    model : LandmarkModel
+        The landmark model of the points.
+    results_folder : WindowsPath
+        Shared folder where the results stores and manifests of the shards
+        are written.
+    n_shards : int
+        Number of shards.
+    shard_index : int
+        Index of the shard, from 0 to n_shards-1.
+    outputfolder : WindowsPath, optional
+        Folder where the plots are saved. The default is None.
+    **kwargs
+        Further keyword arguments passed to run_pipeline.
+
+    Returns
+    -------
+    n_scans : int
+        Number of processed scans.
+
+    """
+    names = shard_names(img_names, n_shards, shard_index)
+    os.makedirs(results_folder, exist_ok=True)
+    store_path, manifest_path = shard_paths(results_folder, n_shards, shard_index)
+    manifest = {'n_shards': n_shards, 'shard_index': shard_index,
+                'cohort': cohort_digest(img_names), 'results': os.path.basename(store_path),
+                'images': names, 'complete': False, 'started': time.time()}
+    _write_manifest(manifest_path, manifest)
+
+    n_scans = run_cohort(names, folder_img, folder_pts, model, store_path, outputfolder,
+                         stats_path=stats_path(store_path), **kwargs)
+
+    manifest['complete'] = True
+    manifest['finished'] = time.time()
+    _write_manifest(manifest_path, manifest)
+
+    return n_scans
+
+
+def _collect_shards(results_folder):
+    # Read the manifests and records of all shards and check them
+    manifests = []
+    for filepath in sorted(glob.glob(os.path.join(results_folder, 'shard_*_of_*.json'))):
+        if filepath.endswith(STATS_SUFFIX):
+            continue
+        with open(filepath, 'r') as fr:
+            manifests.append(json.load(fr))
+    if len(manifests) == 0:
+        raise ValueError('No shard manifests found in {}'.format(results_folder))
+
+    # Check the set of shards
+    problems = []
+    n_shards = manifests[0]['n_shards']
+    cohorts = set(m['cohort'] for m in manifests)
+    if any(m['n_shards'] != n_shards for m in manifests):
+        problems.append('shards were made with different numbers of shards')
+    if len(cohorts) > 1:
+        problems.append('shards were made from different image lists')
+    found = set(m['shard_index'] for m in manifests)
+    for i in range(n_shards):
+        if i not in found:
+            problems.append('manifest of shard {} is missing'.format(i))
+    for m in manifests:
+        if m['complete'] is not True:
+            problems.append('shard {} is not complete'.format(m['shard_index']))
+
+    # Collect the records of all shards and check every hip
+    expected = set()
+    for m in manifests:
+        for name in m['images']:
+            if shard_of(name, m['n_shards']) != m['shard_index']:
+                problems.append('{} is listed in the wrong shard'.format(name))
+            expected.update((name, side) for side in SIDES)
+    records = {}
+    duplicate = set()
+    for m in manifests:
+        store_path = os.path.join(results_folder, m['results'])
+        if not os.path.exists(store_path):
+            problems.append('results of shard {} are missing'.format(m['shard_index']))
+            continue
+        with ResultsStore(store_path) as store:
+            fingerprints = store.fingerprints()
+            for record in store.records():
+                key = (record['image'], record['side'])
+                if key in records:
+                    duplicate.add(key)
+                record['fingerprint'] = fingerprints.get(key)
+                records[key] = record
+    missing = sorted(expected - set(records))
+    unexpected = sorted(set(records) - expected)
+    duplicate = sorted(duplicate)
+
+    report = {'n_shards': n_shards, 'n_records': len(records), 'missing': missing,
+              'duplicate': duplicate, 'unexpected': unexpected, 'problems': problems}
+    return report, records
+
+
+def _is_valid(report):
+    return all(len(report[key]) == 0 for key in
+               ('problems', 'missing', 'duplicate', 'unexpected'))
+
+
+def verify_shards(results_folder):
+    """
+    This function verifies that the manifests of all shards are present and
+    complete and were made from the same image list, and that every hip of
+    the cohort is found in exactly one shard store.
+
+    Parameters
+    ----------
+    results_folder : WindowsPath
+        Folder containing the results stores and manifests of the shards.
+
+    Returns
+    -------
+    report : dict
+        Dictionary with the number of shards, the number of found records,
+        the missing, duplicate and unexpected hips as (image, side) tuples,
+        and a list of problems with the shards.
+
+    """
+    return _collect_shards(results_folder)[0]
+
+
+def merge_shards(results_folder, merged_path, strict=True):
+    """
+    This function merges the results stores of all shards into one results
+    store, ordered by image name and hip side. The shards are verified
+    first, see verify_shards. The statistics of the shards are merged and
+    written next to the merged results store, see stats_path.
+
+    Parameters
+    ----------
+    results_folder : WindowsPath
+        Folder containing the results stores and manifests of the shards.
+    merged_path : WindowsPath
+        File path of the merged results store. An existing file is replaced.
+    strict : boolean, optional
+        Indicates whether an incomplete or inconsistent set of shards raises
+        a ValueError. If False, all found records are merged. The default is
+        True.
+
+    Returns
+    -------
+    report : dict
+        The verification report, see verify_shards, with the file path of
+        the merged statistics ('stats', None if no shard statistics are
+        found).
+
+    """
+    report, records = _collect_shards(results_folder)
+    if strict is True and not _is_valid(report):
+        raise ValueError('Shards cannot be merged: {} problem(s), {} missing, {} duplicate '
+                         'and {} unexpected hip(s)'.format(
+                             len(report['problems']), len(report['missing']),
+                             len(report['duplicate']), len(report['unexpected'])))
+
+    if os.path.exists(merged_path):
+        os.remove(merged_path)
+    with ResultsStore(merged_path) as merged:
+        merged.put_many([records[key] for key in sorted(records)])
+
+    stats_files = sorted(glob.glob(os.path.join(results_folder, 'shard_*_of_*'+STATS_SUFFIX)))
+    stats = merge_stats_files(stats_files)
+    report['stats'] = None
+    if stats is not None:
+        report['stats'] = stats_path(merged_path)
+        stats.write_json(report['stats'])
+
+    return report
+
+
+if __name__ == '__main__':
+    if len(sys.argv) >= 9 and sys.argv[1] == 'run':
+        folder_pts = Path(sys.argv[3])
+        folder_img = Path(sys.argv[4])
+        pts_names, img_names = read_imglist(Path(sys.argv[2]), folder_pts, folder_img)
+        model = load_model_file(sys.argv[5])
+        n_scans = run_shard(img_names, folder_img, folder_pts, model, sys.argv[6],
+                            int(sys.argv[7]), int(sys.argv[8]),
+                            sys.argv[9] if len(sys.argv) > 9 else None)
+        print('Shard {} of {}: {} scans processed'.format(sys.argv[8], sys.argv[7], n_scans))
+    elif len(sys.argv) == 4 and sys.argv[1] == 'merge':
+        report = verify_shards(sys.argv[2])
+        for problem in report['problems']:
+            print(problem)
+        for key in ('missing', 'duplicate', 'unexpected'):
+            for name, side in report[key]:
+                print('{} hip: {} ({})'.format(key.capitalize(), name, side))
+        if not _is_valid(report):
+            print('Shards were not merged')
+            sys.exit(1)
+        report = merge_shards(sys.argv[2], sys.argv[3])
+        print('Merged {} hips from {} shards'.format(report['n_records'], report['n_shards']))
+        if report['stats'] is not None:
+            print('Cohort statistics written to {}'.format(report['stats']))
+    else:
+        print(__doc__)
+        sys.exit(2)
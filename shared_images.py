@@ -0,0 +1,245 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Mon Oct 19 14:10:33 2026
+
+Transport of decoded images to worker processes. An image is placed once in
+shared memory (or in a memory-mapped scratch file) and the workers receive a
+small handle instead of a pickled copy of the pixel array. The shaft axis
+and plot functions accept such a handle in place of the image.
+
+Lifetime: the process which placed the image releases it with
+release_image (or by closing the SharedImageStore), workers can detach
+early with detach_image. Attached images are cached per process, so an
+image used by the shaft axis and all plots of a hip is attached only once.
+
+@author: Fleur Boel, f.boel@erasmusmc.nl
+"""
+
+import os
+import uuid
+import tempfile
+import numpy as np
+from multiprocessing import shared_memory
+
+# Images attached in this process: handle key -> (shared memory, array)
+_attached = {}
+# Images placed by this process: handle key -> shared memory
+_owned = {}
+
+
+def _key(handle):
+    return handle['name'] if handle['kind'] == 'shm' else handle['path']
+
+
+def is_image_handle(img):
+    """
+    This function checks whether img is a handle of a shared image.
+
+    """
+    return isinstance(img, dict) and img.get('kind') in ('shm', 'memmap')
+
+
+def share_image(img, spacing=0, folder=None):
+    """
+    This function places an image in shared memory, or in a memory-mapped
+    scratch file if a folder is given, and returns its handle.
+
+    Parameters
+    ----------
+    img : array of float
+        Matrix containing the image pixel array.
+    spacing : float, optional
+        The pixel spacing of the image, stored in the handle. The default is 0.
+    folder : WindowsPath, optional
+        Folder for memory-mapped scratch files, e.g. on a local SSD. The
+        default is None, in which case shared memory is used.
+
+    Returns
+    -------
+    handle : dict
+        Handle of the shared image, which can be passed to worker processes.
+
+    """
+    img = np.asarray(img)
+    handle = {'shape': img.shape, 'dtype': img.dtype.str, 'spacing': spacing}
+
+    if folder is None:
+        shm = shared_memory.SharedMemory(create=True, size=max(img.nbytes, 1))
+        np.ndarray(img.shape, dtype=img.dtype, buffer=shm.buf)[...] = img
+        handle['kind'] = 'shm'
+        handle['name'] = shm.name
+        _owned[shm.name] = shm
+    else:
+        path = os.path.join(folder, 'img_{}.npy'.format(uuid.uuid4().hex))
+        mm = np.lib.format.open_memmap(path, mode='w+', dtype=img.dtype, shape=img.shape)
+        mm[...] = img
+        mm.flush()
+        del mm
+        handle['kind'] = 'memmap'
+        handle['path'] = path
+        _owned[path] = None
+
+    return handle
+
+
+def attach_image(handle):
+    """
+    This function returns the (read-only) pixel array of a shared image
+    without copying it. The attachment is cached in this process until
+    detach_image or release_image is called.
+
+    Parameters
+    ----------
+    handle : dict
+        Handle returned by share_image.
+
+    Returns
+    -------
+    img : array of float
+        Matrix containing the image pixel array.
+
+    """
+    key = _key(handle)
+    if key in _attached:
+        return _attached[key][1]
+
+    if handle['kind'] == 'shm':
+        shm = _owned.get(key) or shared_memory.SharedMemory(name=key)
+        img = np.ndarray(handle['shape'], dtype=np.dtype(handle['dtype']), buffer=shm.buf)
+    else:
+        shm = None
+        img = np.load(handle['path'], mmap_mode='r')
+    img.flags.writeable = False
+    _attached[key] = (shm, img)
+
+    return img
+
+
+def as_image(img):
+    """
+    This function returns the pixel array if img is the handle of a shared
+    image, otherwise img is returned unchanged.
+
+    """
+    if is_image_handle(img):
+        return attach_image(img)
+    return img
+
+
+def detach_image(handle):
+    """
+    This function removes the attachment of a shared image in this process.
+    Arrays obtained from attach_image should no longer be used afterwards.
+
+    Parameters
+    ----------
+    handle : dict
+        Handle returned by share_image.
+
+    """
+    key = _key(handle)
+    shm, img = _attached.pop(key, (None, None))
+    del img
+    # The owner keeps the shared memory open until it is released
+    if shm is not None and key not in _owned:
+        try:
+            shm.close()
+        except BufferError:
+            # The array is still referenced elsewhere, the memory is unmapped
+            # when the last reference is removed or the process exits
+            pass
+
+
+def detach_all():
+    """
+    This function removes all attachments of shared images in this process,
+    e.g. at the end of a worker task.
+
+    """
+    for key in list(_attached):
+        shm, img = _attached[key]
+        if shm is not None:
+            detach_image({'kind': 'shm', 'name': key})
+        else: detach_image({'kind': 'memmap', 'path': key})
+
+
+def release_image(handle):
+    """
+    This function frees a shared image. It should be called by the process
+    which placed the image, once all workers are done with it.
+
+    Parameters
+    ----------
+    handle : dict
+        Handle returned by share_image.
+
+    """
+    key = _key(handle)
+    detach_image(handle)
+    if key not in _owned:
+        return
+    shm = _owned.pop(key)
+    if handle['kind'] == 'shm':
+        try:
+            shm.close()
+        except BufferError:
+            pass
+        shm.unlink()
+    elif os.path.exists(key):
+        os.remove(key)
+
+
+class SharedImageStore:
+    """
+    Context manager which shares images and releases all images that are
+    still shared when the context is left.
+
+    Parameters
+    ----------
+    folder : WindowsPath, optional
+        Folder for memory-mapped scratch files. The default is None, in which
+        case shared memory is used. If folder is 'temp', a temporary
+        folder is created and removed again.
+    """
+
+    def __init__(self, folder=None):
+        self._tmpdir = None
+        if folder == 'temp':
+            self._tmpdir = tempfile.TemporaryDirectory(prefix='hip_images_')
+            folder = self._tmpdir.name
+        self.folder = folder
+        self.handles = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def put(self, img, spacing=0):
+        """
+        This function shares an image and returns its handle.
+
+        """
+        handle = share_image(img, spacing, self.folder)
+        self.handles[_key(handle)] = handle
+        return handle
+
+    def release(self, handle):
+        """
+        This function frees a single shared image.
+
+        """
+        self.handles.pop(_key(handle), None)
+        release_image(handle)
+
+    def close(self):
+        """
+        This function frees all images which are still shared.
+
+        """
+        for handle in list(self.handles.values()):
+            self.release(handle)
+        if self._tmpdir is not None:
+            self._tmpdir.cleanup()
+            self._tmpdir = None
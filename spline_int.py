@@ -6,7 +6,9 @@ Created on Tue Apr  4 09:06:06 2023
 """
 
 import numpy as np
-from scipy.interpolate import make_interp_spline
+from lazy_imports import lazy_import
+
+interpolate = lazy_import('scipy.interpolate')
 
 def spline_int(fhn_pts, df=1):
     """
@@ -43,6 +45,6 @@ def spline_int(fhn_pts, df=1):
     x_int = x_int[0:np.argmax(y_int)+1]
     
     # Create spline using y-values.
-    spl = make_interp_spline(y_int, x_int, k=df)
+    spl = interpolate.make_interp_spline(y_int, x_int, k=df)
     
     return spl, x_int, y_int
\ No newline at end of file
@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Mon Oct 19 16:12:40 2026
+
+Regression tests of incremental.py: a hip of which the NSA cannot be updated
+because the image cannot be read is measured again in the next run, and the
+cohort statistics of a rerun cover all records of the results store.
+
+@author: Fleur Boel, f.boel@erasmusmc.nl
+"""
+
+import os
+import sys
+from pathlib import Path
+import numpy as np
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+import matplotlib
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+from landmark_models import load_model_file
+from async_pipeline import run_cohort
+from incremental import run_incremental
+from results_store import ResultsStore
+from cohort_stats import read_stats
+
+# Index of the inferior point of the minor trochanter in the demo model
+TMI = 36
+
+
+def hip_points(hip_side_right, cx, cy=100., r=20.):
+    # Landmark points of the demo model (example_modelfile.txt) of one hip
+    s = -1 if hip_side_right is True else 1
+    pts = np.zeros((40, 2))
+    th = np.linspace(np.pi*0.9, np.pi*0.1, 12)
+    pts[:12] = np.c_[cx - s*r*np.cos(th), cy - r*np.sin(th)]
+    ys = np.linspace(cy+30, cy-r, 8)
+    xs = cx + s*np.r_[np.linspace(-r*1.3, -r*1.05, 4), -r*np.cos(np.linspace(0.9, np.pi/2, 4))]
+    pts[12:20] = np.c_[xs, ys]
+    pts[20:23] = np.c_[cx+s*np.array([9, 12, 15.]), cy+np.array([31, 28, 25.])]
+    pts[23:26] = np.c_[cx+s*np.array([-21, -18, -15.]), cy+np.array([38, 35, 32.])]
+    pts[30] = [cx+s*40, cy+60]
+    pts[31] = [cx+s*35, cy+50]
+    pts[32] = [cx+s*5, cy-22]
+    pts[33] = [cx-s*25, cy-24]
+    pts[34] = [cx+s*25, cy-5]
+    pts[35] = [cx+s*30, cy+15]
+    pts[TMI] = [cx+s*10, cy+70]
+    pts[37] = [cx+s*45, cy+65]
+    return pts
+
+
+def write_pts(filepath, pts):
+    with open(filepath, 'w') as fw:
+        fw.write('version: 1\nn_points: {}\n{{\n'.format(len(pts)))
+        for x, y in pts:
+            fw.write('{:.2f} {:.2f}\n'.format(x, y))
+        fw.write('}')
+
+
+def make_scans(tmp_path, names):
+    # Images with two femoral shafts below the minor trochanters and the
+    # points files of both hips
+    folder_img = tmp_path / 'img'
+    folder_pts = tmp_path / 'pts'
+    os.makedirs(folder_img)
+    os.makedirs(folder_pts)
+    img = np.full((300, 400), 0.1) + np.random.default_rng(0).random((300, 400))*0.05
+    for cx in (100, 300):
+        img[170:, cx-5:cx+5] = 0.9
+        img[170:, cx+5:cx+25] = 0.5
+        img[170:, cx+25:cx+35] = 0.9
+    for name in names:
+        plt.imsave(folder_img / name, img, cmap='gray')
+        write_pts(folder_pts / (name + '_L.pts'), hip_points(True, 100))
+        write_pts(folder_pts / (name + '_R.pts'), hip_points(False, 300))
+    return folder_img, folder_pts
+
+
+def test_nsa_retried_after_image_read_failure(tmp_path):
+    model = load_model_file(ROOT / 'example_modelfile.txt')
+    name = 'Image0.png'
+    folder_img, folder_pts = make_scans(tmp_path, [name])
+    pts_R = hip_points(True, 100)
+
+    results_path = tmp_path / 'results.sqlite'
+    run_cohort([name], folder_img, folder_pts, model, results_path, n_workers=1)
+    with ResultsStore(results_path) as store:
+        assert store.get(name, 'R')['status'] == 'ok'
+        nsa = store.get(name, 'R')['measures']['NSA']
+    assert nsa != 'NaN'
+
+    # Move the minor trochanter of the right hip and make the image unreadable
+    pts_R[TMI] += [2, 3]
+    write_pts(folder_pts / (name + '_L.pts'), pts_R)
+    os.rename(folder_img / name, tmp_path / name)
+
+    summary = run_incremental([name], folder_img, folder_pts, model, results_path)
+    assert summary['updated'] == 1
+    assert summary['measures']['NSA'] == 1
+    with ResultsStore(results_path) as store:
+        record = store.get(name, 'R')
+    assert record['status'] == 'failed'
+    assert record['measures']['NSA'] == 'NaN'
+
+    # The NSA is retried in the next run, not skipped as unchanged
+    summary = run_incremental([name], folder_img, folder_pts, model, results_path)
+    assert summary['measured'] == 1
+    assert summary['unchanged'] == 1
+    with ResultsStore(results_path) as store:
+        assert store.get(name, 'R')['status'] == 'failed'
+
+    # Once the image can be read, the NSA of the moved point is stored
+    os.rename(tmp_path / name, folder_img / name)
+    summary = run_incremental([name], folder_img, folder_pts, model, results_path)
+    assert summary['measured'] == 1
+    with ResultsStore(results_path) as store:
+        record = store.get(name, 'R')
+    assert record['status'] == 'ok'
+    assert record['measures']['NSA'] not in ('NaN', nsa)
+
+
+def test_stats_cover_the_whole_store_after_a_rerun(tmp_path):
+    model = load_model_file(ROOT / 'example_modelfile.txt')
+    names = ['Image{}.png'.format(k) for k in range(3)]
+    folder_img, folder_pts = make_scans(tmp_path, names)
+    results_path = tmp_path / 'results.sqlite'
+    stats_path = tmp_path / 'results.stats.json'
+
+    run_cohort(names, folder_img, folder_pts, model, results_path, stats_path=stats_path,
+               n_workers=1)
+    assert read_stats(stats_path).summary()['status'] == {'ok': 6}
+
+    # A rerun of one scan keeps the statistics of the other scans
+    run_cohort(names[:1], folder_img, folder_pts, model, results_path, stats_path=stats_path,
+               n_workers=1)
+    summary = read_stats(stats_path).summary()
+    assert summary['status'] == {'ok': 6}
+    assert summary['ADR']['R']['n'] + summary['ADR']['R']['n_missing'] == 3
+
+    # An incremental update writes the statistics of the updated store
+    os.remove(folder_img / names[0])
+    pts_R = hip_points(True, 100)
+    pts_R[TMI] += [2, 3]
+    write_pts(folder_pts / (names[0] + '_L.pts'), pts_R)
+    run_incremental(names, folder_img, folder_pts, model, results_path, stats_path=stats_path)
+    assert read_stats(stats_path).summary()['status'] == {'ok': 5, 'failed': 1}
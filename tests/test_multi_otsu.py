@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Mon Oct 19 16:48:05 2026
+
+Tests of multi_otsu.py: by default the thresholds of a crop are the same as
+those of skimage.filters.threshold_multiotsu of the crop.
+
+@author: Fleur Boel, f.boel@erasmusmc.nl
+"""
+
+import sys
+from pathlib import Path
+import numpy as np
+import pytest
+from skimage import filters
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+from multi_otsu import crop_thresholds, stream_crop_histogram, histogram_thresholds
+
+ROWS = slice(60, None)
+COLS = slice(20, 180)
+
+
+def make_image(kind):
+    rng = np.random.default_rng(0)
+    if kind == 'uint8':
+        return rng.integers(0, 256, (300, 200)).astype(np.uint8)
+    if kind == 'uint16':
+        # Grey values above 255, skimage is slow for wide ranges with 4 classes
+        return rng.integers(1000, 1600, (300, 200)).astype(np.uint16)
+    return rng.normal(0, 1, (300, 200))
+
+
+@pytest.mark.parametrize('kind', ['uint8', 'uint16', 'float'])
+@pytest.mark.parametrize('classes', [2, 3, 4])
+def test_thresholds_match_skimage(kind, classes):
+    img = make_image(kind)
+    thres_skimage = filters.threshold_multiotsu(img[ROWS, COLS], classes)
+
+    thres = crop_thresholds(img, classes, ROWS, COLS)
+    np.testing.assert_array_equal(thres, thres_skimage)
+
+    counts, centers = stream_crop_histogram(img, ROWS, COLS, chunk_rows=64)
+    np.testing.assert_array_equal(histogram_thresholds(counts, centers, classes), thres_skimage)
+
+
+def test_coarse_bins_within_one_bin():
+    img = make_image('uint16')
+    thres_skimage = filters.threshold_multiotsu(img[ROWS, COLS], 3)
+    thres = crop_thresholds(img, 3, ROWS, COLS, nbins=256)
+    width = (1599 - 1000) / 256
+    assert np.all(np.abs(thres - thres_skimage) <= width)
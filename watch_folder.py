@@ -0,0 +1,225 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Wed Oct 21 15:26:50 2026
+
+Watch-folder daemon which measures new scans while BoneFinder writes the
+points files. The points and image folders are polled, or watched with
+inotify when the inotify_simple package is available. A scan is processed
+as soon as both its _L and _R points files (and its image) exist and have
+not changed for a short settle time, using worker processes which are
+started and warmed up once. A scan is measured again when its points files
+are rewritten.
+
+Usage: python watch_folder.py folder_pts folder_img modelfile results_path [outputfolder]
+
+@author: Fleur Boel, f.boel@erasmusmc.nl
+"""
+
+import os
+import sys
+import time
+import asyncio
+from pathlib import Path
+from landmark_models import load_model_file
+from results_store import ResultsStore
+from async_pipeline import run_pipeline, make_executor, warm_executor
+
+
+def _signature(filepath):
+    # Size and modification time of a file, None if it does not exist
+    try:
+        st = os.stat(filepath)
+    except OSError:
+        return None
+    return (st.st_size, st.st_mtime)
+
+
+def scan_folder(folder_pts, folder_img, load_images=True):
+    """
+    This function lists the scans for which both the _L and the _R points
+    file exist, as required by load_full_body_points, and the image if
+    images are loaded.
+
+    Parameters
+    ----------
+    folder_pts : WindowsPath
+        Folder containing the points files.
+    folder_img : WindowsPath
+        Folder containing the images.
+    load_images : boolean, optional
+        Indicates whether the image should exist as well. The default is True.
+
+    Returns
+    -------
+    scans : dict
+        Dictionary with the image name as key and the size and modification
+        time of its files as value.
+
+    """
+    names = set()
+    with os.scandir(folder_pts) as entries:
+        for entry in entries:
+            if entry.name.endswith('_L.pts'):
+                names.add(entry.name[:-6])
+
+    scans = {}
+    for name in names:
+        files = [os.path.join(folder_pts, name+'_L.pts'), os.path.join(folder_pts, name+'_R.pts')]
+        if load_images is True:
+            files.append(os.path.join(folder_img, name))
+        signature = tuple(_signature(f) for f in files)
+        if None not in signature:
+            scans[name] = signature
+    return scans
+
+
+def _open_inotify(folders):
+    # Watch the folders with inotify if the inotify_simple package is
+    # available, otherwise the folders are polled
+    try:
+        import inotify_simple
+    except ImportError:
+        return None
+    try:
+        notifier = inotify_simple.INotify()
+        mask = (inotify_simple.flags.CREATE | inotify_simple.flags.CLOSE_WRITE |
+                inotify_simple.flags.MOVED_TO)
+        for folder in set(str(f) for f in folders):
+            notifier.add_watch(folder, mask)
+    except OSError as e:
+        print('inotify not available, polling the folders instead: {}'.format(e))
+        return None
+    return notifier
+
+
+async def watch_folder(folder_img, folder_pts, model, results_path, outputfolder=None,
+                       poll_interval=0.5, settle_time=0.5, n_workers=None,
+                       load_images=True, use_inotify=True, hip_timeout=None,
+                       hip_memory_limit=None, on_result=None, stop=None, **options):
+    """
+    This function watches the points and image folders and measures each
+    new scan with the asyncio pipeline, see run_pipeline. The records are
+    written to the results store. Scans which are already in the results
+    store when the daemon starts are skipped, unless their points files
+    change.
+
+    Parameters
+    ----------
+    folder_img : WindowsPath
+        Folder containing the images.
+    folder_pts : WindowsPath
+        Folder containing the points files.
+    model : LandmarkModel
+        The landmark model of the points.
+    results_path : WindowsPath
+        File path of the results store.
+    outputfolder : WindowsPath, optional
+        Folder where the plots are saved. The default is None.
+    poll_interval : float, optional
+        Interval in seconds at which the folders are checked. With inotify
+        the folders are checked as soon as a file is written. The default
+        is 0.5.
+    settle_time : float, optional
+        Time in seconds the files of a scan should be unchanged before it is
+        processed, so files which are still being written are not read. The
+        default is 0.5.
+    n_workers : int, optional
+        Number of worker processes. The default is None (number of CPUs).
+    load_images : boolean, optional
+        Indicates whether images are loaded. The default is True.
+    use_inotify : boolean, optional
+        Indicates whether inotify is used when available. The default is True.
+    hip_timeout : float, optional
+        Wall-clock limit per hip in seconds, see run_pipeline. The default is None.
+    hip_memory_limit : int, optional
+        Memory limit per worker in bytes, see run_pipeline. The default is None.
+    on_result : function, optional
+        Function called with the image name, the records of both hips and the
+        latency in seconds (from the last write of the scan files to the
+        stored result). The default is None.
+    stop : asyncio.Event, optional
+        The daemon stops when this event is set. The default is None, in
+        which case it runs until it is cancelled.
+    **options
+        Further keyword arguments passed to run_pipeline.
+
+    Returns
+    -------
+    n_scans : int
+        Number of processed scans.
+
+    """
+    loop = asyncio.get_running_loop()
+    if n_workers is None:
+        n_workers = os.cpu_count() or 1
+    if stop is None:
+        stop = asyncio.Event()
+    executor = make_executor(n_workers, hip_timeout, hip_memory_limit)
+    notifier = None
+    if use_inotify is True:
+        notifier = _open_inotify([folder_pts, folder_img] if load_images else [folder_pts])
+    n_scans = 0
+
+    try:
+        # Start the workers and import the heavy modules before the first scan
+        await loop.run_in_executor(None, warm_executor, executor, n_workers)
+        with ResultsStore(results_path) as store:
+            stored = set(name for name, side in store.keys())
+            previous = None
+            processed = {}
+            while not stop.is_set():
+                current = await loop.run_in_executor(None, scan_folder, folder_pts,
+                                                     folder_img, load_images)
+                now = time.time()
+                if previous is None:
+                    # Skip the scans which were measured in an earlier run
+                    processed = {name: current[name] for name in stored if name in current}
+                    previous = {}
+                ready = [name for name, signature in current.items()
+                         if signature == previous.get(name) and
+                         processed.get(name) != signature and
+                         now - max(s[1] for s in signature) >= settle_time]
+                previous = current
+
+                if len(ready) > 0:
+                    await run_pipeline(ready, folder_img, folder_pts, model, store, outputfolder,
+                                       n_workers=n_workers, load_images=load_images,
+                                       executor=executor, **options)
+                    for name in ready:
+                        processed[name] = current[name]
+                        records = [store.get(name, side) for side in ('R', 'L')]
+                        latency = time.time() - max(s[1] for s in current[name])
+                        print('{}: {} ({:.2f} s)'.format(
+                            name, ', '.join('{} {}'.format(r['side'], r['status'])
+                                            for r in records if r is not None), latency))
+                        if on_result is not None:
+                            on_result(name, records, latency)
+                    n_scans += len(ready)
+                    continue
+
+                # Wait for new files
+                if notifier is not None:
+                    await loop.run_in_executor(None, notifier.read, int(poll_interval*1000))
+                else:
+                    try:
+                        await asyncio.wait_for(stop.wait(), poll_interval)
+                    except asyncio.TimeoutError:
+                        pass
+    finally:
+        if notifier is not None:
+            notifier.close()
+        executor.shutdown()
+
+    return n_scans
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 5:
+        print(__doc__)
+        sys.exit(2)
+    model = load_model_file(sys.argv[3])
+    try:
+        asyncio.run(watch_folder(Path(sys.argv[2]), Path(sys.argv[1]), model, sys.argv[4],
+                                 sys.argv[5] if len(sys.argv) > 5 else None))
+    except KeyboardInterrupt:
+        pass